@@ -0,0 +1,4 @@
+"""
+Package: benchmarks
+Performance measurements for the service, run with ``python -m benchmarks.<name>``
+"""
@@ -0,0 +1,95 @@
+"""
+Media Type Benchmark
+
+Compares JSON and MessagePack for product lists: the size of the body, the
+time to encode it as the service does and to decode it as a client does,
+and the rate of GET /products and POST /products/collect served by an
+in-process client in each media type.
+
+Usage:
+    python -m benchmarks.media --products 1000 --rounds 20
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+
+def timed(func, rounds: int) -> float:
+    """Returns the median seconds a call takes"""
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():  # pylint: disable=too-many-locals
+    """Prints body sizes, codec times and request rates of both media types"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--products", type=int, default=1000, help="products in each list")
+    parser.add_argument("--rounds", type=int, default=20, help="repetitions of each measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault("DATABASE_URI", f"sqlite:///{directory}/bench.db")
+        os.environ.setdefault("DATABASE_AUTO_CREATE", "true")
+        os.environ["LIST_CACHE_BYTES"] = "0"  # measure the encoding, not the cache
+        # pylint: disable=import-outside-toplevel
+        import msgpack
+        from service import app
+        from service.common import media
+        from service.models import db, Category, Product
+
+        app.config["RATE_LIMIT_PER_SECOND"] = 0
+        products = [
+            Product(
+                name=f"Product {i}",
+                description=f"Description of product {i}",
+                price=i + 0.99,
+                available=i % 7 != 0,
+                image_url=f"https://myimagehost.com/products/{i}.jpg",
+                category=Category.FOOD,
+            )
+            for i in range(args.products)
+        ]
+        with app.app_context():
+            db.session.add_all(products)
+            db.session.commit()
+            rows = [product.serialize() for product in products]
+        client = app.test_client()
+        url = f"/products?limit={args.products}"
+        new_rows = [{**row, "id": None} for row in rows[:100]]
+
+        print(f"{f'{args.products} products':<18}{'JSON':>12}{'MessagePack':>14}{'ratio':>8}")
+        results = {}
+        for media_type in (media.JSON, media.MSGPACK):
+            with app.test_request_context():
+                body = media.encode(rows, media_type)
+                encode = timed(lambda mt=media_type: media.encode(rows, mt), args.rounds)
+            loads = msgpack.unpackb if media_type == media.MSGPACK else json.loads
+            decode = timed(lambda b=body, f=loads: f(b), args.rounds)
+            headers = {"Accept": media_type}
+            client.get(url, headers=headers)  # warm up
+            listing = timed(lambda h=headers: client.get(url, headers=h), args.rounds)
+            payload = msgpack.packb(new_rows) if media_type == media.MSGPACK else json.dumps(new_rows)
+            collect = timed(
+                lambda p=payload, mt=media_type: client.post(
+                    "/products/collect", data=p, content_type=mt, headers={"Accept": mt}
+                ),
+                args.rounds,
+            )
+            results[media_type] = (len(body) / 1024, encode * 1000, decode * 1000, 1 / listing, 1 / collect)
+
+        labels = ("body KiB", "encode ms", "decode ms", "GET req/s", "collect req/s")
+        for index, label in enumerate(labels):
+            json_value = results[media.JSON][index]
+            msgpack_value = results[media.MSGPACK][index]
+            print(f"{label:<18}{json_value:>12.2f}{msgpack_value:>14.2f}{msgpack_value / json_value:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
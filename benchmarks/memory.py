@@ -0,0 +1,117 @@
+"""
+Memory Benchmark
+
+Starts gunicorn with and without preload_app, warms every worker with a
+few requests and reports how much memory each worker really costs. RSS
+counts shared pages once per process, so the figures that matter are
+USS (pages only that worker holds) and PSS (shared pages split between
+the processes sharing them). Reads /proc, so it only runs on Linux.
+
+Usage:
+    python -m benchmarks.memory --workers 4
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+FIELDS = ("Rss", "Pss", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid: int) -> dict:
+    """Returns the RSS, PSS and USS of a process in MiB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as file:
+        for line in file:
+            name, _, rest = line.partition(":")
+            if name in FIELDS:
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "uss": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def children(pid: int) -> list:
+    """Returns the ids of the direct child processes of a process"""
+    with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    """Polls the health check until the server answers"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def measure(preload: bool, workers: int, port: int, requests: int) -> dict:
+    """Runs gunicorn once and returns the memory of its master and workers"""
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD=str(preload).lower(),
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(port),
+    )
+    with subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--log-level=warning", "service:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    ) as server:
+        try:
+            base = f"http://127.0.0.1:{port}"
+            wait_until_up(base + "/health")
+            while len(children(server.pid)) < workers:
+                time.sleep(0.2)
+            for _ in range(requests):  # spread over the workers by the kernel
+                for path in ("/health", "/products", "/products/facets"):
+                    with urllib.request.urlopen(base + path, timeout=5) as response:
+                        response.read()
+            return {
+                "master": read_memory(server.pid),
+                "workers": [read_memory(pid) for pid in children(server.pid)],
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    """Prints the memory used per worker with and without preload"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--port", type=int, default=8731, help="port to listen on")
+    parser.add_argument("--requests", type=int, default=50, help="warm-up rounds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # use a throwaway database unless one is configured
+        os.environ.setdefault("DATABASE_URI", f"sqlite:///{directory}/bench.db")
+        os.environ.setdefault("DATABASE_AUTO_CREATE", "true")
+        print(f"{'mode':<12}{'worker USS':>12}{'worker PSS':>12}{'worker RSS':>12}{'total PSS':>12}  (MiB)")
+        for preload in (False, True):
+            result = measure(preload, args.workers, args.port, args.requests)
+            workers = result["workers"]
+            total = result["master"]["pss"] + sum(worker["pss"] for worker in workers)
+            print(
+                f"{'preload' if preload else 'no preload':<12}"
+                f"{statistics.mean(worker['uss'] for worker in workers):>12.1f}"
+                f"{statistics.mean(worker['pss'] for worker in workers):>12.1f}"
+                f"{statistics.mean(worker['rss'] for worker in workers):>12.1f}"
+                f"{total:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Profiler Overhead Benchmark
+
+Measures how much the /admin/profile sampler slows a worker down. A thread
+keeps serving GET /products from an in-process client while the sampler
+runs beside it at several intervals, and the request rate is compared with
+a run without the sampler.
+
+Usage:
+    python -m benchmarks.profiler --seconds 3 --rounds 3
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def serve(client, seconds: float) -> float:
+    """Serves requests for a number of seconds and returns the rate"""
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        client.get("/products")
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def measure(client, seconds: float, interval_ms=None) -> tuple:
+    """Returns the request rate and the sampler's own overhead estimate"""
+    # pylint: disable=import-outside-toplevel
+    from service.profiler import Sampler
+
+    if interval_ms is None:
+        return serve(client, seconds), 0.0
+    sampler = Sampler(interval=interval_ms / 1000)
+    thread = threading.Thread(target=sampler.run, args=(seconds,))
+    thread.start()
+    rate = serve(client, seconds)
+    thread.join()
+    return rate, sampler.overhead
+
+
+def main():
+    """Prints the request rate with and without the sampler"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--seconds", type=float, default=3, help="length of each run")
+    parser.add_argument("--rounds", type=int, default=3, help="runs of each mode")
+    parser.add_argument("--products", type=int, default=100, help="products in the catalog")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault("DATABASE_URI", f"sqlite:///{directory}/bench.db")
+        os.environ.setdefault("DATABASE_AUTO_CREATE", "true")
+        # pylint: disable=import-outside-toplevel
+        from service import app
+        from service.models import db, Category, Product
+
+        app.config["RATE_LIMIT_PER_SECOND"] = 0
+        with app.app_context():
+            db.session.add_all(
+                Product(name=f"Product {i}", price=i, available=True, category=Category.FOOD)
+                for i in range(args.products)
+            )
+            db.session.commit()
+        client = app.test_client()
+        serve(client, 1)  # warm up
+
+        # alternate the modes over several rounds and keep the median of each
+        modes = (None, 10, 5, 1)
+        results = {mode: [] for mode in modes}
+        for _ in range(args.rounds):
+            for mode in modes:
+                results[mode].append(measure(client, args.seconds, mode))
+        baseline = statistics.median(rate for rate, _ in results[None])
+        print(f"{'sampler':<16}{'req/s':>10}{'slowdown':>10}{'estimate':>10}")
+        print(f"{'off':<16}{baseline:>10.1f}")
+        for interval_ms in modes[1:]:
+            rate = statistics.median(rate for rate, _ in results[interval_ms])
+            overhead = statistics.median(overhead for _, overhead in results[interval_ms])
+            print(
+                f"{f'every {interval_ms} ms':<16}{rate:>10.1f}"
+                f"{(1 - rate / baseline) * 100:>9.1f}%{overhead * 100:>9.1f}%"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Startup Benchmark
+
+Measures how long a fresh worker process takes to import the service and
+answer its first request, which is what bounds how fast pods scale out and
+roll. Each run is a new interpreter so nothing is cached between runs.
+
+Usage:
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Runs in the child interpreter and prints its timings as JSON
+PROBE = """
+import json, time
+started = time.perf_counter()
+from service import app
+imported = time.perf_counter()
+response = app.test_client().get("/health")
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({"import": imported - started, "first_request": served - imported}))
+"""
+
+
+def measure(runs: int) -> dict:
+    """Returns the import and first request times of each run in milliseconds"""
+    timings = {"import": [], "first_request": []}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        for key, seconds in result.items():
+            timings[key].append(seconds * 1000)
+    return timings
+
+
+def main():
+    """Prints a summary of the startup timings"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=10, help="number of fresh processes")
+    args = parser.parse_args()
+    timings = measure(args.runs)
+    print(f"{'phase':<15}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for phase, values in timings.items():
+        print(f"{phase:<15}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
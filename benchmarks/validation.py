@@ -0,0 +1,121 @@
+"""
+Validation Benchmark
+
+Times the checks every write path runs on a Product body: the compiled
+PRODUCT_SCHEMA on one body and on a list of them, the same for an invalid
+body that reports all of its errors, and Product.deserialize, which also
+builds the ORM instance the single-product endpoints store. The baseline
+is the field by field deserialize the schema replaced, which stopped at
+the first bad field. Both are timed storing the values on a plain object,
+which leaves only the checks, and on a new Product with and without
+their tracing span, whose cost is the same for each and varies a lot
+from round to round.
+
+The rounds of every measurement are interleaved, so that a slow spell of
+the machine slows all of them alike.
+
+Usage:
+    python -m benchmarks.validation --rows 10000 --rounds 15
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+
+def per_row(funcs: dict, rows: int, rounds: int) -> dict:
+    """Returns the median microseconds per row of each call over rows rows
+    :param funcs: the calls to time by label, taking turns in every round
+    """
+    times = {label: [] for label in funcs}
+    for _ in range(rounds):
+        for label, func in funcs.items():
+            started = time.perf_counter()
+            func()
+            times[label].append(time.perf_counter() - started)
+    return {label: statistics.median(seconds) / rows * 1e6 for label, seconds in times.items()}
+
+
+def baseline_deserialize(product, data):
+    """The checks Product.deserialize made before PRODUCT_SCHEMA"""
+    # pylint: disable=import-outside-toplevel
+    from service.models import Category, DataValidationError, parse_price
+
+    try:
+        product.name = data["name"]
+        product.description = data["description"]
+        product.price = parse_price(data["price"])
+        if not isinstance(data["available"], bool):
+            raise DataValidationError("Invalid type for boolean [available]: " + str(type(data["available"])))
+        product.available = data["available"]
+        product.image_url = data["image_url"]
+        product.category = getattr(Category, data["category"])
+    except AttributeError as error:
+        raise DataValidationError("Invalid attribute: " + error.args[0]) from error
+    except KeyError as error:
+        raise DataValidationError("Invalid Product: missing " + error.args[0]) from error
+    except TypeError as error:
+        raise DataValidationError("Invalid Product: body of request contained bad or no data " + str(error)) from error
+    return product
+
+
+def main():
+    """Prints the microseconds each way of validating takes per row"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--rows", type=int, default=10000, help="bodies validated per round")
+    parser.add_argument("--rounds", type=int, default=15, help="repetitions of each measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault("DATABASE_URI", f"sqlite:///{directory}/bench.db")
+        # pylint: disable=import-outside-toplevel
+        from service.common import tracing
+        from service.models import DataValidationError, Product, PRODUCT_SCHEMA
+
+        body = {
+            "id": 1,
+            "name": "Pro Tool",
+            "description": "This is an amazing tool for all your needs!",
+            "price": 19.99,
+            "available": True,
+            "image_url": "https://myimagehost.com/products/1.jpg",
+            "category": "TOYS",
+        }
+        invalid = {**body, "name": None, "price": "cheap", "available": "yes", "category": "toys"}
+        rows = [body] * args.rows
+
+        def validate_each(data):
+            for _ in range(args.rows):
+                try:
+                    PRODUCT_SCHEMA.validate(data)
+                except DataValidationError:
+                    pass
+
+        def deserialize_each(deserialize, target=Product):
+            for _ in range(args.rows):
+                deserialize(target(), body)
+
+        results = per_row(
+            {
+                "validate": lambda: validate_each(body),
+                "validate_many": lambda: PRODUCT_SCHEMA.validate_many(rows),
+                "validate invalid": lambda: validate_each(invalid),
+                "baseline checks": lambda: deserialize_each(baseline_deserialize, SimpleNamespace),
+                "schema checks": lambda: deserialize_each(PRODUCT_SCHEMA.apply, SimpleNamespace),
+                "baseline untraced": lambda: deserialize_each(baseline_deserialize),
+                "deserialize untraced": lambda: deserialize_each(Product.deserialize.__wrapped__),
+                "baseline deserialize": lambda: deserialize_each(tracing.traced(baseline_deserialize)),
+                "deserialize": lambda: deserialize_each(Product.deserialize),
+            },
+            args.rows,
+            args.rounds,
+        )
+        print(f"{'per row':<24}{'us':>8}")
+        for label, micros in results.items():
+            print(f"{label:<24}{micros:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Gunicorn configuration
+
+Read automatically by gunicorn from the working directory. The bind
+address comes from PORT and the worker count from WEB_CONCURRENCY, which
+gunicorn honours by default.
+
+Each worker serves GUNICORN_THREADS requests at once, so that one thread
+can run /admin/profile while the others keep serving.
+
+Set GUNICORN_PRELOAD=false to import the app in each worker instead, for
+instance when using --reload during development.
+"""
+import os
+
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# More than one thread makes gunicorn use its threaded gthread workers
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Import the app once in the master and fork the workers from it
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ["true", "yes", "1"]
+
+
+def pre_fork(server, worker):  # pylint: disable=unused-argument
+    """Runs in the master before each worker is forked"""
+    if server.cfg.preload_app:
+        from service.common import worker_hooks  # pylint: disable=import-outside-toplevel
+
+        worker_hooks.before_fork()
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Runs in each worker right after it is forked"""
+    if server.cfg.preload_app:
+        from service.common import worker_hooks  # pylint: disable=import-outside-toplevel
+
+        worker_hooks.after_fork()
+
+
+def worker_exit(server, worker):  # pylint: disable=unused-argument
+    """Runs in each worker as it exits"""
+    from service.common import worker_hooks  # pylint: disable=import-outside-toplevel
+
+    worker_hooks.before_exit()
@@ -3,34 +3,65 @@ Package: service
 Package for the application models and service routes
 This module creates and configures the Flask app and sets up the logging
 and SQL database
+
+The app is built by create_app() without touching the database: engines
+connect on first use and the tables are made once with ``flask db-init``
+rather than by every worker as it boots.
 """
 import sys
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from service import config
-from service.common import log_handlers
+from service.common import deadlines, log_handlers, read_replicas, sharding, static_assets, throttling, tracing
+from service.models import db
+
+
+def create_app():
+    """Creates and configures the Flask application"""
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(config)
+    hops = flask_app.config["PROXY_FIX_HOPS"]
+    if hops:
+        # client addresses and external URLs come from the proxy's headers
+        flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    # Set up logging for production, first so that every request gets an id
+    log_handlers.init_logging(flask_app, "gunicorn.error")
+    tracing.init_tracing(flask_app)
+
+    # Engines are created here but don't connect until the first query
+    db.init_app(flask_app)
+    read_replicas.init_replicas(flask_app)
+    sharding.init_shards(flask_app)
+    throttling.init_throttling(flask_app)
+    deadlines.init_deadlines(flask_app)
+    static_assets.init_static_assets(flask_app)
 
-# Create Flask application
-app = Flask(__name__)
-app.config.from_object(config)
+    # The blueprints import modules of this package, so they load on first use
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from service import routes
+    from service.common import cli_commands, error_handlers
 
-# Dependencies require we import the routes AFTER the Flask app is created
-# pylint: disable=wrong-import-position, wrong-import-order, cyclic-import
-from service import routes, models  # noqa: E402, E261
-# pylint: disable=wrong-import-position
-from service.common import error_handlers, cli_commands  # noqa: F401, E402
+    flask_app.register_blueprint(routes.api)
+    flask_app.register_blueprint(error_handlers.errors)
+    flask_app.register_blueprint(cli_commands.commands)
 
-# Set up logging for production
-log_handlers.init_logging(app, "gunicorn.error")
+    if flask_app.config["DATABASE_AUTO_CREATE"]:
+        with flask_app.app_context():
+            try:
+                db.create_all()  # make our SQLAlchemy tables
+                sharding.create_all(db.metadata)
+            except Exception as error:  # pylint: disable=broad-except
+                flask_app.logger.critical("%s: Cannot continue", error)
+                # gunicorn requires exit code 4 to stop spawning workers when they die
+                sys.exit(4)
 
-app.logger.info(70 * "*")
-app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
-app.logger.info(70 * "*")
+    flask_app.logger.info(70 * "*")
+    flask_app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
+    flask_app.logger.info(70 * "*")
+    flask_app.logger.info("Service initialized!")
+    return flask_app
 
-try:
-    models.init_db(app)  # make our SQLAlchemy tables
-except Exception as error:  # pylint: disable=broad-except
-    app.logger.critical("%s: Cannot continue", error)
-    # gunicorn requires exit code 4 to stop spawning workers when they die
-    sys.exit(4)
 
-app.logger.info("Service initialized!")
+# The application gunicorn and the flask command serve
+app = create_app()
@@ -1,8 +1,46 @@
 """
 Flask CLI Command Extensions
 """
-from service import app
-from service.models import db
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint
+from flask import current_app as app  # Import Flask application
+from service.models import (
+    db, ArchivedProduct, Category, DataValidationError, Product, ProductChange, ProductFacet, ProductId, PRODUCT_SCHEMA
+)
+from service import seeding
+from service.common import sharding
+from service.import_jobs import iter_rows
+from service.snapshot import build_snapshot
+
+# Registered on the application by create_app(), the commands are not grouped
+commands = Blueprint("commands", __name__, cli_group=None)
+
+# Columns written by products-export and read back by products-import
+PRODUCT_COLUMNS = ("id", "name", "description", "price", "available", "image_url", "category")
+
+
+######################################################################
+# Command to create any missing tables
+# Usage:
+#   flask db-init
+######################################################################
+@commands.cli.command("db-init")
+def db_init():
+    """
+    Creates the tables that don't exist yet, on the shards too. Safe to run on every deploy.
+    """
+    db.create_all()
+    sharding.create_all(db.metadata)
+    db.session.commit()
+    click.echo("Database tables created")
 
 
 ######################################################################
@@ -10,12 +48,393 @@ from service.models import db
 # Usage:
 #   flask db-create
 ######################################################################
-@app.cli.command("db-create")
+@commands.cli.command("db-create")
 def db_create():
     """
     Recreates a local database. You probably should not use this on
     production. ;-)
     """
+    sharding.drop_all(db.metadata)
     db.drop_all()
     db.create_all()
+    sharding.create_all(db.metadata)
+    db.session.commit()
+
+
+######################################################################
+# Command to bring existing tables up to the current schema
+# Usage:
+#   flask db-upgrade
+######################################################################
+@commands.cli.command("db-upgrade")
+def db_upgrade():
+    """
+    Creates missing tables, converts a floating point price column to
+    NUMERIC(12, 2) and makes product names NOT NULL. Safe to run more than once.
+    """
+    db.create_all()
+    for model in (Product, ArchivedProduct):
+        _require_names(model.__tablename__)
+    table = Product.__tablename__
+    columns = {column["name"]: column for column in db.inspect(db.engine).get_columns(table)}
+    price_type = columns["price"]["type"]
+    if isinstance(price_type, db.Numeric) and not isinstance(price_type, db.Float):
+        click.echo("Product prices are already stored as decimals")
+    elif db.engine.dialect.name == "postgresql":
+        db.session.execute(
+            db.text(
+                f"ALTER TABLE {table} ALTER COLUMN price TYPE NUMERIC(12, 2) "
+                "USING round(price::numeric, 2)"
+            )
+        )
+        click.echo("Converted product prices to NUMERIC(12, 2)")
+    else:
+        click.echo(f"Product prices need no conversion on {db.engine.dialect.name}")
+    db.session.commit()
+
+
+def _require_names(table: str):
+    """Names the Products without one "" so that keyset pages can't skip them"""
+    columns = {column["name"]: column for column in db.inspect(db.engine).get_columns(table)}
+    if not columns.get("name", {}).get("nullable"):
+        return
+    result = db.session.execute(db.text(f"UPDATE {table} SET name = '' WHERE name IS NULL"))
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(db.text(f"ALTER TABLE {table} ALTER COLUMN name SET NOT NULL"))
+    db.session.commit()
+    click.echo(f"Named {result.rowcount} rows of {table} without a name")
+
+
+######################################################################
+# Command to recount the product facets
+# Usage:
+#   flask facets-rebuild
+######################################################################
+@commands.cli.command("facets-rebuild")
+def facets_rebuild():
+    """
+    Recounts the category and availability facets from the product table
+    """
+    ProductFacet.rebuild()
+    click.echo("Product facets rebuilt")
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def _format_from_path(path: str, fmt: str) -> str:
+    """Returns the explicit format or infers it from the file extension"""
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    raise click.UsageError(f"Cannot infer the format of {path}, use --format")
+
+
+def _progress(verb: str, count: int, started: float):
+    """Reports how many rows have been processed and how fast"""
+    elapsed = max(time.monotonic() - started, 1e-9)
+    click.echo(f"{verb} {count} rows ({count / elapsed:.0f} rows/s)", err=True)
+
+
+def _export_row(row) -> dict:
+    """Converts a table row into a dictionary of plain values"""
+    data = dict(row._mapping)  # pylint: disable=protected-access
+    if isinstance(data["category"], Category):
+        data["category"] = data["category"].name
+    if data["price"] is not None:
+        data["price"] = float(data["price"])
+    return data
+
+
+def _import_values(data: dict, keep_ids: bool) -> dict:
+    """Validates a Product dictionary and returns its column values"""
+    values = PRODUCT_SCHEMA.validate(data)
+    if keep_ids:
+        try:
+            values["id"] = int(data["id"])
+        except (KeyError, TypeError, ValueError) as error:
+            raise DataValidationError(f"Invalid Product: bad or missing id {error}") from error
+    return values
+
+
+def _copy_value(value) -> str:
+    """Encodes a value for PostgreSQL COPY text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, Category):
+        return value.name
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _bulk_insert(rows: list):
+    """Inserts a chunk of rows, each on its shard when the product table is sharded"""
+    shards = sharding.get_shards()
+    if shards is None:
+        _insert_rows(rows)
+    else:
+        new_rows = [values for values in rows if values.get("id") is None]
+        for values, product_id in zip(new_rows, ProductId.take(len(new_rows))):
+            values["id"] = product_id
+        for index, shard_rows in shards.partition(rows, "id").items():
+            _insert_rows(shard_rows, shards.engines[index])
     db.session.commit()
+
+
+def _insert_rows(rows: list, engine=None):
+    """Inserts rows with COPY on PostgreSQL or executemany elsewhere
+    :param engine: the shard to insert into, the primary if None
+    """
+    bind_arguments = {} if engine is None else {"bind": engine}
+    if (engine or db.engine).dialect.name == "postgresql":
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        for values in rows:
+            buffer.write("\t".join(_copy_value(values[column]) for column in columns))
+            buffer.write("\n")
+        buffer.seek(0)
+        cursor = db.session.connection(bind_arguments=bind_arguments).connection.cursor()
+        cursor.copy_expert(
+            f"COPY {Product.__tablename__} ({', '.join(columns)}) FROM STDIN", buffer
+        )
+    else:
+        db.session.execute(db.insert(Product.__table__), rows, bind_arguments=bind_arguments)
+
+
+@contextmanager
+def _indexes_deferred(table):
+    """Drops the indexes of a table and builds them again afterwards
+
+    Building an index once over all the rows is much faster than keeping it
+    up to date through a large load.
+    """
+    indexes = list(table.indexes)
+    for index in indexes:
+        index.drop(db.session.connection(), checkfirst=True)
+    db.session.commit()
+    try:
+        yield
+    finally:
+        db.session.rollback()  # of a failed chunk
+        for index in indexes:
+            index.create(db.session.connection(), checkfirst=True)
+        db.session.commit()
+
+
+def _reset_id_sequence():
+    """Moves the PostgreSQL id sequence, or the sharded ids, past any imported ids"""
+    if sharding.get_shards() is not None:
+        # pylint: disable=not-callable
+        statement = db.select(db.func.max(Product.__table__.c.id))
+        ProductId.advance(max(result.scalar() or 0 for result in sharding.execute_each(db.session, statement)))
+        db.session.commit()
+        return
+    if db.engine.dialect.name != "postgresql":
+        return
+    table = Product.__tablename__
+    db.session.execute(
+        db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE(MAX(id), 1)) FROM {table}"
+        )
+    )
+    db.session.commit()
+
+
+######################################################################
+# Command to stream all Products to a file
+# Usage:
+#   flask products-export products.csv
+######################################################################
+@commands.cli.command("products-export")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Defaults to the file extension")
+@click.option("--chunk-size", default=10000, show_default=True, help="Rows fetched per round trip")
+def products_export(path, fmt, chunk_size):
+    """
+    Streams every Product, archived ones too, to a CSV or NDJSON file using a server-side cursor
+    """
+    fmt = _format_from_path(path, fmt)
+    count = 0
+    started = time.monotonic()
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if fmt == "csv":
+            writer = csv.DictWriter(file, fieldnames=PRODUCT_COLUMNS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(data):
+                file.write(json.dumps(data) + "\n")
+        for table in (Product.__table__, ArchivedProduct.__table__):
+            columns = [table.c[column] for column in PRODUCT_COLUMNS]
+            statement = db.select(*columns).order_by(table.c.id).execution_options(yield_per=chunk_size)
+            if table is Product.__table__ and sharding.get_shards() is not None:
+                results = sharding.execute_each(db.session, statement)  # one shard after the other
+            else:
+                results = [db.session.execute(statement)]
+            for partition in itertools.chain.from_iterable(result.partitions() for result in results):
+                for row in partition:
+                    write(_export_row(row))
+                count += len(partition)
+                _progress("Exported", count, started)
+    db.session.commit()
+    click.echo(f"Exported {count} products to {path}")
+
+
+######################################################################
+# Command to bulk load Products from a file
+# Usage:
+#   flask products-import products.csv
+######################################################################
+@commands.cli.command("products-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Defaults to the file extension")
+@click.option("--chunk-size", default=10000, show_default=True, help="Rows inserted per transaction")
+@click.option("--keep-ids", is_flag=True, help="Keep the ids in the file instead of assigning new ones")
+def products_import(path, fmt, chunk_size, keep_ids):
+    """
+    Streams Products from a CSV or NDJSON file into the database in chunks
+    """
+    fmt = _format_from_path(path, fmt)
+    chunk = []
+    count = 0
+    failed = 0
+    started = time.monotonic()
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        try:
+            for index, data in enumerate(iter_rows(file, fmt)):
+                try:
+                    chunk.append(_import_values(data, keep_ids))
+                except DataValidationError as error:
+                    failed += 1
+                    click.echo(f"Skipping row {index}: {error}", err=True)
+                    continue
+                if len(chunk) >= chunk_size:
+                    _bulk_insert(chunk)
+                    count += len(chunk)
+                    chunk = []
+                    _progress("Imported", count, started)
+        except ValueError as error:
+            raise click.ClickException(f"Unable to parse {path}: {error}") from error
+    if chunk:
+        _bulk_insert(chunk)
+        count += len(chunk)
+        _progress("Imported", count, started)
+    if keep_ids:
+        _reset_id_sequence()
+    # COPY and executemany bypass the ORM flush hooks
+    ProductFacet.rebuild()
+    ProductChange.record_resync()
+    click.echo(f"Imported {count} products from {path}, skipped {failed}")
+
+
+######################################################################
+# Command to fill the catalog with synthetic Products
+# Usage:
+#   flask products-seed --count 1000000 --seed 42
+######################################################################
+@commands.cli.command("products-seed")
+@click.option("--count", default=1000, show_default=True, help="Products to generate")
+@click.option("--seed", default=0, show_default=True, help="Seed of the random generator")
+@click.option("--skew", default=0.0, show_default=True, help="Popularity skew of categories and names, 0 for none")
+@click.option("--chunk-size", default=10000, show_default=True, help="Rows generated and inserted per transaction")
+@click.option(
+    "--defer-indexes/--keep-indexes",
+    default=True,
+    show_default=True,
+    help="Drop the product indexes during the load and build them afterwards",
+)
+def products_seed(count, seed, skew, chunk_size, defer_indexes):
+    """
+    Adds deterministic synthetic Products, generated and inserted in batches
+    """
+    if count < 0 or skew < 0 or chunk_size < 1:
+        raise click.UsageError("--count and --skew can't be negative and --chunk-size must be positive")
+    inserted = 0
+    started = time.monotonic()
+    # the indexes of the shards are kept, the product table of the primary stays empty
+    defer_indexes = defer_indexes and sharding.get_shards() is None
+    with _indexes_deferred(Product.__table__) if defer_indexes else nullcontext():
+        for rows in seeding.generate(count, seed, skew, chunk_size):
+            _bulk_insert(rows)
+            inserted += len(rows)
+            _progress("Seeded", inserted, started)
+    # COPY and executemany bypass the ORM flush hooks
+    ProductFacet.rebuild()
+    ProductChange.record_resync()
+    click.echo(f"Seeded {inserted} products in {time.monotonic() - started:.1f}s")
+
+
+######################################################################
+# Command to move long unavailable Products to the archive
+# Usage:
+#   flask products-archive --days 90
+######################################################################
+@commands.cli.command("products-archive")
+@click.option("--days", default=90, show_default=True, help="Archive products unavailable and unchanged for DAYS days")
+@click.option("--chunk-size", default=10000, show_default=True, help="Products moved per transaction")
+def products_archive(days, chunk_size):
+    """
+    Moves unavailable Products that haven't changed lately out of the product table
+    """
+    if days < 0 or chunk_size < 1:
+        raise click.UsageError("--days can't be negative and --chunk-size must be positive")
+    if sharding.get_shards() is not None:
+        raise click.ClickException("Archiving is not supported while the product table is sharded")
+    before = datetime.utcnow() - timedelta(days=days)
+    archived = 0
+    started = time.monotonic()
+    while True:
+        moved = ArchivedProduct.archive(before, chunk_size)
+        if not moved:
+            break
+        archived += moved
+        _progress("Archived", archived, started)
+    ProductFacet.rebuild()
+    # the archived Products leave the listings without entries of their own
+    ProductChange.record_resync()
+    click.echo(f"Archived {archived} products")
+
+
+######################################################################
+# Command to write the read-only catalog snapshot
+# Usage:
+#   flask snapshot-build [PATH]
+######################################################################
+@commands.cli.command("snapshot-build")
+@click.argument("path", required=False, type=click.Path(dir_okay=False, writable=True))
+def snapshot_build(path):
+    """
+    Writes a memory-mappable snapshot of the catalog, replacing the old one atomically
+    """
+    path = path or app.config.get("CATALOG_SNAPSHOT_PATH")
+    if not path:
+        raise click.UsageError("Give a PATH or set CATALOG_SNAPSHOT_PATH")
+    count = build_snapshot(path)
+    click.echo(f"Wrote snapshot of {count} products to {path}")
+
+
+######################################################################
+# Command to trim the product change log
+# Usage:
+#   flask changes-prune --days 7
+######################################################################
+@commands.cli.command("changes-prune")
+@click.option("--days", default=7, show_default=True, help="Keep the changes of the last DAYS days")
+def changes_prune(days):
+    """
+    Deletes product change log entries older than the given number of days
+    """
+    count = ProductChange.prune(datetime.utcnow() - timedelta(days=days))
+    click.echo(f"Deleted {count} changes")
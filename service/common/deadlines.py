@@ -0,0 +1,79 @@
+"""
+Deadlines
+
+Gives every request a deadline, REQUEST_TIMEOUT seconds from when it
+starts unless ROUTE_TIMEOUTS sets another for its endpoint. Each database
+transaction the request opens on PostgreSQL gets a ``statement_timeout``
+of the time it has left, so the server cancels a runaway query instead of
+letting it hold a connection long after the client has gone. Queries
+started after the deadline are not sent at all.
+
+Either way the request ends with a DeadlineExceeded error, which is
+answered with 504 Gateway Timeout.
+"""
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+QUERY_CANCELED = "57014"  # PostgreSQL SQLSTATE for a cancelled statement
+
+
+class DeadlineExceeded(Exception):
+    """Used when a request runs past its deadline"""
+
+
+def init_deadlines(app):
+    """Starts the clock on every request"""
+    default = app.config.get("REQUEST_TIMEOUT", 0)
+    timeouts = app.config.get("ROUTE_TIMEOUTS", {})
+
+    @app.before_request
+    def _start_deadline():
+        timeout = timeouts.get(request.endpoint, default)
+        g.deadline = time.monotonic() + timeout if timeout else None
+
+
+def remaining():
+    """Returns the seconds the current request has left, or None without a deadline"""
+    if not has_request_context():
+        return None
+    deadline = g.get("deadline")
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _check_deadline() -> float:
+    """Returns the seconds left or raises DeadlineExceeded if there are none"""
+    seconds = remaining()
+    if seconds is not None and seconds <= 0:
+        raise DeadlineExceeded(f"Request to {request.path} ran out of time")
+    return seconds
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _refuse_late_queries(_orm_execute_state):
+    """Stops a request from starting queries after its deadline"""
+    _check_deadline()
+
+
+@event.listens_for(Session, "after_begin")
+def _limit_transaction(_session, _transaction, connection):
+    """Caps the statements of a new transaction at the time the request has left"""
+    seconds = _check_deadline()
+    if seconds is not None and connection.dialect.name == "postgresql":
+        # SET LOCAL only lasts until the transaction ends
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(int(seconds * 1000), 1)}")
+
+
+@event.listens_for(Engine, "handle_error")
+def _translate_cancel(context):
+    """Reports a statement cancelled by statement_timeout as DeadlineExceeded"""
+    if remaining() is None:
+        return
+    if getattr(context.original_exception, "pgcode", None) == QUERY_CANCELED:
+        raise DeadlineExceeded(
+            f"Request to {request.path} ran out of time, the query was cancelled"
+        ) from context.sqlalchemy_exception
@@ -17,22 +17,47 @@
 """
 Module: error_handlers
 """
-from flask import jsonify
+from flask import Blueprint, jsonify
+from flask import current_app as app  # Import Flask application
 from service.models import DataValidationError
-from service import app
+from service.common.deadlines import DeadlineExceeded
+from service.common.sharding import ShardingError
 from . import status
 
 
+# Registered on the application by create_app() to handle errors of every route
+errors = Blueprint("errors", __name__)
+
+
 ######################################################################
 # Error Handlers
 ######################################################################
-@app.errorhandler(DataValidationError)
+@errors.app_errorhandler(DataValidationError)
 def request_validation_error(error):
-    """Handles Value Errors from bad data"""
-    return bad_request(error)
+    """Handles Value Errors from bad data, listing the error of every field"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_400_BAD_REQUEST, error="Bad Request", message=message, errors=error.errors
+        ),
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
+@errors.app_errorhandler(DeadlineExceeded)
+def deadline_exceeded(error):
+    """Handles requests that ran out of time"""
+    return gateway_timeout(error)
+
 
+@errors.app_errorhandler(ShardingError)
+def sharding_error(error):
+    """Handles statements the shards can't run"""
+    return not_implemented(error)
 
-@app.errorhandler(status.HTTP_400_BAD_REQUEST)
+
+@errors.app_errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
     message = str(error)
@@ -45,7 +70,19 @@ def bad_request(error):
     )
 
 
-@app.errorhandler(status.HTTP_404_NOT_FOUND)
+@errors.app_errorhandler(status.HTTP_401_UNAUTHORIZED)
+def unauthorized(error):
+    """Handles missing or wrong credentials with 401_UNAUTHORIZED"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(status=status.HTTP_401_UNAUTHORIZED, error="Unauthorized", message=message),
+        status.HTTP_401_UNAUTHORIZED,
+        {"WWW-Authenticate": "Bearer"},
+    )
+
+
+@errors.app_errorhandler(status.HTTP_404_NOT_FOUND)
 def not_found(error):
     """Handles resources not found with 404_NOT_FOUND"""
     message = str(error)
@@ -56,7 +93,7 @@ def not_found(error):
     )
 
 
-@app.errorhandler(status.HTTP_405_METHOD_NOT_ALLOWED)
+@errors.app_errorhandler(status.HTTP_405_METHOD_NOT_ALLOWED)
 def method_not_supported(error):
     """Handles unsupported HTTP methods with 405_METHOD_NOT_SUPPORTED"""
     message = str(error)
@@ -71,7 +108,7 @@ def method_not_supported(error):
     )
 
 
-@app.errorhandler(status.HTTP_409_CONFLICT)
+@errors.app_errorhandler(status.HTTP_409_CONFLICT)
 def resource_conflict(error):
     """Handles resource conflicts with HTTP_409_CONFLICT"""
     message = str(error)
@@ -86,7 +123,7 @@ def resource_conflict(error):
     )
 
 
-@app.errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+@errors.app_errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 def mediatype_not_supported(error):
     """Handles unsupported media requests with 415_UNSUPPORTED_MEDIA_TYPE"""
     message = str(error)
@@ -101,7 +138,23 @@ def mediatype_not_supported(error):
     )
 
 
-@app.errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
+@errors.app_errorhandler(status.HTTP_429_TOO_MANY_REQUESTS)
+def too_many_requests(error):
+    """Handles clients over their rate limit with 429_TOO_MANY_REQUESTS"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            error="Too Many Requests",
+            message=message,
+        ),
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        _retry_after(error),
+    )
+
+
+@errors.app_errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
 def internal_server_error(error):
     """Handles unexpected server error with 500_SERVER_ERROR"""
     message = str(error)
@@ -114,3 +167,55 @@ def internal_server_error(error):
         ),
         status.HTTP_500_INTERNAL_SERVER_ERROR,
     )
+
+
+@errors.app_errorhandler(status.HTTP_501_NOT_IMPLEMENTED)
+def not_implemented(error):
+    """Handles features the server doesn't support with 501_NOT_IMPLEMENTED"""
+    message = str(error)
+    app.logger.error(message)
+    return (
+        jsonify(
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+            error="Not Implemented",
+            message=message,
+        ),
+        status.HTTP_501_NOT_IMPLEMENTED,
+    )
+
+
+@errors.app_errorhandler(status.HTTP_503_SERVICE_UNAVAILABLE)
+def service_unavailable(error):
+    """Handles shed load with 503_SERVICE_UNAVAILABLE"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            error="Service Unavailable",
+            message=message,
+        ),
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        _retry_after(error),
+    )
+
+
+@errors.app_errorhandler(status.HTTP_504_GATEWAY_TIMEOUT)
+def gateway_timeout(error):
+    """Handles requests past their deadline with 504_GATEWAY_TIMEOUT"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_504_GATEWAY_TIMEOUT,
+            error="Gateway Timeout",
+            message=message,
+        ),
+        status.HTTP_504_GATEWAY_TIMEOUT,
+    )
+
+
+def _retry_after(error) -> dict:
+    """Returns the Retry-After header of an error, if it has one"""
+    retry_after = getattr(error, "retry_after", None)
+    return {"Retry-After": str(retry_after)} if retry_after is not None else {}
@@ -19,8 +19,84 @@ Log Handlers
 
 This module contains utility functions to set up logging
 consistently
+
+Records are written as one JSON object per line carrying the request id,
+method and path of the request that logged them and the current trace and
+span ids. Loggers only put records on a queue and a background thread does
+the formatting and writing, so a slow log sink never holds up a request.
+Info records of busy routes can be sampled per request with
+LOG_SAMPLE_RATES, and every request ends with one summary line with its
+status and duration.
 """
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from service.common import tracing
+
+# Loggers of the modules that don't log through app.logger
+MODULE_LOGGERS = ("flask.app",)
+
+# Attributes every LogRecord has, anything else came in through extra=
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None  # pylint: disable=invalid-name
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single line JSON object"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestFilter(logging.Filter):
+    """Tags records with their request and trace, and drops info records of unsampled requests"""
+
+    def filter(self, record):
+        record.__dict__.update(tracing.current_ids())
+        if not has_request_context():
+            return True
+        if record.levelno <= logging.INFO and not g.get("log_sampled", True):
+            return False
+        record.request_id = g.get("request_id")
+        record.method = request.method
+        record.path = request.path
+        return True
+
+
+class RequestQueueHandler(QueueHandler):
+    """Queues records without turning their extra fields into strings"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 
 def init_logging(app, logger_name: str):
@@ -30,7 +106,77 @@ def init_logging(app, logger_name: str):
     app.logger.handlers = gunicorn_logger.handlers
     app.logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
+    if app.config.get("LOG_FORMAT", "json") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
     for handler in app.logger.handlers:
         handler.setFormatter(formatter)
+    if app.logger.handlers:
+        _queue_handlers(app, gunicorn_logger.level)
+    _init_request_logging(app)
     app.logger.info("Logging handler established")
+
+
+def _queue_handlers(app, level):
+    """Moves the real handlers behind a queue drained by a background thread"""
+    global _listener  # pylint: disable=global-statement, invalid-name
+    stop_listener()
+    handler = RequestQueueHandler(queue.SimpleQueue())
+    handler.addFilter(RequestFilter())
+    _listener = QueueListener(handler.queue, *app.logger.handlers, respect_handler_level=True)
+    for logger in (app.logger, *map(logging.getLogger, MODULE_LOGGERS)):
+        logger.handlers = [handler]
+        logger.setLevel(level)
+        logger.propagate = False
+    start_listener()
+
+
+def start_listener():
+    """Starts writing queued records, for instance in a newly forked worker"""
+    if _listener is not None and _listener._thread is None:  # pylint: disable=protected-access
+        _listener.start()
+
+
+def stop_listener():
+    """Writes out the queued records and stops the writer thread"""
+    if _listener is not None and _listener._thread is not None:  # pylint: disable=protected-access
+        _listener.stop()
+
+
+atexit.register(stop_listener)
+
+
+######################################################################
+#  R E Q U E S T   L O G G I N G
+######################################################################
+def _init_request_logging(app):
+    """Gives every request an id, a sampling decision and a summary line"""
+    sample_rates = app.config.get("LOG_SAMPLE_RATES", {})
+
+    @app.before_request
+    def _start_request_log():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        rate = sample_rates.get(request.endpoint, 1.0)
+        g.log_sampled = rate >= 1.0 or random.random() < rate
+
+    @app.after_request
+    def _finish_request_log(response):
+        started = g.get("request_started")
+        if started is None:  # the request failed before logging started
+            return response
+        response.headers["X-Request-ID"] = g.request_id
+        level = logging.ERROR if response.status_code >= 500 else logging.INFO
+        app.logger.log(
+            level,
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            },
+        )
+        return response
@@ -0,0 +1,61 @@
+"""
+Media Types
+
+Lets clients exchange Products as MessagePack as well as JSON. MessagePack
+bodies are smaller and much cheaper to encode and decode, which matters to
+the services that move large product lists through this API.
+
+Request bodies are decoded by their Content-Type and responses are encoded
+in the type the Accept header prefers, JSON when it names neither. Such
+responses carry ``Vary: Accept`` so caches keep the two apart. Errors are
+always JSON.
+"""
+import msgpack
+from flask import Response, abort, jsonify, request
+from service.common import status, tracing
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# the media type of each accepted name, older clients say application/x-msgpack
+MEDIA_TYPES = {JSON: JSON, MSGPACK: MSGPACK, "application/x-msgpack": MSGPACK}
+
+
+def content_type():
+    """Returns the media type of the request body, or None if it is unknown"""
+    return MEDIA_TYPES.get(request.mimetype)
+
+
+def request_data():
+    """Decodes the JSON or MessagePack body of the request"""
+    if content_type() == MSGPACK:
+        try:
+            return msgpack.unpackb(request.get_data(), raw=False)
+        except ValueError as error:
+            abort(status.HTTP_400_BAD_REQUEST, f"Invalid MessagePack body: {error}")
+    return request.get_json()
+
+
+def accepted() -> str:
+    """Returns the media type the response should be encoded in"""
+    return MEDIA_TYPES[request.accept_mimetypes.best_match(list(MEDIA_TYPES), default=JSON)]
+
+
+def encode(data, media_type: str) -> bytes:
+    """Encodes a response body in a media type"""
+    if media_type == MSGPACK:
+        with tracing.tracer.start_as_current_span("msgpack"):
+            return msgpack.packb(data)
+    return jsonify(data).get_data()
+
+
+def response(body: bytes, media_type: str, code: int = status.HTTP_200_OK, headers=None) -> Response:
+    """Returns an encoded body as a negotiated response"""
+    result = Response(body, status=code, mimetype=media_type, headers=headers)
+    result.vary.add("Accept")
+    return result
+
+
+def respond(data, code: int = status.HTTP_200_OK, headers=None) -> Response:
+    """Encodes data in the media type the client accepts"""
+    media_type = accepted()
+    return response(encode(data, media_type), media_type, code, headers)
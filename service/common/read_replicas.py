@@ -0,0 +1,114 @@
+"""
+Read Replicas
+
+Routes read-only ORM queries to optional replica databases. Model finders
+mark their queries with the ``replica`` execution option and this module
+sends them to the next healthy replica, round-robin. Everything else goes
+to the primary, as do all queries made while handling a write request or
+after the session has flushed a write, so callers always read their own
+writes. A replica that fails is ejected for a while and the query is
+retried on the primary.
+"""
+import itertools
+import logging
+import threading
+import time
+from flask import has_request_context, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("flask.app")
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_pool = None  # pylint: disable=invalid-name
+
+
+class ReplicaPool:
+    """Round-robin selection over replica engines with health-based ejection"""
+
+    def __init__(self, engines, eject_seconds: float = 30.0):
+        self.engines = list(engines)
+        self.eject_seconds = eject_seconds
+        self._ejected = {}  # engine -> time it may be used again
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """Returns the next healthy replica engine, or None if there is none"""
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[next(self._counter) % len(self.engines)]
+                if self._ejected.get(engine, 0) <= now:
+                    self._ejected.pop(engine, None)
+                    return engine
+        return None
+
+    def eject(self, engine):
+        """Stops using a replica until eject_seconds have passed"""
+        logger.warning(
+            "Ejecting read replica %s for %.0fs", engine.url.render_as_string(), self.eject_seconds
+        )
+        with self._lock:
+            self._ejected[engine] = time.monotonic() + self.eject_seconds
+
+    def dispose(self):
+        """Closes the connection pools of every replica"""
+        for engine in self.engines:
+            engine.dispose()
+
+
+def init_replicas(app):
+    """Creates the replica engines from DATABASE_REPLICA_URIS"""
+    global _pool  # pylint: disable=global-statement, invalid-name
+    if _pool is not None:
+        _pool.dispose()
+        _pool = None
+    uris = app.config.get("DATABASE_REPLICA_URIS") or []
+    if uris:
+        logger.info("Routing reads to %d replica(s)", len(uris))
+        _pool = ReplicaPool(
+            [create_engine(uri, pool_pre_ping=True) for uri in uris],
+            app.config.get("DATABASE_REPLICA_EJECT_SECONDS", 30.0),
+        )
+
+
+def get_pool():
+    """Returns the current ReplicaPool, or None if replicas are not configured"""
+    return _pool
+
+
+def _must_use_primary(session) -> bool:
+    """Returns True if a read in this session has to see the primary"""
+    if session.info.get("wrote") or session.new or session.dirty or session.deleted:
+        return True
+    return has_request_context() and request.method not in READ_METHODS
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_written(session, _flush_context):
+    """Remembers that a session has written so it keeps reading the primary"""
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _route_to_replica(orm_execute_state):
+    """Runs replica-marked SELECTs on a replica when that is safe"""
+    if (
+        _pool is None
+        or not orm_execute_state.is_select
+        or not orm_execute_state.execution_options.get("replica")
+        or _must_use_primary(orm_execute_state.session)
+    ):
+        return None
+    engine = _pool.choose()
+    if engine is None:
+        return None
+    try:
+        return orm_execute_state.invoke_statement(bind_arguments={"bind": engine})
+    except (OperationalError, InterfaceError) as error:
+        _pool.eject(engine)
+        logger.warning("Replica query failed, retrying on the primary: %s", error)
+        return None  # fall through to the primary
@@ -0,0 +1,254 @@
+"""
+Schemas
+
+Declares the keys a request body may have and validates bodies against
+them. When a Schema is declared it generates the source of one function
+that checks and converts every key of a whole body in straight-line code,
+and another that stores the values as attributes of an object. A body
+that passes is never looked at again. One that fails is checked key by
+key with a function compiled from each Field, because validation doesn't
+stop at the first bad key: the SchemaError lists every one of them, and
+for a list of bodies the index of the row each error is in.
+"""
+from enum import Enum
+
+MAX_MESSAGE_ERRORS = 5  # errors spelled out in the message, the rest are counted
+_KIND_NAMES = {str: "a string", bool: "true or false", int: "an integer"}
+
+
+class SchemaError(ValueError):
+    """Used for data that doesn't match its schema, with the error of each field"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+class Field:  # pylint: disable=too-few-public-methods
+    """One key of a schema and the rules its value must follow"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        name: str,
+        kind: type = None,
+        required: bool = True,
+        nullable: bool = False,
+        max_length: int = None,
+        choices: type = None,
+        convert=None,
+    ):
+        """
+        :param kind: the exact type the value must have, such as str or bool
+        :param required: False if the key may be left out, its value is then None
+        :param nullable: True if the value may be None
+        :param max_length: the most characters a string may have
+        :param choices: an Enum whose member names are the valid values,
+            they are converted to the members
+        :param convert: a function that converts the value, raising
+            ValueError or TypeError if it can't
+        """
+        self.name = name
+        self.kind = kind
+        self.required = required
+        self.nullable = nullable
+        self.max_length = max_length
+        self.choices = choices
+        self.convert = convert
+
+    def compile(self):
+        """Returns a function that checks and converts a value of this field"""
+        check = self._compile_value()
+        if not self.nullable:
+            return check
+
+        def check_nullable(value):
+            return None if value is None else check(value)
+
+        return check_nullable
+
+    def _compile_value(self):
+        """Returns the check of a value that isn't None"""
+        if self.choices is not None:
+            return _compile_choices(self.choices)
+        if self.convert is not None:
+            return self.convert
+        kind = self.kind
+        max_length = self.max_length
+        description = _KIND_NAMES.get(kind, kind.__name__)
+
+        def check(value):
+            if type(value) is not kind:  # pylint: disable=unidiomatic-typecheck  # True is not an int here
+                raise TypeError(f"must be {description}")
+            if max_length is not None and len(value) > max_length:
+                raise ValueError(f"must be at most {max_length} characters")
+            return value
+
+        return check
+
+
+def _compile_choices(choices: Enum):
+    """Returns the check of a value that must name a member of an Enum"""
+    members = {member.name: member for member in choices}
+    message = f"must be one of {', '.join(members)}"
+
+    def check(value):
+        try:
+            return members[value]
+        except (KeyError, TypeError):
+            raise ValueError(message) from None
+
+    return check
+
+
+def _value_source(index: int, field: Field) -> list:
+    """Returns the lines that check and convert the value of a field into v<index>"""
+    value = f"v{index}"
+    if field.required:
+        lines = [f"{value} = data[{field.name!r}]"]
+    else:
+        lines = [f"{value} = data.get({field.name!r})"]
+        if not field.nullable:
+            lines.append(f"if {value} is None and {field.name!r} in data: return None")
+    if field.choices is not None:
+        checks = [f"{value} = members{index}[{value}]"]
+    elif field.convert is not None:
+        checks = [f"{value} = convert{index}({value})"]
+    else:
+        checks = [f"if type({value}) is not kind{index}: return None"]
+        if field.max_length is not None:
+            checks.append(f"if len({value}) > {field.max_length}: return None")
+    if field.nullable or not field.required:
+        return lines + [f"if {value} is not None:"] + [f"    {check}" for check in checks]
+    return lines + checks
+
+
+class Schema:
+    """The fields of a kind of request body, compiled into one validator"""
+
+    def __init__(self, name: str, *fields: Field, error=SchemaError):
+        """
+        :param name: what the body is called in error messages
+        :param error: the SchemaError subclass to raise
+        """
+        self.name = name
+        self.fields = fields
+        self.error = error
+        self._checks = tuple((field.name, field.required, field.compile()) for field in fields)
+        values = ", ".join(f"{field.name!r}: v{index}" for index, field in enumerate(fields))
+        self._values = self._generate("values", [f"return {{{values}}}"])
+        self._apply = self._generate(
+            "apply", [f"target.{field.name} = v{index}" for index, field in enumerate(fields)] + ["return target"]
+        )
+
+    def _generate(self, name: str, tail: list):
+        """Returns a function of (target, data) that checks and converts a whole body
+
+        It runs tail with each value in v<index> once every key is valid, and
+        returns None as soon as one isn't, leaving the errors to check().
+        """
+        namespace = {}
+        lines = []
+        for index, field in enumerate(self.fields):
+            namespace[f"members{index}"] = (
+                {member.name: member for member in field.choices} if field.choices is not None else None
+            )
+            namespace[f"convert{index}"] = field.convert
+            namespace[f"kind{index}"] = field.kind
+            lines += _value_source(index, field)
+        source = "\n".join(
+            [
+                f"def {name}(target, data):",
+                "    if type(data) is not dict: return None",
+                "    try:",
+                *(f"        {line}" for line in lines),
+                "    except (KeyError, TypeError, ValueError):",
+                "        return None",
+                *(f"    {line}" for line in tail),
+            ]
+        )
+        exec(compile(source, f"<schema {self.name}>", "exec"), namespace)  # pylint: disable=exec-used
+        return namespace[name]
+
+    def check(self, data, partial: bool = False):
+        """Returns the converted values of a body and the errors of its fields
+
+        :param partial: only check the keys that are present
+        :return: a dictionary of the values and a list of field errors
+        """
+        if not isinstance(data, dict):
+            return {}, [{"field": None, "error": f"must be an object, not {type(data).__name__}"}]
+        values = {}
+        errors = []
+        for name, required, convert in self._checks:
+            if name in data:
+                try:
+                    values[name] = convert(data[name])
+                except (TypeError, ValueError) as error:
+                    errors.append({"field": name, "error": str(error)})
+            elif partial:
+                continue
+            elif required:
+                errors.append({"field": name, "error": "is required"})
+            else:
+                values[name] = None
+        return values, errors
+
+    def validate(self, data, partial: bool = False) -> dict:
+        """Returns the converted values of a body or raises every error in it
+        :param partial: only check the keys that are present
+        """
+        if not partial:
+            values = self._values(None, data)
+            if values is not None:
+                return values
+        values, errors = self.check(data, partial)
+        if errors:
+            raise self.error(self.message(errors), errors)
+        return values
+
+    def apply(self, target, data, partial: bool = False):
+        """Sets the converted values of a body as attributes of target or raises every error in it
+        :param partial: only check and set the keys that are present
+        :return: the target
+        """
+        if not partial and self._apply(target, data) is not None:
+            return target
+        for name, value in self.validate(data, partial).items():
+            setattr(target, name, value)
+        return target
+
+    def validate_many(self, rows, start: int = 0):
+        """Checks a list of bodies, row by row
+
+        :param start: the index of the first row
+        :return: the (index, values) of each valid row and the errors of the
+            others, each with the index of its row
+        """
+        if not isinstance(rows, list):
+            raise self.error(f"Invalid {self.name}: must be a list, not {type(rows).__name__}")
+        valid = []
+        errors = []
+        for index, data in enumerate(rows, start):
+            values = self._values(None, data)
+            if values is not None:
+                valid.append((index, values))
+                continue
+            values, row_errors = self.check(data)
+            if row_errors:
+                errors += [{"row": index, **error} for error in row_errors]
+            else:
+                valid.append((index, values))
+        return valid, errors
+
+    def message(self, errors: list) -> str:
+        """Spells out the first errors of a body or list of bodies"""
+        parts = []
+        for error in errors[:MAX_MESSAGE_ERRORS]:
+            where = [f"row {error['row']}"] if "row" in error else []
+            if error["field"]:
+                where.append(error["field"])
+            parts.append(f"{' '.join(where)}: {error['error']}" if where else error["error"])
+        if len(errors) > MAX_MESSAGE_ERRORS:
+            parts.append(f"{len(errors) - MAX_MESSAGE_ERRORS} more")
+        return f"Invalid {self.name}: {'; '.join(parts)}"
@@ -0,0 +1,192 @@
+"""
+Sharding
+
+Spreads the rows of sharded tables, those whose ``info`` has ``sharded``
+set, over the databases in DATABASE_SHARD_URIS. Each row lives on the
+shard its primary key hashes to, and everything else stays on the primary
+database.
+
+* ORM flushes write each sharded instance on its shard, through the
+  ``connection_callable`` of RoutingSession. The primary key has to be set
+  before the flush, databases can't pick it as each shard would reuse ids.
+* ORM queries with the ``shard`` execution option, and the refresh of an
+  expired instance, run on that one shard. Every other ORM query of a
+  sharded entity runs on each shard in turn and returns the rows of all
+  of them, in no particular order. Bulk ORM UPDATE and DELETE statements
+  are refused with a ShardingError, answered with 501 Not Implemented.
+* fan_out() runs a query on every shard in parallel threads and merges the
+  sorted results, for the listings that need order and limits across
+  shards. execute_each() runs a Core statement on every shard, for the
+  bulk commands.
+
+A session keeps one transaction per database it touched and commits them
+one after the other, so a commit that fails part way can leave a shard
+written without the primary or the other way round.
+"""
+import heapq
+import itertools
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("flask.app")
+
+_shards = None  # pylint: disable=invalid-name
+
+
+class ShardingError(Exception):
+    """Used for statements that can't be routed to the shards"""
+
+
+class ShardSet:
+    """The shard engines, the hash that picks one and the threads that query them all"""
+
+    def __init__(self, engines, threads: int = 8):
+        self.engines = list(engines)
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="shard")
+
+    def __len__(self):
+        return len(self.engines)
+
+    def index_for(self, key: int) -> int:
+        """Returns the index of the shard that holds a primary key"""
+        # hashed so that runs of consecutive ids spread evenly
+        return zlib.crc32(int(key).to_bytes(8, "big", signed=True)) % len(self.engines)
+
+    def engine_for(self, key: int):
+        """Returns the engine of the shard that holds a primary key"""
+        return self.engines[self.index_for(key)]
+
+    def partition(self, rows, key: str) -> dict:
+        """Groups rows by the index of their shard
+        :param key: the column holding the primary key of each row
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.index_for(row[key]), []).append(row)
+        return groups
+
+    def restart(self):
+        """Gives a forked process threads of its own, those of the parent don't exist in it"""
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="shard")
+
+    def dispose(self):
+        """Stops the threads and closes the connection pools of every shard"""
+        self.executor.shutdown(wait=True)
+        for engine in self.engines:
+            engine.dispose()
+
+
+def init_shards(app):
+    """Creates the shard engines from DATABASE_SHARD_URIS"""
+    global _shards  # pylint: disable=global-statement, invalid-name
+    if _shards is not None:
+        _shards.dispose()
+        _shards = None
+    uris = app.config.get("DATABASE_SHARD_URIS") or []
+    if uris:
+        logger.info("Sharding products over %d database(s)", len(uris))
+        _shards = ShardSet(
+            [create_engine(uri, pool_pre_ping=True) for uri in uris],
+            app.config.get("DATABASE_SHARD_THREADS", 8),
+        )
+
+
+def get_shards():
+    """Returns the current ShardSet, or None if sharding is off"""
+    return _shards
+
+
+def is_sharded(mapper) -> bool:
+    """Returns True if the rows of a mapped class live on the shards"""
+    return bool(mapper.local_table.info.get("sharded"))
+
+
+def create_all(metadata):
+    """Creates the sharded tables of a metadata that don't exist yet on every shard"""
+    if _shards is None:
+        return
+    tables = [table for table in metadata.sorted_tables if table.info.get("sharded")]
+    for engine in _shards.engines:
+        metadata.create_all(engine, tables=tables)
+
+
+def drop_all(metadata):
+    """Drops the sharded tables of a metadata on every shard"""
+    if _shards is None:
+        return
+    tables = [table for table in metadata.sorted_tables if table.info.get("sharded")]
+    for engine in _shards.engines:
+        metadata.drop_all(engine, tables=tables)
+
+
+def execute_each(session, statement) -> list:
+    """Runs a Core statement on every shard in the session's transactions
+    :return: the Result of each shard
+    """
+    return [session.execute(statement, bind_arguments={"bind": engine}) for engine in _shards.engines]
+
+
+def fan_out(statement, key=None, reverse: bool = False, limit=None) -> list:
+    """Runs an ORM query on every shard in parallel and merges the rows
+
+    Each shard is queried in a session of its own, so the loaded instances
+    are detached and the query should not see the caller's pending writes.
+
+    :param key: the sort key of a row if each shard returns its rows sorted,
+        they are then merged in that order
+    :param reverse: True if the shards return their rows in descending order
+    :param limit: the most rows to return
+    """
+
+    def run(index):
+        with Session(_shards.engines[index]) as session:
+            return session.execute(statement.execution_options(shard=index)).all()
+
+    results = list(_shards.executor.map(run, range(len(_shards))))
+    if key is None:
+        rows = itertools.chain.from_iterable(results)
+    else:
+        rows = heapq.merge(*results, key=key, reverse=reverse)
+    return list(itertools.islice(rows, limit))
+
+
+class RoutingSession(FlaskSession):  # pylint: disable=too-few-public-methods
+    """A session that flushes sharded instances to the shard of their primary key"""
+
+    @property
+    def connection_callable(self):
+        """Picks the connection of each flushed instance while sharding is on"""
+        return None if _shards is None else self._connection_for_instance
+
+    def _connection_for_instance(self, mapper=None, instance=None, **_kwargs):
+        """Returns the connection an instance is written with"""
+        if instance is not None and is_sharded(mapper):
+            key = mapper.primary_key_from_instance(instance)[0]
+            if key is None:
+                raise ValueError(f"{mapper.class_.__name__} needs its primary key set before it is sharded")
+            return self.connection(bind_arguments={"bind": _shards.engine_for(key)})
+        return self.connection(bind_arguments={"mapper": mapper})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _route_to_shards(orm_execute_state):
+    """Runs ORM queries of sharded entities on their shard, or on all of them"""
+    if _shards is None or not any(is_sharded(mapper) for mapper in orm_execute_state.all_mappers):
+        return None
+    if not orm_execute_state.is_select:
+        raise ShardingError("Bulk UPDATE and DELETE of sharded rows are not supported")
+    index = orm_execute_state.execution_options.get("shard")
+    if index is None:
+        refreshed = orm_execute_state.load_options._refresh_state  # pylint: disable=protected-access
+        if refreshed is not None and refreshed.key is not None:
+            index = _shards.index_for(refreshed.key[1][0])
+    engines = _shards.engines if index is None else [_shards.engines[index]]
+    results = [
+        orm_execute_state.invoke_statement(bind_arguments={"bind": engine}) for engine in engines
+    ]
+    return results[0] if len(results) == 1 else results[0].merge(*results[1:])
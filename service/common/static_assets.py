@@ -0,0 +1,93 @@
+"""
+Static Assets
+
+Lets browsers keep the UI's static files until they change. Every file in
+the static folder is hashed when the app starts and index.html is
+rewritten to refer to each asset as ``static/<path>?v=<hash>``. A request
+that carries the current hash of its file is answered with an immutable
+Cache-Control header, so the browser reuses its copy without asking again
+until a deploy changes the file, its hash and so its URL. Requests without
+the hash, or with an old one, have to revalidate.
+
+index.html is what points at the current hashes, so it is served from
+memory with an ETag and must be revalidated, which costs a 304 at most.
+"""
+import hashlib
+import os
+import re
+from flask import Response, request
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# src="static/..." and href="static/..." attributes in index.html
+ASSET_REFERENCE = re.compile(r'((?:src|href)\s*=\s*")static/([^"?#]+)"')
+
+_manifest = {}  # pylint: disable=invalid-name
+_index = b""  # pylint: disable=invalid-name
+
+
+def content_hash(data: bytes) -> str:
+    """Returns a short hash of some content for URLs and ETags"""
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def build_manifest(folder: str) -> dict:
+    """Hashes every file under a folder, keyed by its path relative to it"""
+    manifest = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as file:
+                manifest[os.path.relpath(path, folder).replace(os.sep, "/")] = content_hash(file.read())
+    return manifest
+
+
+def versioned_html(html: str, manifest: dict) -> str:
+    """Adds the content hash to every static asset an HTML page refers to"""
+
+    def add_version(match):
+        path = match.group(2)
+        if path not in manifest:
+            return match.group(0)
+        return f'{match.group(1)}static/{path}?v={manifest[path]}"'
+
+    return ASSET_REFERENCE.sub(add_version, html)
+
+
+def cached_response(body: bytes, mimetype: str, cache_control: str) -> Response:
+    """Serves a precomputed body with an ETag, or 304 if the client has it"""
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(content_hash(body))
+    response.headers["Cache-Control"] = cache_control
+    return response.make_conditional(request)
+
+
+def index_response() -> Response:
+    """Serves index.html with versioned asset URLs"""
+    return cached_response(_index, "text/html", REVALIDATE)
+
+
+def _cache_headers(response):
+    """Marks static files requested by their current hash as immutable"""
+    if request.endpoint == "static":
+        path = (request.view_args or {}).get("filename")
+        version = request.args.get("v")
+        if version is not None and _manifest.get(path) == version:
+            response.headers["Cache-Control"] = IMMUTABLE
+        else:
+            response.headers["Cache-Control"] = REVALIDATE
+    return response
+
+
+def init_static_assets(app):
+    """Hashes the static folder and prepares index.html"""
+    global _manifest, _index  # pylint: disable=global-statement, invalid-name
+    _manifest = build_manifest(app.static_folder)
+    with open(os.path.join(app.static_folder, "index.html"), encoding="utf-8") as file:
+        _index = versioned_html(file.read(), _manifest).encode("utf-8")
+    app.after_request(_cache_headers)
+
+
+def get_manifest() -> dict:
+    """Returns the content hash of every static file"""
+    return _manifest
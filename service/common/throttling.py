@@ -0,0 +1,237 @@
+"""
+Throttling
+
+Protects the workers and the database pool from overload in two ways.
+
+Rate limiting gives every client a token bucket, keyed by its X-Api-Key
+header if that is one of the configured keys, or else its address. A
+client can't get a fresh bucket by making keys up. Each request spends the tokens its route
+costs, so listing and bulk endpoints drain a bucket faster than single
+reads. A client with too few tokens gets 429 Too Many Requests.
+
+Load shedding refuses new requests with 503 Service Unavailable while the
+worker already has too many requests in flight or while getting a database
+connection has recently been slow, so the requests already admitted can
+finish quickly instead of everything timing out together.
+
+Both answer with a Retry-After header. The counters live in each worker
+process, so a limit applies per worker. A worker has at most as many
+requests in flight as it has threads, so the in-flight limit only sheds
+load when it is lower than that.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import abort, g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from service.common import status
+
+EXEMPT_ENDPOINTS = ("api.health",)
+
+_limiter = None  # pylint: disable=invalid-name
+_shedder = None  # pylint: disable=invalid-name
+_api_keys = frozenset()  # pylint: disable=invalid-name  # SHA-256 digests of the known keys
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """Tokens that refill at a steady rate up to a burst capacity"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, cost: float, now: float) -> float:
+        """Spends tokens if there are enough
+        :return: 0 if the tokens were spent, otherwise the seconds until they will be
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets for the most recently seen clients"""
+
+    def __init__(self, rate: float, burst: float, costs: dict, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.costs = costs
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cost(self, endpoint) -> float:
+        """Returns the number of tokens a request to an endpoint costs"""
+        return self.costs.get(endpoint, 1.0)
+
+    def check(self, client: str, cost: float) -> float:
+        """Charges a client for a request
+        :return: 0 if the request may go ahead, otherwise the seconds to wait
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)  # forget the least recent client
+            else:
+                self._buckets.move_to_end(client)
+            return bucket.take(min(cost, self.burst), now)
+
+
+class LoadShedder:
+    """Tracks the requests in flight and how long database connections take"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, max_in_flight: int, max_pool_wait: float, retry_after: int = 1, half_life: float = 1.0):
+        self.max_in_flight = max_in_flight
+        self.max_pool_wait = max_pool_wait
+        self.retry_after = retry_after
+        self.half_life = half_life
+        self.in_flight = 0
+        self._pool_wait = 0.0
+        self._measured_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def pool_wait(self) -> float:
+        """Returns the recent connection wait in seconds, decaying with time"""
+        elapsed = time.monotonic() - self._measured_at
+        return self._pool_wait * 0.5 ** (elapsed / self.half_life)
+
+    def record_pool_wait(self, seconds: float):
+        """Folds a measured connection wait into the moving average"""
+        with self._lock:
+            average = self.pool_wait()
+            self._pool_wait = average + 0.3 * (seconds - average)
+            self._measured_at = time.monotonic()
+
+    def overloaded(self) -> bool:
+        """Returns True if new requests should be refused"""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return True
+        return bool(self.max_pool_wait) and self.pool_wait() >= self.max_pool_wait
+
+    def enter(self):
+        """Counts a request that has been admitted"""
+        with self._lock:
+            self.in_flight += 1
+
+    def leave(self):
+        """Stops counting a request once it has finished"""
+        with self._lock:
+            self.in_flight -= 1
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+def _digest(api_key: str) -> str:
+    """Returns the SHA-256 digest of an API key"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def client_key() -> str:
+    """Returns the key a client is rate limited by"""
+    api_key = request.headers.get("X-Api-Key")
+    if api_key:
+        # comparing digests takes the same time however much of a key matches
+        digest = _digest(api_key)
+        if digest in _api_keys:
+            return "key:" + digest
+    return "addr:" + str(request.remote_addr)
+
+
+def _admit():
+    """Sheds load and enforces the rate limit before a request is handled"""
+    if request.endpoint in EXEMPT_ENDPOINTS:
+        return
+    if _shedder is not None:
+        if _shedder.overloaded():
+            abort(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                description="The service is overloaded, please retry later",
+                retry_after=_shedder.retry_after,
+            )
+        _shedder.enter()
+        g.throttling_shedder = _shedder
+    if _limiter is not None:
+        wait = _limiter.check(client_key(), _limiter.cost(request.endpoint))
+        if wait:
+            abort(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                description="Rate limit exceeded, please slow down",
+                retry_after=math.ceil(wait),
+            )
+
+
+def _release(_error=None):
+    """Stops counting a request as in flight"""
+    shedder = g.pop("throttling_shedder", None)
+    if shedder is not None:
+        shedder.leave()
+
+
+def init_throttling(app):
+    """Sets up rate limiting and load shedding from the configuration"""
+    global _limiter, _shedder, _api_keys  # pylint: disable=global-statement, invalid-name
+    _limiter = None
+    _shedder = None
+    _api_keys = frozenset(_digest(key) for key in app.config.get("RATE_LIMIT_API_KEYS", ()))
+    if app.config.get("RATE_LIMIT_PER_SECOND"):
+        _limiter = RateLimiter(
+            app.config["RATE_LIMIT_PER_SECOND"],
+            app.config["RATE_LIMIT_BURST"],
+            app.config["RATE_LIMIT_COSTS"],
+        )
+    if app.config.get("LOAD_SHED_MAX_IN_FLIGHT") or app.config.get("LOAD_SHED_MAX_POOL_WAIT"):
+        _shedder = LoadShedder(
+            app.config["LOAD_SHED_MAX_IN_FLIGHT"],
+            app.config["LOAD_SHED_MAX_POOL_WAIT"],
+            app.config["LOAD_SHED_RETRY_AFTER"],
+        )
+    app.before_request(_admit)
+    app.teardown_request(_release)
+
+
+def get_limiter():
+    """Returns the current RateLimiter, or None if rate limiting is off"""
+    return _limiter
+
+
+def get_shedder():
+    """Returns the current LoadShedder, or None if load shedding is off"""
+    return _shedder
+
+
+######################################################################
+#  C O N N E C T I O N   W A I T   T I M I N G
+######################################################################
+@event.listens_for(Session, "do_orm_execute")
+def _start_connection_wait(orm_execute_state):
+    """Notes when a statement may have to wait for a pooled connection"""
+    info = orm_execute_state.session.info
+    if "connection_wanted_at" not in info:
+        info["connection_wanted_at"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_begin")
+def _end_connection_wait(session, _transaction, _connection):
+    """Measures how long the session waited for its connection"""
+    started = session.info.pop("connection_wanted_at", None)
+    if started is not None and _shedder is not None:
+        _shedder.record_pool_wait(time.perf_counter() - started)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _clear_connection_wait(session, _transaction):
+    """Forgets statements that ran on a connection the session already had"""
+    session.info.pop("connection_wanted_at", None)
@@ -0,0 +1,177 @@
+"""
+Tracing
+
+OpenTelemetry spans for each request, each traced Product model method,
+each SQL statement and each JSON response body, so a slow request shows
+where its time went. A request continues the trace of the W3C
+``traceparent`` header it arrives with, and log records carry the trace
+and span ids.
+
+Spans go through the global OpenTelemetry API. Unless TRACING_EXPORTER
+names an exporter, or something else has installed a tracer provider,
+they are no-ops.
+"""
+import functools
+import sys
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SERVICE_NAME = "products"
+MAX_STATEMENT_LENGTH = 2000
+
+tracer = trace.get_tracer("service")
+
+
+def traced(func):
+    """Runs a function in a span named after its qualified name"""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracer.start_as_current_span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    """Times the encoding of JSON response bodies"""
+
+    def response(self, *args, **kwargs):
+        with tracer.start_as_current_span("jsonify"):
+            return super().response(*args, **kwargs)
+
+
+def _exporter(app):
+    """Returns the span exporter named by TRACING_EXPORTER, or None"""
+    name = app.config.get("TRACING_EXPORTER", "none")
+    if name == "console":
+        return ConsoleSpanExporter(service_name=SERVICE_NAME, out=sys.stdout)
+    if name == "file":
+        # pylint: disable=consider-using-with
+        out = open(app.config["TRACING_FILE"], "a", encoding="utf-8", buffering=1)
+        return ConsoleSpanExporter(
+            service_name=SERVICE_NAME, out=out, formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    return None
+
+
+def init_tracing(app):
+    """Installs the configured exporter and traces every request"""
+    exporter = _exporter(app)
+    if exporter is not None:
+        if isinstance(trace.get_tracer_provider(), trace.ProxyTracerProvider):
+            provider = TracerProvider(
+                resource=Resource.create({"service.name": SERVICE_NAME}),
+                sampler=ParentBased(TraceIdRatioBased(app.config.get("TRACING_SAMPLE_RATE", 1.0))),
+            )
+            provider.add_span_processor(BatchSpanProcessor(exporter))
+            trace.set_tracer_provider(provider)
+        else:
+            app.logger.warning("A tracer provider is already installed, ignoring TRACING_EXPORTER")
+    app.json = TracedJSONProvider(app)
+    app.before_request(_start_request_span)
+    app.after_request(_tag_response)
+    app.teardown_request(_end_request_span)
+
+
+######################################################################
+#  R E Q U E S T   S P A N S
+######################################################################
+def _start_request_span():
+    """Starts the span of a request as a child of its incoming trace"""
+    route = request.url_rule.rule if request.url_rule else request.path
+    span = tracer.start_span(
+        f"{request.method} {route}",
+        context=propagate.extract(request.headers),
+        kind=trace.SpanKind.SERVER,
+        attributes={
+            "http.request.method": request.method,
+            "http.route": route,
+            "url.path": request.path,
+        },
+    )
+    g.trace_span = span
+    g.trace_token = context.attach(trace.set_span_in_context(span))
+
+
+def _tag_response(response):
+    """Records the status of the response on the request span"""
+    span = g.get("trace_span")
+    if span is not None:
+        span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_status(trace.StatusCode.ERROR)
+    return response
+
+
+def _end_request_span(error=None):
+    """Ends the span of a request"""
+    span = g.pop("trace_span", None)
+    if span is None:
+        return
+    if error is not None:
+        span.record_exception(error)
+        span.set_status(trace.StatusCode.ERROR)
+    span.end()
+    context.detach(g.pop("trace_token"))
+
+
+def current_ids() -> dict:
+    """Returns the trace and span ids of the current span, if there is one"""
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return {}
+    return {
+        "trace_id": trace.format_trace_id(span_context.trace_id),
+        "span_id": trace.format_span_id(span_context.span_id),
+    }
+
+
+######################################################################
+#  S Q L   S P A N S
+######################################################################
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement_span(conn, _cursor, statement, _parameters, execution_context, _executemany):
+    """Starts a span for a SQL statement"""
+    if not trace.get_current_span().is_recording():
+        return  # only trace statements that belong to a sampled trace
+    span = tracer.start_span(
+        statement.split(None, 1)[0].upper() if statement else "SQL",
+        kind=trace.SpanKind.CLIENT,
+        attributes={
+            "db.system": conn.dialect.name,
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+        },
+    )
+    execution_context.trace_span = span
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_statement_span(_conn, cursor, _statement, _parameters, execution_context, _executemany):
+    """Ends the span of a SQL statement"""
+    span = getattr(execution_context, "trace_span", None)
+    if span is not None:
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            span.set_attribute("db.response.returned_rows", cursor.rowcount)
+        span.end()
+        execution_context.trace_span = None
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_statement_span(exception_context):
+    """Ends the span of a SQL statement that failed"""
+    execution_context = exception_context.execution_context
+    span = getattr(execution_context, "trace_span", None)
+    if span is not None:
+        span.record_exception(exception_context.original_exception)
+        span.set_status(trace.StatusCode.ERROR)
+        span.end()
+        execution_context.trace_span = None
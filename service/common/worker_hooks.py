@@ -0,0 +1,78 @@
+"""
+Worker Hooks
+
+Keeps a preloaded application safe to fork. With ``preload_app`` gunicorn
+imports the service once in the master and forks the workers from it, so
+they share the pages holding Flask, SQLAlchemy, the models and the catalog
+snapshot instead of each building its own copy. Database connections must
+not be shared that way, so the master drops its pools before forking and
+each worker starts with empty ones and its own threads to query the shards.
+A worker that exits writes the updates it buffered for write-behind and
+stops its import jobs first.
+"""
+import gc
+import sys
+from service.common import log_handlers, read_replicas, sharding
+
+
+def _preloaded_app():
+    """Returns the application if it was imported before the fork"""
+    service = sys.modules.get("service")
+    return getattr(service, "app", None)
+
+
+def _engines(app) -> list:
+    """Returns the primary, replica and shard engines of the application"""
+    from service.models import db  # pylint: disable=import-outside-toplevel
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    pool = read_replicas.get_pool()
+    if pool is not None:
+        engines.extend(pool.engines)
+    shards = sharding.get_shards()
+    if shards is not None:
+        engines.extend(shards.engines)
+    return engines
+
+
+def before_fork():
+    """Closes the master's connections and freezes its objects before a fork"""
+    app = _preloaded_app()
+    if app is None:
+        return
+    from service import snapshot  # pylint: disable=import-outside-toplevel
+
+    # Map the snapshot once so that every worker inherits the same mapping
+    snapshot.current(app)
+    for engine in _engines(app):
+        engine.dispose()
+    # A fork copies no threads, so the log writer is restarted in the worker
+    log_handlers.stop_listener()
+    # Keep the garbage collector from writing to the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def after_fork():
+    """Gives a freshly forked worker its own connection pools"""
+    app = _preloaded_app()
+    if app is None:
+        return
+    log_handlers.start_listener()
+    for engine in _engines(app):
+        # close=False leaves any connection inherited from the master alone
+        engine.dispose(close=False)
+    shards = sharding.get_shards()
+    if shards is not None:
+        shards.restart()
+
+
+def before_exit():
+    """Writes the buffered updates and stops the import jobs of a worker before it exits"""
+    write_behind = sys.modules.get("service.write_behind")
+    if write_behind is not None:
+        write_behind.stop()
+    import_jobs = sys.modules.get("service.import_jobs")
+    if import_jobs is not None:
+        import_jobs.stop()
@@ -0,0 +1,221 @@
+"""
+Import Jobs
+
+Runs bulk Product imports in a background worker pool so that large
+payloads don't tie up a request worker. Each job is recorded in the
+``import_jobs`` table and its progress is committed chunk by chunk along
+with the Products of that chunk, so any worker can report on it.
+
+The pool lives in the worker process. A worker that exits cleanly lets
+the running jobs finish their current chunk and fails every job it had
+not finished, but the jobs of a killed worker stay PENDING or RUNNING.
+"""
+import csv
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import msgpack
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.attributes import flag_modified
+from service.models import db, ImportJob, ImportStatus, Product, PRODUCT_SCHEMA
+
+logger = logging.getLogger("flask.app")
+
+# Supported payload media types and the format name recorded on the job
+FORMATS = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/x-ndjson": "ndjson",
+    "text/csv": "csv",
+}
+
+_executor = None  # pylint: disable=invalid-name
+_stopping = threading.Event()
+
+
+def get_executor(app):
+    """Returns the shared worker pool, creating it on first use"""
+    global _executor  # pylint: disable=global-statement, invalid-name
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config["IMPORT_WORKERS"], thread_name_prefix="import"
+        )
+    return _executor
+
+
+def submit(job_id: int, payload: bytes):
+    """Queues the payload of an ImportJob for background processing
+    :param job_id: the id of an already created ImportJob
+    :param payload: the raw request body
+    :return: a Future that resolves when the job has finished
+    """
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    return get_executor(app).submit(run_import, app, job_id, payload)
+
+
+def stop():
+    """Fails the queued jobs and waits for the running ones to stop after their current chunk"""
+    global _executor  # pylint: disable=global-statement, invalid-name
+    if _executor is None:
+        return
+    _stopping.set()
+    _executor.shutdown(wait=True)
+    _executor = None
+    _stopping.clear()
+
+
+######################################################################
+#  P A R S E R S
+######################################################################
+def _parse_csv_bool(value):
+    """Converts a CSV cell into a bool, leaving unknown values for validation"""
+    lowered = value.strip().lower()
+    if lowered == "true":
+        return True
+    if lowered == "false":
+        return False
+    return value
+
+
+def _parse_csv_row(row: dict) -> dict:
+    """Converts a CSV row of strings into a Product dictionary"""
+    data = {key: (value if value != "" else None) for key, value in row.items()}
+    if data.get("price") is not None:
+        try:
+            data["price"] = float(data["price"])
+        except ValueError:
+            pass  # left as a string so validation reports it
+    if data.get("available") is not None:
+        data["available"] = _parse_csv_bool(data["available"])
+    return data
+
+
+def iter_rows(lines, fmt: str):
+    """Lazily parses NDJSON or CSV text into Product dictionaries
+    :param lines: an iterable of text lines, such as an open file
+    :param fmt: one of "ndjson" or "csv"
+    :raises ValueError: if a line can't be parsed
+    """
+    if fmt == "ndjson":
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == "csv":
+        for row in csv.DictReader(lines):
+            yield _parse_csv_row(row)
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def parse_rows(payload: bytes, fmt: str) -> list:
+    """Parses a payload into a list of Product dictionaries
+    :param payload: the raw payload
+    :param fmt: one of "json", "msgpack", "ndjson" or "csv"
+    :raises ValueError: if the payload can't be parsed at all
+    """
+    if fmt == "msgpack":
+        rows = msgpack.unpackb(payload, raw=False)
+        if not isinstance(rows, list):
+            raise ValueError("MessagePack payload must be an array of products")
+        return rows
+    text = payload.decode("utf-8-sig")
+    if fmt == "json":
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("JSON payload must be an array of products")
+        return rows
+    return list(iter_rows(io.StringIO(text), fmt))
+
+
+######################################################################
+#  W O R K E R
+######################################################################
+def _finish(job: ImportJob, job_status: ImportStatus, message=None):
+    """Records the final state of a job"""
+    job.status = job_status
+    job.message = message
+    job.finished_at = datetime.utcnow()
+    job.update()
+
+
+def _import_chunk(job: ImportJob, rows: list, start: int, max_errors: int):
+    """Validates and inserts one chunk of rows in a single transaction"""
+    valid, errors = PRODUCT_SCHEMA.validate_many(rows, start)
+    products = [Product(**values) for _, values in valid]
+    db.session.add_all(products)
+    job.processed_rows += len(rows)
+    job.created_rows += len(products)
+    job.failed_rows += len(rows) - len(products)
+    if errors and len(job.errors) < max_errors:
+        job.errors = (job.errors + errors)[:max_errors]
+        flag_modified(job, "errors")
+    db.session.commit()
+
+
+def _import_rows(app, job: ImportJob, payload: bytes):
+    """Parses the payload of a running job and imports its rows chunk by chunk"""
+    try:
+        rows = parse_rows(payload, job.format)
+    except (ValueError, UnicodeDecodeError) as error:
+        _finish(job, ImportStatus.FAILED, f"Unable to parse payload: {error}")
+        logger.warning("Import job [%s] failed: %s", job.id, error)
+        return
+    job.total_rows = len(rows)
+    job.update()
+
+    chunk_size = app.config["IMPORT_CHUNK_SIZE"]
+    max_errors = app.config["IMPORT_MAX_ERRORS"]
+    for start in range(0, len(rows), chunk_size):
+        if _stopping.is_set():
+            _finish(job, ImportStatus.FAILED, f"The worker exited before row {start}")
+            logger.warning("Import job [%s] stopped at row %s", job.id, start)
+            return
+        try:
+            _import_chunk(job, rows[start:start + chunk_size], start, max_errors)
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            _finish(job, ImportStatus.FAILED, f"Database error at row {start}: {error}")
+            logger.error("Import job [%s] failed at row %s: %s", job.id, start, error)
+            return
+
+    _finish(job, ImportStatus.COMPLETED)
+    logger.info(
+        "Import job [%s] completed: %d created, %d failed",
+        job.id,
+        job.created_rows,
+        job.failed_rows,
+        extra={
+            "job_id": job.id,
+            "created": job.created_rows,
+            "failed": job.failed_rows,
+            "rows_per_second": job.rows_per_second,
+        },
+    )
+
+
+def run_import(app, job_id: int, payload: bytes):
+    """Processes an ImportJob, committing its rows in chunks"""
+    with app.app_context():
+        job = ImportJob.find(job_id)
+        if not job:
+            logger.error("Import job [%s] disappeared before it started", job_id)
+            return
+        if _stopping.is_set():
+            _finish(job, ImportStatus.FAILED, "The worker exited before the import started")
+            return
+        job.status = ImportStatus.RUNNING
+        job.started_at = datetime.utcnow()
+        job.update()
+
+        try:
+            _import_rows(app, job, payload)
+        except Exception as error:  # pylint: disable=broad-except
+            # Anything else in the payload must not leave the job RUNNING forever
+            logger.exception("Import job [%s] failed", job_id)
+            db.session.rollback()
+            _finish(job, ImportStatus.FAILED, f"Unexpected error: {error!r}")
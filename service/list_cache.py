@@ -0,0 +1,86 @@
+"""
+List Response Cache
+
+Keeps the encoded JSON of recent GET /products responses so that a repeated
+listing is sent as the stored bytes, without querying and serializing the
+Products again. Entries are keyed by the parsed filters, sort, cursor
+position and page size, so the order and spelling of the query string
+don't matter.
+
+Every entry remembers the generation of the catalog it was built from: the
+last seq of the product change log, which every product write, bulk load
+and archival advances, or the file of the catalog snapshot. A listing of an
+older generation is built again. Entries also expire after max_age seconds.
+That bounds how stale a listing can get through changes the generation
+misses: a change that commits after one with a higher seq, or a read
+replica behind the one the generation was read from.
+
+The cache lives in each worker and holds at most max_bytes of bodies,
+dropping the least recently used first.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_cache = None  # pylint: disable=invalid-name
+
+
+class ListCache:
+    """Encoded list responses by request key, with the generation they show"""
+
+    def __init__(self, max_bytes: int, max_age: float):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (generation, stored at, body, next cursor)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, generation):
+        """Returns the body and next cursor of a listing, or None if it isn't cached"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != generation or now - entry[1] >= self.max_age:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2], entry[3]
+
+    def put(self, key, generation, body: bytes, cursor=None):
+        """Stores the body of a listing unless it would take an eighth of the cache"""
+        if len(body) > self.max_bytes // 8:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (generation, time.monotonic(), body, cursor)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """Drops every entry"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        """Drops an entry, the lock must be held"""
+        self.size -= len(self._entries.pop(key)[2])
+
+
+def current(app):
+    """Returns the list cache of this worker, or None if LIST_CACHE_BYTES is 0"""
+    global _cache  # pylint: disable=global-statement, invalid-name
+    max_bytes = app.config.get("LIST_CACHE_BYTES", 0)
+    if not max_bytes:
+        return None
+    max_age = app.config["LIST_CACHE_SECONDS"]
+    if _cache is None or (_cache.max_bytes, _cache.max_age) != (max_bytes, max_age):
+        _cache = ListCache(max_bytes, max_age)
+    return _cache
@@ -3,26 +3,53 @@ Models for Product
 
 All of the models are stored in this module
 """
+# pylint: disable=too-many-lines
+import itertools
 import logging
+import threading
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
 from enum import Enum
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from service import price_stats
+from service.common import schema, sharding, tracing
 
 logger = logging.getLogger("flask.app")
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+# INSERT statements that can add to a row that exists instead, by dialect
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
+# Create the SQLAlchemy object, initialized on the app by create_app()
+db = SQLAlchemy(session_options={"class_": sharding.RoutingSession})
 
-# Function to initialize the database
-def init_db(app):
-    """Initializes the SQLAlchemy app"""
-    Product.init_db(app)
+# The largest price a Numeric(12, 2) column holds, larger ones overflow on PostgreSQL
+MAX_PRICE = Decimal("9999999999.99")
 
 
-class DataValidationError(Exception):
+class DataValidationError(schema.SchemaError):
     """Used for an data validation errors when deserializing"""
 
 
+def parse_price(value) -> Decimal:
+    """Converts a price to a Decimal rounded to the cent"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+        raise DataValidationError("Invalid type for decimal [price]: " + str(type(value)))
+    try:
+        price = Decimal(str(value)).quantize(price_stats.CENT, ROUND_HALF_EVEN)
+    except InvalidOperation as error:
+        raise DataValidationError(f"Invalid price: {value}") from error
+    if not price.is_finite():
+        raise DataValidationError(f"Invalid price: {value}")
+    if abs(price) > MAX_PRICE:
+        raise DataValidationError(f"Invalid price: {value} is beyond {MAX_PRICE}")
+    return price
+
+
 class Category(Enum):
     """Enumeration of valid Product Category"""
 
@@ -35,21 +62,52 @@ class Category(Enum):
     OTHERS = 100
 
 
+# Columns that list queries can be sorted by
+SORT_FIELDS = ("id", "name", "price")
+
+# What every write path accepts as a Product, checked before anything is stored
+PRODUCT_SCHEMA = schema.Schema(
+    "Product",
+    schema.Field("name", str, max_length=63),
+    schema.Field("description", str, required=False, nullable=True),
+    schema.Field("price", convert=parse_price),
+    schema.Field("available", bool),
+    schema.Field("image_url", str, required=False, nullable=True),
+    schema.Field("category", choices=Category),
+    error=DataValidationError,
+)
+
+
 class Product(db.Model):
     """
     Class that represents a Product
     """
 
-    app = None
+    # Indexes serving the sorted, keyset-paginated list queries
+    __table_args__ = (
+        db.Index("ix_product_price_id", "price", "id"),
+        db.Index("ix_product_name_id", "name", "id"),
+        db.Index("ix_product_category_price_id", "category", "price", "id"),
+        db.Index("ix_product_available_price_id", "available", "price", "id"),
+        # never reuse the id of a Product that was moved to the archive,
+        # the rows live on the databases in DATABASE_SHARD_URIS if there are any
+        {"sqlite_autoincrement": True, "info": {"sharded": True}},
+    )
 
     # Table Schema
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63))
+    name = db.Column(db.String(63), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    price = db.Column(db.Float, nullable=False)
-    available = db.Column(db.Boolean(), nullable=False, default=True)
+    # exact to the cent, see `flask db-upgrade` for databases made with a float column
+    price = db.Column(db.Numeric(12, 2), nullable=False)
+    # active_history keeps the old values around so facet counts can be moved
+    available = db.column_property(
+        db.Column(db.Boolean(), nullable=False, default=True), active_history=True
+    )
     image_url = db.Column(db.Text, nullable=True)
-    category = db.Column(db.Enum(Category), nullable=True)
+    category = db.column_property(
+        db.Column(db.Enum(Category), nullable=True), active_history=True
+    )
 
     def __repr__(self):
         return f"<Product {self.name} id=[{self.id}]>"
@@ -66,6 +124,7 @@ class Product(db.Model):
             "category": self.category.name,
         }
 
+    @tracing.traced
     def create(self):
         """
         Creates a Product to the database
@@ -75,6 +134,7 @@ class Product(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    @tracing.traced
     def update(self):
         """
         Updates a Product to the database
@@ -84,6 +144,7 @@ class Product(db.Model):
             raise DataValidationError("Update called with empty ID field")
         db.session.commit()
 
+    @tracing.traced
     def delete(self):
         """Removes a Product from the data store"""
         logger.info("Deleting %s", self.name)
@@ -96,48 +157,24 @@ class Product(db.Model):
             "id": self.id,
             "name": self.name,
             "description": self.description,
-            "price": self.price,
+            "price": float(self.price),
             "available": self.available,
             "image_url": self.image_url,
             "category": self.category.name,  # convert enum to string
         }
 
-    def deserialize(self, data):
+    @tracing.traced
+    def deserialize(self, data, partial: bool = False):
         """
         Deserializes a Product from a dictionary
 
         Args:
             data (dict): A dictionary containing the resource data
+            partial (bool): only change the fields present in data
         """
-        try:
-            self.name = data["name"]
-            self.description = data["description"]
-            self.price = data["price"]
-            self.description = data["description"]
-            if isinstance(data["available"], bool):
-                self.available = data["available"]
-            else:
-                raise DataValidationError(
-                    "Invalid type for boolean [available]: "
-                    + str(type(data["available"]))
-                )
-            self.image_url = data["image_url"]
-            self.category = getattr(
-                Category, data["category"]
-            )  # create enum from string
-        except AttributeError as error:
-            raise DataValidationError("Invalid attribute: " + error.args[0]) from error
-        except KeyError as error:
-            raise DataValidationError(
-                "Invalid Product: missing " + error.args[0]
-            ) from error
-        except TypeError as error:
-            raise DataValidationError(
-                "Invalid Product: body of request contained bad or no data "
-                + str(error)
-            ) from error
-        return self
+        return PRODUCT_SCHEMA.apply(self, data, partial)
 
+    @tracing.traced
     def change_availability(self):
         """
         Changes the availability of the Product
@@ -146,65 +183,40 @@ class Product(db.Model):
         db.session.commit()
         logger.info("Availability changed for %s", self.name)
 
-    # # flake8: noqa: C901
-    # def deserialize_update(self, data):
-    #     """
-    #     Deserializes a Product from a dictionary
-
-    #     Args:
-    #         data (dict): A dictionary containing the resource data
-    #         it only contain keys of fields to be updated
-    #     """
-    #     try:
-    #         if "name" in data:
-    #             self.name = data["name"]
-    #         if "description" in data:
-    #             self.description = data["description"]
-    #         if "price" in data:
-    #             self.price = data["price"]
-    #         if "description" in data:
-    #             self.description = data["description"]
-    #         if "available" in data:
-    #             if isinstance(data["available"], bool):
-    #                 self.available = data["available"]
-    #             else:
-    #                 raise DataValidationError(
-    #                     "Invalid type for boolean [available]: "
-    #                     + str(type(data["available"]))
-    #                 )
-    #         if "image_url" in data:
-    #             self.image_url = data["image_url"]
-    #         if "category" in data:
-    #             self.category = getattr(
-    #                 Category, data["category"]
-    #             )  # create enum from string
-    #     except AttributeError as error:
-    #         raise DataValidationError("Invalid attribute: " + error.args[0]) from error
-    #     return self
-
     @classmethod
-    def init_db(cls, app):
-        """Initializes the database session"""
-        logger.info("Initializing database")
-        cls.app = app
-        # This is where we initialize SQLAlchemy from the Flask app
-        db.init_app(app)
-        app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+    def read_query(cls):
+        """Returns a query that may be answered by a read replica"""
+        return cls.query.execution_options(replica=True)
+
+    @staticmethod
+    def shard_options(by_id) -> dict:
+        """Returns the execution options that read a Product id on its shard"""
+        shards = sharding.get_shards()
+        return {} if shards is None else {"shard": shards.index_for(by_id)}
 
     @classmethod
+    @tracing.traced
     def all(cls):
         """Returns all of the Product in the database"""
         logger.info("Processing all Product")
-        return cls.query.all()
+        return cls.read_query().all()
 
     @classmethod
-    def find(cls, by_id):
-        """Finds a Product by it's ID"""
+    @tracing.traced
+    def find(cls, by_id, restore: bool = False):
+        """Finds a Product by it's ID, looking in the archive if it isn't active
+
+        :param restore: move an archived Product back to the product table so
+            it can be changed, otherwise it is returned as an ArchivedProduct
+        """
         logger.info("Processing lookup for id %s ...", by_id)
-        return cls.query.get(by_id)
+        product = cls.read_query().execution_options(**cls.shard_options(by_id)).get(by_id)
+        if product is None:
+            product = ArchivedProduct.restore(by_id) if restore else ArchivedProduct.find(by_id)
+        return product
 
     @classmethod
+    @tracing.traced
     def find_or_404(cls, product_id: int):
         """Find a Product by it's id
 
@@ -216,64 +228,733 @@ class Product(db.Model):
 
         """
         logger.info("Processing lookup or 404 for id %s ...", product_id)
-        return cls.query.get_or_404(product_id)
+        return cls.read_query().execution_options(**cls.shard_options(product_id)).get_or_404(product_id)
 
     @classmethod
-    def find_by_name(cls, name):
-        """Returns all Product with the given name
+    @tracing.traced
+    def find_by_name(cls, name) -> list:
+        """Returns all Product with the given name, archived ones included
 
         Args:
             name (string): the name of the Product you want to match
         """
         logger.info("Processing name query for %s ...", name)
-        return cls.query.filter(cls.name == name)
+        return cls._find_with_archive(name=name)
 
     @classmethod
+    @tracing.traced
     def find_by_availability(cls, available: bool = True) -> list:
         """Returns all Products by their availability
 
         :param available: True for products that are available
         :type available: str
 
-        :return: a collection of Products that are available
+        :return: a collection of Products that are available, or of the
+            unavailable ones including the archived Products
         :rtype: list
 
         """
         logger.info("Processing available query for %s ...", available)
-        return cls.query.filter(cls.available == available)
+        return cls._find_with_archive(available=available)
 
     @classmethod
+    @tracing.traced
     def find_by_category(cls, category: Category) -> list:
         """Returns all of the Pets in a category
 
         :param category: the category of the Pets you want to match
         :type category: Category Enum
 
-        :return: a collection of Pets in that category
+        :return: a collection of Pets in that category, archived ones included
         :rtype: list
 
         """
         logger.info("Processing category query for %s ...", category)
-        return cls.query.filter(cls.category == category)
+        return cls._find_with_archive(category=category)
 
     @classmethod
+    def _find_with_archive(cls, **filters) -> list:
+        """Returns the active Products matching filters followed by the archived ones"""
+        products = cls.read_query().filter_by(**filters).all()
+        if filters.get("available") is not True:  # archived Products are never available
+            products += ArchivedProduct.query.execution_options(replica=True).filter_by(**filters).all()
+        return products
+
+    # pylint: disable=too-many-arguments
+    @classmethod
+    @tracing.traced
+    def search(
+        cls,
+        category=None,
+        name=None,
+        available=None,
+        min_price=None,
+        max_price=None,
+        sort="id",
+        after=None,
+        limit=None,
+    ):
+        """Returns the Products matching every given filter in sort order
+
+        :param category: the name of a Category to match
+        :param name: the exact name to match
+        :param available: True or False to match on availability
+        :param min_price: the lowest price to include
+        :param max_price: the highest price to include
+        :param sort: one of SORT_FIELDS, prefixed with "-" for descending order
+        :param after: the (sort value, id) of the last Product of the previous page
+        :param limit: the most Products to return
+
+        :return: a query of Products ordered by the sort field, then id, or
+            a list of them merged from every shard when the table is sharded
+        :rtype: Query
+
+        """
+        logger.info("Processing search query sorted by %s ...", sort)
+        descending = sort.startswith("-")
+        field = sort.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise DataValidationError(f"Invalid sort field: {field}")
+        query = cls.filtered(category, name, available, min_price, max_price)
+        order = [cls.id] if field == "id" else [getattr(cls, field), cls.id]
+        if after is not None:
+            position = db.tuple_(*order)
+            after = tuple(after[-len(order):])
+            query = query.filter(position < after if descending else position > after)
+        names = [column.key for column in order]
+        if descending:
+            order = [column.desc() for column in order]
+        query = query.order_by(*order)
+        if limit is not None:
+            query = query.limit(limit)
+        if sharding.get_shards() is not None:
+            return cls._merge_shards(query, names, descending, limit)
+        return query
+
+    @staticmethod
+    def _merge_shards(query, names: list, descending: bool, limit) -> list:
+        """Runs a sorted search on every shard and merges the Products in its order"""
+
+        def position(row):
+            values = [getattr(row[0], name) for name in names]
+            return tuple((value is not None, value) for value in values)  # NULLs first
+
+        return [row[0] for row in sharding.fan_out(query.statement, position, descending, limit)]
+
+    # pylint: disable=too-many-arguments
+    @classmethod
+    def filtered(cls, category=None, name=None, available=None, min_price=None, max_price=None):
+        """Returns a query of the Products matching every given filter
+
+        :param category: the name of a Category to match
+        :param name: the exact name to match
+        :param available: True or False to match on availability
+        :param min_price: the lowest price to include
+        :param max_price: the highest price to include
+
+        """
+        query = cls.read_query()
+        if category is not None:
+            query = query.filter(cls.category == category)
+        if name is not None:
+            query = query.filter(cls.name == name)
+        if available is not None:
+            query = query.filter(cls.available == available)
+        if min_price is not None:
+            query = query.filter(cls.price >= min_price)
+        if max_price is not None:
+            query = query.filter(cls.price <= max_price)
+        return query
+
+    @classmethod
+    @tracing.traced
+    def price_summary(cls, percentiles=price_stats.DEFAULT_PERCENTILES, **filters) -> dict:
+        """Returns count, min, max, sum, average and percentiles of the prices
+
+        Everything is computed in SQL on PostgreSQL. Other databases compute
+        the aggregates in SQL and the percentiles from the fetched prices.
+        Sharded prices are fetched from every shard and summarized together.
+
+        :param percentiles: the percentiles to compute, from 0 to 100
+        :param filters: the filters of Product.filtered
+        :return: the statistics of all matching Products and of each category
+        """
+        # pylint: disable=not-callable
+        logger.info("Processing price summary ...")
+        query = cls.filtered(**filters)
+        if sharding.get_shards() is not None:
+            return cls._sharded_price_summary(query, percentiles)
+        columns = [
+            func.count(cls.id),
+            func.min(cls.price),
+            func.max(cls.price),
+            func.sum(cls.price),
+            func.avg(cls.price),
+        ]
+        in_sql = db.engine.dialect.name == "postgresql"
+        if in_sql:
+            columns += [func.percentile_cont(p / 100).within_group(cls.price) for p in percentiles]
+        else:
+            import numpy  # pylint: disable=import-outside-toplevel
+
+            rows = query.with_entities(cls.category, cls.price).all()
+            keys = numpy.array([row[0].name if row[0] else "" for row in rows])
+            cents = numpy.array([round(row[1] * 100) for row in rows], dtype=numpy.int64)
+
+        def build(row, category=None):
+            if in_sql:
+                values = dict(zip(percentiles, row[5:]))
+            else:
+                selected = cents if category is None else cents[keys == category.name]
+                values = price_stats.cents_percentiles(selected, percentiles)
+            return price_stats.summary(*row[:5], values)
+
+        totals = query.with_entities(*columns).one()
+        groups = query.with_entities(cls.category, *columns).group_by(cls.category).all()
+        return {
+            "all": build(totals),
+            "categories": {row[0].name: build(row[1:], row[0]) for row in groups if row[0] is not None},
+        }
+
+    @classmethod
+    def _sharded_price_summary(cls, query, percentiles) -> dict:
+        """Returns the price statistics of a filtered query over every shard"""
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        rows = sharding.fan_out(query.with_entities(cls.category, cls.price).statement)
+        keys = numpy.array([row[0].name if row[0] else "" for row in rows])
+        cents = numpy.array([round(row[1] * 100) for row in rows], dtype=numpy.int64)
+        groups = price_stats.summarize_groups(keys, cents, percentiles)
+        return {
+            "all": price_stats.summarize_cents(cents, percentiles),
+            "categories": {key: stats for key, stats in groups.items() if key},
+        }
+
+    @classmethod
+    @tracing.traced
     def create_multiple_products(cls, products_data):
         """
-        Adds multiple products to the database.
+        Adds multiple products to the database, or none if any of them is invalid.
         :param products_data: List of dictionaries, where each dictionary contains data for one product.
         """
-        products = []
-        for data in products_data:
-            product = cls(
-                name=data["name"],
-                description=data.get("description", None),
-                price=data["price"],
-                available=data["available"],
-                image_url=data.get("image_url", None),
-                category=data.get("category", None),
-            )
-            products.append(product)
+        valid, errors = PRODUCT_SCHEMA.validate_many(products_data)
+        if errors:
+            raise DataValidationError(PRODUCT_SCHEMA.message(errors), errors)
+        products = [cls(**values) for _, values in valid]
 
         db.session.add_all(products)
         db.session.commit()
         return products
+
+
+class ProductFacet(db.Model):
+    """
+    Running count of Products for each category and availability
+
+    The counts are moved on every ORM flush that adds, changes or deletes a
+    Product, so reading them costs one row per category. Bulk loads that
+    bypass the ORM must call rebuild() afterwards.
+    """
+
+    __tablename__ = "product_facets"
+
+    # Table Schema
+    category = db.Column(db.String(32), primary_key=True)  # "" when uncategorized
+    available = db.Column(db.Boolean(), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ProductFacet {self.category} available={self.available} count={self.count}>"
+
+    @staticmethod
+    def key(category, available) -> tuple:
+        """Returns the facet key for a category and availability"""
+        if isinstance(category, Category):
+            category = category.name
+        return (category or "", bool(available))
+
+    @classmethod
+    def apply(cls, session, deltas: dict):
+        """Adds the count deltas to the facet rows inside the current transaction
+        :param session: the session whose transaction should include the change
+        :param deltas: a dictionary of facet key to the change in count
+        """
+        table = cls.__table__
+        # one statement per row, so that writers adding the first Product of a facet can't both insert it
+        insert = UPSERTS[session.get_bind(mapper=cls.__mapper__).dialect.name]
+        for (category, available), delta in deltas.items():
+            if not delta:
+                continue
+            statement = insert(table).values(category=category, available=available, count=delta)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[table.c.category, table.c.available],
+                    set_={"count": table.c.count + statement.excluded.count},
+                )
+            )
+
+    @classmethod
+    def rebuild(cls):
+        """Recounts every facet from the Product table"""
+        logger.info("Rebuilding product facets")
+        db.session.execute(cls.__table__.delete())
+        rows = db.session.execute(
+            db.select(
+                Product.category, Product.available, func.count()  # pylint: disable=not-callable
+            ).group_by(Product.category, Product.available)
+        ).all()
+        counts = {}
+        for category, available, count in rows:  # a row per shard and facet when sharded
+            key = cls.key(category, available)
+            counts[key] = counts.get(key, 0) + count
+        for (category, available), count in counts.items():
+            db.session.add(cls(category=category, available=available, count=count))
+        db.session.commit()
+
+    @classmethod
+    def counts(cls) -> dict:
+        """Returns the Product counts by category and by availability"""
+        logger.info("Processing facet counts")
+        by_category = {category.name: 0 for category in Category}
+        by_available = {"true": 0, "false": 0}
+        total = 0
+        for facet in cls.query.execution_options(replica=True).all():
+            if facet.category:
+                by_category[facet.category] = by_category.get(facet.category, 0) + facet.count
+            by_available["true" if facet.available else "false"] += facet.count
+            total += facet.count
+        return {"total": total, "category": by_category, "available": by_available}
+
+
+@event.listens_for(Session, "after_flush")
+def _update_facets(session, _flush_context):
+    """Moves the facet counts for every Product written by a flush"""
+    deltas = {}
+
+    def move(key, delta):
+        deltas[key] = deltas.get(key, 0) + delta
+
+    for product in session.new:
+        if isinstance(product, Product):
+            move(ProductFacet.key(product.category, product.available), 1)
+    for product in session.deleted:
+        if isinstance(product, Product):
+            move(ProductFacet.key(product.category, product.available), -1)
+    for product in session.dirty:
+        if not isinstance(product, Product) or product in session.deleted:
+            continue
+        category = get_history(product, "category")
+        available = get_history(product, "available")
+        if not (category.has_changes() or available.has_changes()):
+            continue
+        old_category = (category.deleted or category.unchanged or [None])[0]
+        old_available = (available.deleted or available.unchanged or [None])[0]
+        move(ProductFacet.key(old_category, old_available), -1)
+        move(ProductFacet.key(product.category, product.available), 1)
+    if deltas:
+        ProductFacet.apply(session, deltas)
+
+
+class ChangeOperation(Enum):
+    """Enumeration of the kinds of ProductChange"""
+
+    CREATE = 0
+    UPDATE = 1
+    DELETE = 2
+    RESYNC = 3  # a bulk load bypassed the change log, consumers must re-read everything
+
+
+class ProductChange(db.Model):
+    """
+    Class that represents one entry in the Product change log
+
+    Every ORM flush that writes a Product appends an entry in the same
+    transaction, so consumers can follow the catalog by reading the entries
+    after the last seq they saw. seq is assigned at insert time, so an entry
+    from a transaction that commits late can appear behind a seq a consumer
+    has already read; consumers that need every entry should re-read a short
+    window behind their position.
+    """
+
+    __tablename__ = "product_changes"
+
+    # Table Schema
+    seq = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    product_id = db.Column(db.Integer, nullable=True)
+    operation = db.Column(db.Enum(ChangeOperation), nullable=False)
+    data = db.Column(db.JSON, nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<ProductChange {self.seq} {self.operation.name} id=[{self.product_id}]>"
+
+    def serialize(self):
+        """Serializes a ProductChange into a dictionary"""
+        return {
+            "seq": self.seq,
+            "product_id": self.product_id,
+            "operation": self.operation.name,
+            "data": self.data,
+            "changed_at": self.changed_at.isoformat(),
+        }
+
+    @staticmethod
+    def product_data(product: Product) -> dict:
+        """Returns the serialized form of a Product as it is being flushed"""
+        category = product.category
+        return {
+            "id": product.id,
+            "name": product.name,
+            "description": product.description,
+            "price": float(product.price) if product.price is not None else None,
+            "available": product.available,
+            "image_url": product.image_url,
+            "category": category.name if isinstance(category, Category) else category,
+        }
+
+    @classmethod
+    def since(cls, seq: int, limit: int) -> list:
+        """Returns up to limit changes after seq, oldest first"""
+        logger.info("Processing changes since %s ...", seq)
+        return cls.query.filter(cls.seq > seq).order_by(cls.seq).limit(limit).all()
+
+    @classmethod
+    def last_seq(cls, replica: bool = False) -> int:
+        """Returns the newest seq, or 0 if the log is empty
+        :param replica: read it where the read-only finders read
+        """
+        query = db.session.query(func.max(cls.seq))  # pylint: disable=not-callable
+        return query.execution_options(replica=replica).scalar() or 0
+
+    @classmethod
+    def record_resync(cls):
+        """Records that the catalog changed without individual entries"""
+        logger.info("Recording a catalog resync")
+        db.session.execute(cls.__table__.insert().values(operation=ChangeOperation.RESYNC))
+        db.session.commit()
+
+    @classmethod
+    def prune(cls, before: datetime) -> int:
+        """Deletes the changes made before a point in time"""
+        logger.info("Pruning changes before %s", before)
+        count = db.session.query(cls).filter(cls.changed_at < before).delete()
+        db.session.commit()
+        return count
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, _flush_context):
+    """Appends a change log entry for every Product written by a flush"""
+    changes = []
+    for product in session.new:
+        if isinstance(product, Product):
+            changes.append((product, ChangeOperation.CREATE))
+    for product in session.dirty:
+        if (
+            isinstance(product, Product)
+            and product not in session.deleted
+            and session.is_modified(product, include_collections=False)
+        ):
+            changes.append((product, ChangeOperation.UPDATE))
+    for product in session.deleted:
+        if isinstance(product, Product):
+            changes.append((product, ChangeOperation.DELETE))
+    if changes:
+        session.execute(
+            ProductChange.__table__.insert(),
+            [
+                {
+                    "product_id": product.id,
+                    "operation": operation,
+                    "data": None
+                    if operation == ChangeOperation.DELETE
+                    else ProductChange.product_data(product),
+                }
+                for product, operation in changes
+            ],
+        )
+
+
+# Columns copied between the product table and the archive
+ARCHIVED_COLUMNS = ("id", "name", "description", "price", "available", "image_url", "category")
+
+
+class ArchivedProduct(db.Model):
+    """
+    Class that represents a Product moved out of the product table
+
+    Long unavailable Products would otherwise make up most of the product
+    table and of every index the list queries scan. `flask products-archive`
+    moves them here, keeping their id. Product.find still finds them and
+    moves them back when they are about to change, and the find_by finders
+    include them. Listings, facets, stats and snapshots only cover the
+    active Products in the product table.
+    """
+
+    __tablename__ = "product_archive"
+
+    # Table Schema
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(63), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    price = db.Column(db.Numeric(12, 2), nullable=False)
+    available = db.Column(db.Boolean(), nullable=False)
+    image_url = db.Column(db.Text, nullable=True)
+    category = db.Column(db.Enum(Category), nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ArchivedProduct {self.name} id=[{self.id}]>"
+
+    serialize = Product.serialize  # archived Products look the same in the API
+
+    @classmethod
+    def find(cls, by_id):
+        """Finds an archived Product by it's ID"""
+        logger.info("Processing archive lookup for id %s ...", by_id)
+        return cls.query.execution_options(replica=True).get(by_id)
+
+    @classmethod
+    def archive(cls, before: datetime, limit: int) -> int:
+        """Moves unavailable Products that haven't changed since a point in time
+
+        Products without any change in the log, which may have been pruned,
+        count as unchanged. The facet counts are not moved, run
+        ProductFacet.rebuild() when done.
+
+        :param before: only Products without changes after this are moved
+        :param limit: the most Products to move in this transaction
+        :return: the number of Products moved
+        """
+        product = Product.__table__
+        changed = (
+            db.select(ProductChange.seq)
+            .where(ProductChange.product_id == product.c.id, ProductChange.changed_at >= before)
+            .exists()
+        )
+        ids = db.session.execute(
+            db.select(product.c.id)
+            .where(product.c.available.is_(False), ~changed)
+            .order_by(product.c.id)
+            .limit(limit)
+        ).scalars().all()
+        if not ids:
+            return 0
+        logger.info("Archiving %s products", len(ids))
+        db.session.execute(
+            cls.__table__.insert().from_select(
+                ARCHIVED_COLUMNS + ("archived_at",),
+                db.select(
+                    *[product.c[column] for column in ARCHIVED_COLUMNS],
+                    db.literal(datetime.utcnow(), db.DateTime),
+                ).where(product.c.id.in_(ids)),
+            )
+        )
+        db.session.execute(product.delete().where(product.c.id.in_(ids)))
+        db.session.commit()
+        return len(ids)
+
+    @classmethod
+    def restore(cls, by_id):
+        """Moves an archived Product back to the product table
+
+        :return: the restored Product, or None if it isn't in the archive
+        """
+        archived = db.session.get(cls, by_id)
+        if archived is None:
+            return None
+        logger.info("Restoring %s from the archive", archived.name)
+        shards = sharding.get_shards()
+        db.session.execute(
+            Product.__table__.insert().values(
+                {column: getattr(archived, column) for column in ARCHIVED_COLUMNS}
+            ),
+            bind_arguments={} if shards is None else {"bind": shards.engine_for(by_id)},
+        )
+        # logged as created, so that the change feed and cached listings see it come back
+        ProductFacet.apply(db.session, {ProductFacet.key(archived.category, archived.available): 1})
+        db.session.execute(
+            ProductChange.__table__.insert().values(
+                product_id=by_id,
+                operation=ChangeOperation.CREATE,
+                data=ProductChange.product_data(archived),
+            )
+        )
+        db.session.delete(archived)
+        db.session.commit()
+        return db.session.get(Product, by_id, execution_options=Product.shard_options(by_id))
+
+
+class ProductId(db.Model):
+    """
+    The next free Product id while the product table is sharded
+
+    The shards can't number new Products themselves, as each would hand out
+    the same ids. Each worker reserves a block of ids from this single row
+    on the primary and numbers new Products from it before they are flushed.
+    The first block starts after the Products already on the primary.
+    """
+
+    __tablename__ = "product_ids"
+
+    BLOCK = 100  # ids reserved at a time
+
+    # Table Schema
+    id = db.Column(db.Integer, primary_key=True)  # the only row is 1
+    next_id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), nullable=False)
+
+    _free = iter(())  # the rest of the block of this worker
+    _lock = threading.Lock()
+
+    @classmethod
+    def take(cls, count: int) -> list:
+        """Returns count unused Product ids"""
+        with cls._lock:
+            ids = list(itertools.islice(cls._free, count))
+            missing = count - len(ids)
+            if missing:
+                size = max(missing, cls.BLOCK)
+                first = cls.reserve(size)
+                block = iter(range(first, first + size))
+                ids += itertools.islice(block, missing)
+                cls._free = block
+        return ids
+
+    @classmethod
+    def reserve(cls, size: int) -> int:
+        """Reserves size ids in a transaction of its own
+        :return: the first reserved id
+        """
+        table = cls.__table__
+        while True:
+            with db.engine.begin() as connection:
+                moved = connection.execute(
+                    table.update().where(table.c.id == 1).values(next_id=table.c.next_id + size)
+                )
+                if moved.rowcount:
+                    return connection.execute(db.select(table.c.next_id)).scalar() - size
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(table.insert().values(id=1, next_id=cls._first_free(connection)))
+            except IntegrityError:
+                pass  # another worker made the row first
+
+    @staticmethod
+    def _first_free(connection) -> int:
+        """Returns the id after those of the Products on the primary"""
+        # pylint: disable=not-callable
+        last = max(
+            connection.execute(db.select(func.max(table.c.id))).scalar() or 0
+            for table in (Product.__table__, ArchivedProduct.__table__)
+        )
+        return last + 1
+
+    @classmethod
+    def advance(cls, past: int):
+        """Makes sure no id up to past is handed out, after Products were loaded with their ids"""
+        with cls._lock:
+            cls.reserve(0)
+            table = cls.__table__
+            with db.engine.begin() as connection:
+                connection.execute(
+                    table.update().where(table.c.next_id <= past).values(next_id=past + 1)
+                )
+            cls._free = iter(())
+
+
+@event.listens_for(Session, "before_flush")
+def _number_sharded_products(session, _flush_context, _instances):
+    """Gives new Products an id before the flush writes them to their shard"""
+    if sharding.get_shards() is None:
+        return
+    products = [product for product in session.new if isinstance(product, Product) and product.id is None]
+    if products:
+        for product, product_id in zip(products, ProductId.take(len(products))):
+            product.id = product_id
+
+
+class ImportStatus(Enum):
+    """Enumeration of the states of an ImportJob"""
+
+    PENDING = 0
+    RUNNING = 1
+    COMPLETED = 2
+    FAILED = 3
+
+
+class ImportJob(db.Model):
+    """
+    Class that represents a background bulk import of Products
+    """
+
+    __tablename__ = "import_jobs"
+
+    # Table Schema
+    id = db.Column(db.Integer, primary_key=True)
+    format = db.Column(db.String(16), nullable=False)
+    status = db.Column(
+        db.Enum(ImportStatus), nullable=False, default=ImportStatus.PENDING
+    )
+    total_rows = db.Column(db.Integer, nullable=True)
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    created_rows = db.Column(db.Integer, nullable=False, default=0)
+    failed_rows = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.JSON, nullable=False, default=list)
+    message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<ImportJob {self.format} id=[{self.id}] {self.status.name}>"
+
+    def create(self):
+        """
+        Creates an ImportJob in the database
+        """
+        logger.info("Creating import job for %s payload", self.format)
+        self.id = None  # pylint: disable=invalid-name
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        """
+        Updates an ImportJob in the database
+        """
+        if not self.id:
+            raise DataValidationError("Update called with empty ID field")
+        db.session.commit()
+
+    @property
+    def rows_per_second(self):
+        """Returns the import throughput so far, or None if not started"""
+        if not self.started_at:
+            return None
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        if elapsed <= 0:
+            return None
+        return round(self.processed_rows / elapsed, 2)
+
+    def serialize(self):
+        """Serializes an ImportJob into a dictionary"""
+        return {
+            "id": self.id,
+            "format": self.format,
+            "status": self.status.name,
+            "total_rows": self.total_rows,
+            "processed_rows": self.processed_rows,
+            "created_rows": self.created_rows,
+            "failed_rows": self.failed_rows,
+            "rows_per_second": self.rows_per_second,
+            "errors": self.errors,
+            "message": self.message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    @classmethod
+    def find(cls, by_id):
+        """Finds an ImportJob by it's ID"""
+        logger.info("Processing import job lookup for id %s ...", by_id)
+        return cls.query.get(by_id)
@@ -0,0 +1,88 @@
+"""
+Price Statistics
+
+Summaries of Product prices for the /products/stats endpoint. The database
+computes them in SQL where it can. This module builds the response and
+fills in with NumPy whatever the database can't compute: percentiles on
+databases other than PostgreSQL, and everything when serving from the
+catalog snapshot. NumPy works on whole cents held as 64-bit integers, so
+counts, extremes and sums are exact.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+
+CENT = Decimal("0.01")
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0)
+
+
+def to_number(value):
+    """Rounds an amount to whole cents for the JSON response"""
+    if value is None:
+        return None
+    return float(Decimal(str(value)).quantize(CENT, ROUND_HALF_EVEN))
+
+
+def to_decimal(value) -> Decimal:
+    """Returns an amount as the exact Decimal the database stores, even from a float"""
+    return Decimal(str(value)).quantize(CENT, ROUND_HALF_EVEN)
+
+
+def percentile_key(percentile: float) -> str:
+    """Returns the response key of a percentile, such as p50 or p99.9"""
+    return f"p{percentile:g}"
+
+
+def summary(count, minimum, maximum, total, average, percentiles: dict) -> dict:  # pylint: disable=too-many-arguments
+    """Builds the statistics of one group of prices
+    :param percentiles: the value of each requested percentile
+    """
+    result = {
+        "count": count,
+        "min": to_number(minimum),
+        "max": to_number(maximum),
+        "sum": to_number(total),
+        "avg": to_number(average),
+    }
+    for percentile, value in percentiles.items():
+        result[percentile_key(percentile)] = to_number(value)
+    return result
+
+
+def cents_percentiles(cents, percentiles) -> dict:
+    """Interpolates percentiles like PostgreSQL percentile_cont
+    :param cents: a NumPy array of prices in cents
+    :return: the value of each percentile in currency units
+    """
+    import numpy  # pylint: disable=import-outside-toplevel  # only needed off PostgreSQL
+
+    if len(cents) == 0 or not percentiles:
+        return {percentile: None for percentile in percentiles}
+    values = numpy.percentile(cents, list(percentiles), method="linear")
+    return {percentile: value / 100 for percentile, value in zip(percentiles, values)}
+
+
+def summarize_cents(cents, percentiles) -> dict:
+    """Builds the statistics of an array of prices in cents"""
+    if len(cents) == 0:
+        return summary(0, None, None, None, None, cents_percentiles(cents, percentiles))
+    total = int(cents.sum())
+    return summary(
+        len(cents),
+        int(cents.min()) / 100,
+        int(cents.max()) / 100,
+        Decimal(total) / 100,
+        Decimal(total) / len(cents) / 100,
+        cents_percentiles(cents, percentiles),
+    )
+
+
+def summarize_groups(keys, cents, percentiles) -> dict:
+    """Builds the statistics of every group of prices
+    :param keys: a NumPy array with the group of each price
+    :param cents: a NumPy array of prices in cents
+    :return: the statistics of each group present in keys
+    """
+    import numpy  # pylint: disable=import-outside-toplevel
+
+    return {
+        key.item(): summarize_cents(cents[keys == key], percentiles) for key in numpy.unique(keys)
+    }
@@ -0,0 +1,111 @@
+"""
+Sampling Profiler
+
+Finds CPU hot spots in a running worker without restarting it. The
+sampler wakes up every few milliseconds, records the Python stack of
+every other thread and counts identical stacks. The result is written in
+the collapsed format read by flamegraph.pl, speedscope and similar tools:
+one line per stack, frames separated by ``;`` from the thread down to the
+innermost call, followed by the number of samples.
+
+The sampler holds the GIL while it walks the stacks, which slows the
+threads it watches. It measures how long each sample takes and sleeps
+long enough between samples to keep that cost under ``max_overhead`` of
+the wall clock time.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Innermost frames of threads that are waiting rather than running
+IDLE_FRAMES = frozenset(
+    [
+        ("threading.py", "wait"),
+        ("threading.py", "_wait_for_tstate_lock"),
+        ("queue.py", "get"),
+        ("selectors.py", "select"),
+        ("socket.py", "accept"),
+        ("socketserver.py", "serve_forever"),
+    ]
+)
+
+
+class ProfilerBusy(Exception):
+    """Used when a profile is requested while another one is running"""
+
+
+def frame_label(frame) -> str:
+    """Returns the name of a frame as shown in the flamegraph"""
+    code = frame.f_code
+    path = os.path.join(*code.co_filename.split(os.sep)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def is_idle(frame) -> bool:
+    """Returns True if the innermost frame is waiting on I/O or a lock"""
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class Sampler:
+    """Samples the stacks of the other threads of the process"""
+
+    _lock = threading.Lock()  # one profile at a time per process
+
+    def __init__(self, interval: float = 0.01, max_overhead: float = 0.05, include_idle: bool = False):
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def overhead(self) -> float:
+        """Returns the fraction of the wall clock time spent taking samples"""
+        return self.sampling_time / self.elapsed if self.elapsed else 0.0
+
+    def sample(self):
+        """Records the current stack of every other thread once"""
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if thread_id == own or (not self.include_idle and is_idle(frame)):
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float):
+        """Samples for a number of seconds in the calling thread
+        :raises ProfilerBusy: if another profile is already running
+        """
+        if not self._lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            raise ProfilerBusy("A profile is already running in this worker")
+        try:
+            started = time.perf_counter()
+            deadline = started + seconds
+            while True:
+                before = time.perf_counter()
+                if before >= deadline:
+                    break
+                self.sample()
+                cost = time.perf_counter() - before
+                self.sampling_time += cost
+                # sleep long enough that sampling stays under max_overhead
+                pause = max(self.interval, cost / self.max_overhead - cost)
+                time.sleep(min(pause, max(deadline - time.perf_counter(), 0)))
+            self.elapsed = time.perf_counter() - started
+        finally:
+            self._lock.release()
+        return self
+
+    def collapsed(self) -> str:
+        """Returns the samples in collapsed stack format, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
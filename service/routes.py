@@ -4,18 +4,35 @@ My Service
 Describe what your service does here
 """
 
-from flask import jsonify, request, abort, url_for
-from service.common import status  # HTTP Status Codes
-from service.models import Product, Category
-
-# Import Flask application
-from . import app
+import base64
+import binascii
+import hmac
+import json
+import math
+import time
+from flask import Blueprint, Response, request, abort, url_for, stream_with_context
+from flask import current_app as app  # Import Flask application
+from service.common import media, static_assets, status  # HTTP Status Codes
+from service.models import (
+    db, ArchivedProduct, Product, Category, DataValidationError, ImportJob, ProductChange, ProductFacet,
+    PRODUCT_SCHEMA, SORT_FIELDS, parse_price
+)
+from service import import_jobs, list_cache, price_stats, profiler, snapshot, write_behind
+
+# Registered on the application by create_app(); endpoints are named api.<view>
+api = Blueprint("api", __name__)
+
+# Tells clients that asked for write-behind that their update was buffered
+WRITE_BEHIND_HEADERS = {"Preference-Applied": write_behind.PREFERENCE}
+
+# The categories only change with a deploy, so their body is built once
+CATEGORIES_JSON = json.dumps([category.name for category in Category]).encode("utf-8")
 
 
 ############################################################
 # Health Endpoint
 ############################################################
-@app.route("/health")
+@api.route("/health")
 def health():
     """Health Status"""
     return {"status": "OK"}, status.HTTP_200_OK
@@ -24,7 +41,7 @@ def health():
 ######################################################################
 # GET INDEX
 ######################################################################
-@app.route("/")
+@api.route("/")
 def index():
     """Root URL response"""
     # data = {
@@ -63,7 +80,7 @@ def index():
     #         },
     #     ],
     # }
-    return app.send_static_file("index.html")
+    return static_assets.index_response()
 
 
 ######################################################################
@@ -74,54 +91,173 @@ def index():
 ######################################################################
 # LIST ALL PRODUCTS
 ######################################################################
-@app.route("/products", methods=["GET"])
+@api.route("/products", methods=["GET"])
 def list_products():
-    """Returns all of the Products"""
+    """Returns all of the Products
+
+    Filters: category, name, available, min_price, max_price, over the
+    active Products only, archived ones are never listed
+    Sorting: sort=id|name|price, prefixed with "-" for descending order
+    Paging: limit, plus the cursor from the Link header of the previous page
+    """
     app.logger.info("Request for product list")
-    category = request.args.get("category")
-    name = request.args.get("name")
-    available = request.args.get("available")
-    products = Product.all()
-
-    if category:
-        products_category = Product.find_by_category(category)
-        products = [product for product in products if product in products_category]
-    if name:
-        products_name = Product.find_by_name(name)
-        products = [product for product in products if product in products_name]
-    if available:
-        products_available = Product.find_by_availability(available)
-        products = [product for product in products if product in products_available]
-
-    results = [product.serialize() for product in products]
-    app.logger.info("Returning %d products", len(results))
-    return jsonify(results), status.HTTP_200_OK
+    filters = _list_filters()
+    sort = request.args.get("sort", "id")
+    if sort.lstrip("-") not in SORT_FIELDS:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"sort must be one of {', '.join(SORT_FIELDS)}, optionally prefixed with -",
+        )
+    limit = _int_arg("limit")
+    after = _decode_cursor(request.args.get("cursor"), sort.lstrip("-"))
+
+    media_type = media.accepted()
+    catalog = snapshot.current(app)
+    cache = list_cache.current(app)
+    # every part is parsed and validated above, so the key is hashable and normalized
+    key = (media_type, sort, after, limit, *sorted(filters.items()))
+    generation = None
+    cached = None
+    if cache is not None:
+        # read before the Products so that a write in between makes the entry old
+        if catalog is not None:
+            generation = ("snapshot", catalog.key)
+        else:
+            generation = ("database", ProductChange.last_seq(replica=True))
+        cached = cache.get(key, generation)
+    if cached is not None:
+        body, cursor = cached
+        app.logger.info("Returning cached product list")
+    else:
+        body, cursor = _list_page(catalog, filters, sort, after, limit, media_type)
+        if cache is not None:
+            cache.put(key, generation, body, cursor)
+
+    headers = {}
+    if cursor is not None:
+        args = {**request.args.to_dict(), "cursor": cursor}
+        headers["Link"] = f'<{url_for(".list_products", _external=True, **args)}>; rel="next"'
+    return media.response(body, media_type, headers=headers)
+
+
+######################################################################
+# COUNT PRODUCTS BY CATEGORY AND AVAILABILITY
+######################################################################
+@api.route("/products/facets", methods=["GET"])
+def list_product_facets():
+    """Returns the number of Products per category and per availability"""
+    app.logger.info("Request for product facets")
+    return media.respond(ProductFacet.counts())
+
+
+######################################################################
+# PRICE STATISTICS
+######################################################################
+@api.route("/products/stats", methods=["GET"])
+def list_product_stats():
+    """Returns price statistics of the Products, in total and per category
+
+    Filters: category, name, available, min_price, max_price, over the
+    active Products only, archived ones are never listed
+    Percentiles: percentiles=50,90,99 (each between 0 and 100)
+    """
+    app.logger.info("Request for product price statistics")
+    filters = _list_filters()
+    percentiles = _percentiles_arg()
+    catalog = snapshot.current(app)
+    if catalog is not None:
+        stats = catalog.price_summary(percentiles, **filters)
+    else:
+        stats = Product.price_summary(percentiles, **filters)
+    stats["percentiles"] = [price_stats.percentile_key(percentile) for percentile in percentiles]
+    return media.respond(stats)
+
+
+######################################################################
+# LIST PRODUCT CHANGES
+######################################################################
+@api.route("/products/changes", methods=["GET"])
+def list_product_changes():
+    """
+    Returns the Product changes after the seq given in since
+
+    Pass the returned last_seq as since to get the next batch
+    """
+    app.logger.info("Request for product changes")
+    since = _int_arg("since", minimum=0) or 0
+    page_size = app.config["CHANGES_PAGE_SIZE"]
+    limit = min(_int_arg("limit") or page_size, page_size)
+    changes = ProductChange.since(since, limit)
+    last_seq = changes[-1].seq if changes else since
+    app.logger.info("Returning %d changes", len(changes))
+    return media.respond({"changes": [change.serialize() for change in changes], "last_seq": last_seq})
+
+
+######################################################################
+# STREAM PRODUCT CHANGES
+######################################################################
+@api.route("/products/changes/stream", methods=["GET"])
+def stream_product_changes():
+    """
+    Streams Product changes as Server-Sent Events
+
+    The stream ends after CHANGE_STREAM_SECONDS so that it doesn't hold a
+    worker forever; EventSource clients reconnect with Last-Event-ID and
+    carry on from where they stopped.
+    """
+    app.logger.info("Request to stream product changes")
+    # a reconnecting EventSource resumes from the last id it received
+    since = _int_arg("since", minimum=0, value=request.headers.get("Last-Event-ID")) or 0
+    page_size = app.config["CHANGES_PAGE_SIZE"]
+    poll_seconds = app.config["CHANGE_STREAM_POLL"]
+    deadline = time.monotonic() + app.config["CHANGE_STREAM_SECONDS"]
+
+    def events():
+        position = since
+        yield f"retry: {int(poll_seconds * 1000)}\n\n"
+        while True:
+            changes = ProductChange.since(position, page_size)
+            db.session.commit()  # end the read so the next poll sees new commits
+            for change in changes:
+                position = change.seq
+                yield f"id: {change.seq}\nevent: change\ndata: {json.dumps(change.serialize())}\n\n"
+            if time.monotonic() >= deadline:
+                return
+            if len(changes) < page_size:
+                yield ": keep-alive\n\n"
+                time.sleep(poll_seconds)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 ######################################################################
 # ADD A NEW PRODUCT
 ######################################################################
-@app.route("/products", methods=["POST"])
+@api.route("/products", methods=["POST"])
 def create_products():
     """
     Creates a Product
     This endpoint will create a Product based the data in the body that is posted
     """
     app.logger.info("Request to create a product")
-    check_content_type("application/json")
+    check_content_type(media.JSON, media.MSGPACK)
     product = Product()
-    product.deserialize(request.get_json())
+    product.deserialize(media.request_data())
     product.create()
     message = product.serialize()
-    location_url = url_for("read_products", product_id=product.id, _external=True)
+    location_url = url_for(".read_products", product_id=product.id, _external=True)
     app.logger.info("Product with ID [%s] created.", product.id)
-    return jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
+    return media.respond(message, status.HTTP_201_CREATED, {"Location": location_url})
 
     # try:
     #     product.deserialize(request.get_json())
     #     product.create()
     #     message = product.serialize()
-    #     location_url = url_for("read_products", product_id=product.id, _external=True)
+    #     location_url = url_for(".read_products", product_id=product.id, _external=True)
     #     app.logger.info("Product with ID [%s] created.", product.id)
     #     return jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
     # except sqlalchemy.exc.PendingRollbackError as rollback_error:
@@ -135,27 +271,75 @@ def create_products():
 ######################################################################
 # ADD MULTIPLE NEW PRODUCT
 ######################################################################
-@app.route("/products/collect", methods=["POST"])
+@api.route("/products/collect", methods=["POST"])
 def create_collect_products():
     """
     Creates multiple Products
     This endpoint will create multiple Products based the data in the body that is posted
     """
     app.logger.info("Request to create multiple products")
-    check_content_type("application/json")
-    products_data = request.get_json()
+    check_content_type(media.JSON, media.MSGPACK)
+    products_data = media.request_data()
     products = Product.create_multiple_products(products_data)
-    message = []
-    for product in products:
-        app.logger.info("Product with ID [%s] created.", product.id)
-        message.append(product.serialize())
-    return jsonify(message), status.HTTP_201_CREATED
+    message = [product.serialize() for product in products]
+    app.logger.info("Created %d products.", len(products), extra={"count": len(products)})
+    return media.respond(message, status.HTTP_201_CREATED)
+
+
+######################################################################
+# START A BACKGROUND IMPORT
+######################################################################
+@api.route("/imports", methods=["POST"])
+def create_import():
+    """
+    Starts an Import Job
+    This endpoint queues the posted JSON array, NDJSON or CSV payload for
+    import in the background and returns the job to poll for progress
+    """
+    app.logger.info("Request to start a product import")
+    content_type = request.headers.get("Content-Type", "").split(";")[0].strip()
+    fmt = import_jobs.FORMATS.get(content_type)
+    if not fmt:
+        app.logger.error("Invalid Content-Type for import: %s", content_type)
+        abort(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            f"Content-Type must be one of {', '.join(import_jobs.FORMATS)}",
+        )
+    payload = request.get_data()
+    if not payload.strip():
+        abort(status.HTTP_400_BAD_REQUEST, "Import payload is empty")
+
+    job = ImportJob(format=fmt)
+    job.create()
+    message = job.serialize()
+    import_jobs.submit(job.id, payload)
+    location_url = url_for(".read_import", job_id=job.id, _external=True)
+    app.logger.info("Import job with ID [%s] queued.", job.id)
+    return media.respond(message, status.HTTP_202_ACCEPTED, {"Location": location_url})
+
+
+######################################################################
+# READ AN IMPORT JOB
+######################################################################
+@api.route("/imports/<int:job_id>", methods=["GET"])
+def read_import(job_id):
+    """
+    Read an Import Job
+    This endpoint returns the progress, throughput and row errors of an import
+    """
+    app.logger.info("Request to read import job with id: %s", job_id)
+    job = ImportJob.find(job_id)
+    if not job:
+        abort(
+            status.HTTP_404_NOT_FOUND, f"Import job with id '{job_id}' was not found."
+        )
+    return media.respond(job.serialize())
 
 
 ######################################################################
 # UPDATE A PRODUCT
 ######################################################################
-@app.route("/products/<int:product_id>", methods=["PUT"])
+@api.route("/products/<int:product_id>", methods=["PUT"])
 def update_product(product_id):
     """
     Update a Product
@@ -164,33 +348,38 @@ def update_product(product_id):
     """
 
     app.logger.info("Request to update a product")
-    check_content_type("application/json")
+    check_content_type(media.JSON, media.MSGPACK)
+    return _update(product_id, media.request_data())
 
-    product: Product = Product.find(product_id)
-    if not product:
-        app.logger.info("Invalid product id: %s", product_id)
-        abort(
-            status.HTTP_404_NOT_FOUND, f"There is no exist product with id {product_id}"
-        )
-    product.deserialize(request.get_json())
-    product.update()
-    message = product.serialize()
 
-    return jsonify(message), status.HTTP_200_OK
+######################################################################
+# UPDATE SOME FIELDS OF A PRODUCT
+######################################################################
+@api.route("/products/<int:product_id>", methods=["PATCH"])
+def patch_product(product_id):
+    """
+    Patch a Product
+    This endpoint will change only the fields present in the body of an existing Product
+    or return 404 there is no product with the id
+    """
+    app.logger.info("Request to patch product with id: %s", product_id)
+    check_content_type(media.JSON, media.MSGPACK)
+    return _update(product_id, media.request_data(), partial=True)
 
 
 ######################################################################
 # DELETE A PRODUCT
 ######################################################################
-@app.route("/products/<int:product_id>", methods=["DELETE"])
+@api.route("/products/<int:product_id>", methods=["DELETE"])
 def delete_products(product_id):
     """
     Delete a Product
     This endpoint will delete a Product based the id specified in the path
     """
     app.logger.info("Request to delete product with id: %s", product_id)
-    product = Product.find(product_id)
+    product = Product.find(product_id, restore=True)
     if product:
+        write_behind.flush(product_id)
         product.delete()
 
     app.logger.info("Product with ID [%s] delete complete.", product_id)
@@ -200,13 +389,25 @@ def delete_products(product_id):
 ######################################################################
 # READ A PRODUCT
 ######################################################################
-@app.route("/products/<int:product_id>", methods=["GET"])
+@api.route("/products/<int:product_id>", methods=["GET"])
 def read_products(product_id):
     """
     Read a Product
     This endpoint will Read a Product for detail based the id specified in the path
     """
     app.logger.info("Request to read product with id: %s", product_id)
+    catalog = snapshot.current(app)
+    if catalog is not None:
+        result = catalog.get(product_id)
+        if not result:
+            archived = ArchivedProduct.find(product_id)  # snapshots hold the active Products
+            result = archived.serialize() if archived else None
+        if not result:
+            abort(
+                status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found."
+            )
+        return media.respond(write_behind.with_pending(product_id, result))
+
     product = Product.find(product_id)
     if not product:
         abort(
@@ -214,13 +415,13 @@ def read_products(product_id):
         )
 
     app.logger.info("Returning product with ID [%s].", product_id)
-    return jsonify(product.serialize()), status.HTTP_200_OK
+    return media.respond(write_behind.with_pending(product_id, product.serialize()))
 
 
 ######################################################################
 # ACTION TO CHANGE A PRODUCT'S AVAILABILITY
 ######################################################################
-@app.route("/products/<int:product_id>/change_availability", methods=["PUT"])
+@api.route("/products/<int:product_id>/change_availability", methods=["PUT"])
 def change_product_availability(product_id):
     """
     Change Product Availability
@@ -229,30 +430,91 @@ def change_product_availability(product_id):
     app.logger.info(
         "Request to change availability for product with id: %s", product_id
     )
-    product = Product.find(product_id)
+    product = Product.find(product_id, restore=True)
     if not product:
         abort(
             status.HTTP_404_NOT_FOUND,
             f"Product with id '{product_id}' was not found.",
         )
 
+    buffer = write_behind.requested()
+    if buffer is not None:
+        values = buffer.update(
+            product_id, lambda pending: {"available": not pending.get("available", product.available)}
+        )
+        available = values["available"]
+        message = {"message": f"Product availability will change to {available}"}
+        message = {**message, **write_behind.with_pending(product_id, product.serialize())}
+        return media.respond(message, status.HTTP_202_ACCEPTED, WRITE_BEHIND_HEADERS)
+
+    write_behind.flush(product_id)
     product.change_availability()
     message = {"message": f"Product availability changed to {product.available}"}
     message = {**message, **product.serialize()}
 
     app.logger.info("Product availability changed for ID [%s].", product_id)
 
-    return jsonify(message), status.HTTP_200_OK
+    return media.respond(message)
 
 
 ######################################################################
 # get product categories
 ######################################################################
-@app.route("/categories", methods=["GET"])
+@api.route("/categories", methods=["GET"])
 def get_categories():
     """Endpoint to get product categories"""
-    categories = [category.name for category in Category]
-    return jsonify(categories)
+    return static_assets.cached_response(
+        CATEGORIES_JSON, "application/json", f"public, max-age={app.config['CATEGORIES_MAX_AGE']}"
+    )
+
+
+######################################################################
+# PROFILE THIS WORKER
+######################################################################
+@api.route("/admin/profile", methods=["GET"])
+def profile_worker():
+    """
+    Profiles the worker that receives the request
+    This endpoint samples the stacks of the worker's other threads for
+    ?seconds=N and returns them in collapsed stack format for a flamegraph.
+    The request thread is busy sampling, so the worker must have others
+    """
+    app.logger.info("Request to profile the worker")
+    check_admin_token()
+    seconds = _float_arg("seconds") or 5.0
+    max_seconds = app.config["PROFILE_MAX_SECONDS"]
+    if not 0 < seconds <= max_seconds:
+        abort(status.HTTP_400_BAD_REQUEST, f"seconds must be more than 0 and at most {max_seconds}")
+    interval_ms = _int_arg("interval_ms") or app.config["PROFILE_INTERVAL_MS"]
+    if not request.environ.get("wsgi.multithread"):
+        abort(
+            status.HTTP_409_CONFLICT,
+            "This worker serves one request at a time, so there is nothing to profile while it samples",
+        )
+    sampler = profiler.Sampler(
+        interval=interval_ms / 1000,
+        max_overhead=app.config["PROFILE_MAX_OVERHEAD"],
+        include_idle=request.args.get("idle", "").lower() == "true",
+    )
+    try:
+        sampler.run(seconds)
+    except profiler.ProfilerBusy as error:
+        abort(status.HTTP_409_CONFLICT, str(error))
+    app.logger.info(
+        "Profiled for %.1fs: %d samples, %.2f%% overhead",
+        sampler.elapsed,
+        sampler.samples,
+        sampler.overhead * 100,
+        extra={"samples": sampler.samples, "overhead": sampler.overhead},
+    )
+    return Response(
+        sampler.collapsed(),
+        mimetype="text/plain",
+        headers={
+            "X-Profile-Samples": str(sampler.samples),
+            "X-Profile-Overhead": f"{sampler.overhead:.4f}",
+        },
+    )
 
 
 ######################################################################
@@ -260,20 +522,174 @@ def get_categories():
 ######################################################################
 
 
-def check_content_type(content_type):
-    """Checks that the media type is correct"""
+def check_content_type(*content_types):
+    """Checks that the media type is one of the given ones"""
+    expected = " or ".join(content_types)
     if "Content-Type" not in request.headers:
         app.logger.error("No Content-Type specified.")
         abort(
             status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            f"Content-Type must be {content_type}",
+            f"Content-Type must be {expected}",
         )
 
-    if request.headers["Content-Type"] == content_type:
+    if media.content_type() in content_types:
         return
 
     app.logger.error("Invalid Content-Type: %s", request.headers["Content-Type"])
     abort(
         status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-        f"Content-Type must be {content_type}",
+        f"Content-Type must be {expected}",
     )
+
+
+def check_admin_token():
+    """Checks the bearer token of an admin request"""
+    token = app.config.get("ADMIN_TOKEN")
+    if not token:
+        abort(status.HTTP_404_NOT_FOUND, "Admin endpoints are not enabled")
+    scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(given.encode(), token.encode()):
+        abort(status.HTTP_401_UNAUTHORIZED, "A valid admin token is required")
+
+
+def _int_arg(name, minimum=1, value=None):
+    """Returns a query argument as an int of at least minimum, or None if it is absent
+
+    value, when given, is parsed instead of the query argument
+    """
+    value = value or request.args.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        abort(status.HTTP_400_BAD_REQUEST, f"{name} must be an integer of at least {minimum}")
+    return number
+
+
+def _float_arg(name):
+    """Returns a query argument as a finite float, or None if it is absent"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    if not math.isfinite(number):
+        abort(status.HTTP_400_BAD_REQUEST, f"{name} must be a number")
+    return number
+
+
+def _percentiles_arg():
+    """Returns the percentiles argument as a tuple of floats"""
+    value = request.args.get("percentiles")
+    if value is None:
+        return price_stats.DEFAULT_PERCENTILES
+    try:
+        percentiles = tuple(float(part) for part in value.split(",") if part.strip())
+    except ValueError:
+        percentiles = None
+    if not percentiles or not all(0 <= percentile <= 100 for percentile in percentiles):
+        abort(status.HTTP_400_BAD_REQUEST, "percentiles must be numbers between 0 and 100")
+    return percentiles
+
+
+def _list_filters():
+    """Parses and validates the filter arguments of a list request"""
+    category = request.args.get("category") or None
+    if category is not None and category not in Category.__members__:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid category: {category}")
+    available = request.args.get("available") or None
+    if available is not None:
+        if available.lower() not in ("true", "false"):
+            abort(status.HTTP_400_BAD_REQUEST, "available must be true or false")
+        available = available.lower() == "true"
+    return {
+        "category": category,
+        "name": request.args.get("name") or None,
+        "available": available,
+        "min_price": _float_arg("min_price"),
+        "max_price": _float_arg("max_price"),
+    }
+
+
+def _list_page(catalog, filters: dict, sort: str, after, limit, media_type: str):  # pylint: disable=too-many-arguments
+    """Returns the encoded body of a page of Products and the cursor of the next one"""
+    # fetch one extra row to find out if there is a next page
+    fetch = limit + 1 if limit is not None else None
+    if catalog is not None:
+        results = catalog.search(sort=sort, after=after, limit=fetch, **filters)
+    else:
+        products = Product.search(sort=sort, after=after, limit=fetch, **filters)
+        results = [product.serialize() for product in products]
+
+    cursor = None
+    if limit is not None and len(results) > limit:
+        results = results[:limit]
+        field = sort.lstrip("-")
+        cursor = _encode_cursor(results[-1][field], results[-1]["id"])
+    app.logger.info("Returning %d products", len(results))
+    return media.encode(results, media_type), cursor
+
+
+def _update(product_id: int, data, partial: bool = False):
+    """Validates and stores a PUT or PATCH of a Product, behind when the client prefers"""
+    # validated first, so that a bad body doesn't bring a Product back from the archive
+    values = PRODUCT_SCHEMA.validate(data, partial)
+    product: Product = Product.find(product_id, restore=True)
+    if not product:
+        app.logger.info("Invalid product id: %s", product_id)
+        abort(
+            status.HTTP_404_NOT_FOUND, f"There is no exist product with id {product_id}"
+        )
+    buffer = write_behind.requested()
+    if buffer is not None:
+        buffer.put(product.id, values)
+        message = write_behind.with_pending(product.id, product.serialize())
+        return media.respond(message, status.HTTP_202_ACCEPTED, WRITE_BEHIND_HEADERS)
+
+    write_behind.flush(product.id)
+    for column, value in values.items():
+        setattr(product, column, value)
+    product.update()
+    return media.respond(product.serialize())
+
+
+def _encode_cursor(value, product_id):
+    """Encodes the keyset position of the last Product on a page"""
+    return base64.urlsafe_b64encode(json.dumps([value, product_id]).encode()).decode()
+
+
+def _is_int(value) -> bool:
+    """Returns True for an int that isn't a bool"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _decode_cursor(cursor, field: str):
+    """Decodes a keyset position made by _encode_cursor for a sort field
+
+    :return: (id,) when sorting by id, else (sort value, id)
+    :raises DataValidationError: if the cursor doesn't hold a position of the field
+    """
+    if not cursor:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        position = None
+    if not isinstance(position, list) or len(position) != 2 or not _is_int(position[1]):
+        raise DataValidationError("Invalid cursor")
+    value, product_id = position
+    if field == "id":
+        return (product_id,)
+    if field == "price":
+        try:
+            return (parse_price(value), product_id)
+        except DataValidationError:
+            pass
+    elif isinstance(value, str):
+        return (value, product_id)
+    raise DataValidationError(f"Invalid cursor for sort by {field}")
@@ -0,0 +1,103 @@
+"""
+Synthetic Catalog
+
+Generates realistic looking Products for load tests and benchmarks with
+``flask products-seed``. Each batch is drawn column by column with NumPy
+rather than one object at a time, so a million rows take seconds.
+
+* categories follow CATEGORY_WEIGHTS
+* prices are log-normal around a typical price for the category and end
+  in .99, like the prices shop owners pick
+* AVAILABLE_RATE of the products are available
+* names and descriptions combine words of a small vocabulary
+
+A skew above 0 makes the popular categories and words more popular still:
+the n-th most likely choice has its weight divided by n ** skew, so 1 gives
+Zipf-like long tails. The same count, seed, skew and batch size always give
+the same catalog.
+"""
+from decimal import Decimal
+from service.models import Category
+
+# share of the catalog in each category, most common first
+CATEGORY_WEIGHTS = {
+    Category.ELECTRONICS: 0.22,
+    Category.FOOD: 0.20,
+    Category.PERSONAL_CARE: 0.14,
+    Category.TOYS: 0.12,
+    Category.SPORTS: 0.12,
+    Category.HEALTH: 0.10,
+    Category.OTHERS: 0.10,
+}
+# median price and the sigma of its logarithm
+PRICE_MEDIANS = {
+    Category.ELECTRONICS: 120.0,
+    Category.FOOD: 6.0,
+    Category.PERSONAL_CARE: 12.0,
+    Category.TOYS: 25.0,
+    Category.SPORTS: 45.0,
+    Category.HEALTH: 15.0,
+    Category.OTHERS: 30.0,
+}
+PRICE_SIGMA = 0.8
+MAX_PRICE_CENTS = 9_999_999
+AVAILABLE_RATE = 0.85
+
+ADJECTIVES = ("Classic", "Eco", "Pro", "Ultra", "Mega", "Smart", "Mini", "Deluxe", "Power", "Super")
+NOUNS = ("Tool", "Device", "Kit", "Gadget", "Pack", "Set", "Bottle", "Machine", "Bundle", "Box")
+AUDIENCES = ("everyday use", "the whole family", "professionals", "travel", "beginners")
+IMAGE_URL = "https://myimagehost.com/products/seed-{seed}-{index}.jpg"
+
+
+def skewed(weights, skew: float):
+    """Returns the probabilities of choices after skewing their weights
+    :param weights: the weights of the choices, most likely first
+    """
+    import numpy  # pylint: disable=import-outside-toplevel
+
+    skewed_weights = numpy.asarray(weights, dtype=float) / numpy.arange(1, len(weights) + 1) ** skew
+    return skewed_weights / skewed_weights.sum()
+
+
+def generate(count: int, seed: int = 0, skew: float = 0.0, batch_size: int = 10000):  # pylint: disable=too-many-locals
+    """Yields lists of Product column values, batch_size rows at a time"""
+    import numpy  # pylint: disable=import-outside-toplevel  # only needed for seeding
+
+    rng = numpy.random.default_rng(seed)
+    categories = list(CATEGORY_WEIGHTS)
+    category_p = skewed(list(CATEGORY_WEIGHTS.values()), skew)
+    adjective_p = skewed(numpy.ones(len(ADJECTIVES)), skew)
+    noun_p = skewed(numpy.ones(len(NOUNS)), skew)
+    log_medians = numpy.log([PRICE_MEDIANS[category] for category in categories])
+
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        category = rng.choice(len(categories), size, p=category_p)
+        dollars = numpy.floor(numpy.exp(rng.normal(log_medians[category], PRICE_SIGMA)))
+        cents = numpy.minimum(dollars.astype(numpy.int64) * 100 + 99, MAX_PRICE_CENTS)
+        available = rng.random(size) < AVAILABLE_RATE
+        adjective = rng.choice(len(ADJECTIVES), size, p=adjective_p)
+        noun = rng.choice(len(NOUNS), size, p=noun_p)
+        audience = rng.integers(len(AUDIENCES), size=size)
+        model = rng.integers(100, 1000, size=size)
+        yield [
+            {
+                "name": f"{ADJECTIVES[a]} {NOUNS[n]} {m}",
+                "description": f"{ADJECTIVES[a]} {NOUNS[n].lower()} for {AUDIENCES[u]}",
+                "price": Decimal(c).scaleb(-2),
+                "available": bool(v),
+                "image_url": IMAGE_URL.format(seed=seed, index=start + i),
+                "category": categories[k],
+            }
+            for i, (k, c, v, a, n, u, m) in enumerate(
+                zip(
+                    category.tolist(),
+                    cents.tolist(),
+                    available.tolist(),
+                    adjective.tolist(),
+                    noun.tolist(),
+                    audience.tolist(),
+                    model.tolist(),
+                )
+            )
+        ]
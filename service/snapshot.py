@@ -0,0 +1,353 @@
+"""
+Catalog Snapshot
+
+Builds a compact read-only binary copy of the Product table and serves
+lookups from it through ``mmap`` so that every worker on a host shares a
+single page-cache copy of the catalog.
+
+File layout (little endian)::
+
+    header   magic "PCAT", version, record count, build time
+    records  one fixed-size record per Product, sorted by id
+    heap     UTF-8 bytes of every name, description and image_url
+
+Each record stores the numeric fields inline and an (offset, length) pair
+into the heap for each string. A length of ``NULL_LENGTH`` means None.
+"""
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from service import price_stats
+from service.common import sharding
+from service.models import db, Category, Product
+
+logger = logging.getLogger("flask.app")
+
+MAGIC = b"PCAT"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxIQ")  # magic, version, count, built_at (ms)
+RECORD = struct.Struct("<qdBBxxIIIIII")  # id, price, available, category, 3 x (offset, length)
+NULL_LENGTH = 0xFFFFFFFF
+NO_CATEGORY = 0xFF
+
+
+class SnapshotError(Exception):
+    """Used when a snapshot file is missing or corrupt"""
+
+
+######################################################################
+#  B U I L D E R
+######################################################################
+def build_snapshot(path: str, chunk_size: int = 10000) -> int:
+    """Writes every Product to a snapshot file and swaps it in atomically
+    :param path: where the snapshot should be written
+    :param chunk_size: rows fetched from the database per round trip
+    :return: the number of Products in the snapshot
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    result = _rows_by_id(chunk_size)
+    count = 0
+    heap_size = 0
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(handle, "wb") as file, tempfile.TemporaryFile() as heap:
+
+            def put(value):
+                nonlocal heap_size
+                if value is None:
+                    return 0, NULL_LENGTH
+                data = value.encode("utf-8")
+                offset = heap_size
+                heap.write(data)
+                heap_size += len(data)
+                return offset, len(data)
+
+            file.seek(HEADER.size)  # the header is written once the count is known
+            for row in result:  # pylint: disable=not-an-iterable
+                category = row.category.value if row.category is not None else NO_CATEGORY
+                file.write(RECORD.pack(
+                    row.id,
+                    float(row.price),
+                    row.available,
+                    category,
+                    *put(row.name),
+                    *put(row.description),
+                    *put(row.image_url),
+                ))
+                count += 1
+
+            heap.seek(0)
+            while True:
+                block = heap.read(1 << 20)
+                if not block:
+                    break
+                file.write(block)
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, VERSION, count, int(time.time() * 1000)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        db.session.commit()
+    logger.info("Catalog snapshot with %d products written to %s", count, path)
+    return count
+
+
+def _rows_by_id(chunk_size: int):
+    """Returns the Product rows in id order, merged from every shard when sharded"""
+    table = Product.__table__
+    statement = db.select(table).order_by(table.c.id).execution_options(yield_per=chunk_size)
+    if sharding.get_shards() is None:
+        return db.session.execute(statement)
+    return heapq.merge(*sharding.execute_each(db.session, statement), key=lambda row: row.id)
+
+
+######################################################################
+#  R E A D E R
+######################################################################
+class CatalogSnapshot:
+    """A memory-mapped, read-only view of a snapshot file"""
+
+    _categories = {category.value: category.name for category in Category}
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            if stat.st_size < HEADER.size:
+                raise SnapshotError(f"Snapshot {path} is truncated")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        magic, version, self.count, self.built_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"Snapshot {path} has an unknown format")
+        self._heap = HEADER.size + self.count * RECORD.size
+        if stat.st_size < self._heap:
+            raise SnapshotError(f"Snapshot {path} is truncated")
+        self._view = memoryview(self._map)
+
+    def __len__(self):
+        return self.count
+
+    def _id_at(self, index: int) -> int:
+        """Returns the id of the record at an index"""
+        return struct.unpack_from("<q", self._map, HEADER.size + index * RECORD.size)[0]
+
+    def _string(self, offset: int, length: int):
+        """Decodes a string straight out of the heap"""
+        if length == NULL_LENGTH:
+            return None
+        start = self._heap + offset
+        return str(self._view[start:start + length], "utf-8")
+
+    def _fields(self, index: int) -> tuple:
+        """Unpacks the raw fields of the record at an index"""
+        return RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+    def _decode(self, fields: tuple) -> dict:
+        """Converts raw record fields into a serialized Product"""
+        return {
+            "id": fields[0],
+            "name": self._string(fields[4], fields[5]),
+            "description": self._string(fields[6], fields[7]),
+            "price": fields[1],
+            "available": bool(fields[2]),
+            "image_url": self._string(fields[8], fields[9]),
+            "category": self._categories.get(fields[3]),
+        }
+
+    def get(self, product_id: int):
+        """Finds a serialized Product by binary search on its id"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._id_at(middle) < product_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._id_at(low) == product_id:
+            return self._decode(self._fields(low))
+        return None
+
+    # pylint: disable=too-many-arguments
+    def filter(self, category=None, name=None, available=None, min_price=None, max_price=None):
+        """Yields serialized Products matching all of the given filters
+        :param category: a Category name
+        :param name: an exact Product name
+        :param available: a bool
+        :param min_price: the lowest price to include
+        :param max_price: the highest price to include
+        """
+        category_value = None
+        if category is not None:
+            if category not in Category.__members__:
+                return
+            category_value = Category[category].value
+        for index in range(self.count):
+            fields = self._fields(index)
+            # check the inline fields before decoding any strings
+            if category_value is not None and fields[3] != category_value:
+                continue
+            if available is not None and bool(fields[2]) != available:
+                continue
+            if min_price is not None and fields[1] < min_price:
+                continue
+            if max_price is not None and fields[1] > max_price:
+                continue
+            product = self._decode(fields)
+            if name is not None and product["name"] != name:
+                continue
+            yield product
+
+    def _records(self):
+        """Returns a NumPy view of the fixed-size records, without copying them"""
+        import numpy  # pylint: disable=import-outside-toplevel  # only needed for statistics
+
+        dtype = numpy.dtype(
+            [
+                ("id", "<i8"),
+                ("price", "<f8"),
+                ("available", "u1"),
+                ("category", "u1"),
+                ("padding", "V2"),
+                ("strings", "<u4", (6,)),
+            ]
+        )
+        return numpy.frombuffer(self._map, dtype=dtype, count=self.count, offset=HEADER.size)
+
+    # pylint: disable=too-many-arguments
+    def price_summary(
+        self,
+        percentiles=price_stats.DEFAULT_PERCENTILES,
+        category=None,
+        name=None,
+        available=None,
+        min_price=None,
+        max_price=None,
+    ):
+        """Returns the same price statistics as Product.price_summary
+
+        The filters on the inline fields are vectorized over the mapped
+        records. Only a name filter decodes strings, for the records that
+        pass the other filters.
+        """
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        records = self._records()
+        mask = numpy.ones(len(records), dtype=bool)
+        if category is not None:
+            if category not in Category.__members__:
+                mask[:] = False
+            else:
+                mask &= records["category"] == Category[category].value
+        if available is not None:
+            mask &= records["available"] == int(available)
+        if min_price is not None:
+            mask &= records["price"] >= min_price
+        if max_price is not None:
+            mask &= records["price"] <= max_price
+        if name is not None:
+            for index in mask.nonzero()[0]:
+                strings = records["strings"][index]
+                mask[index] = self._string(strings[0], strings[1]) == name
+        selected = records[mask]
+        cents = (selected["price"] * 100).round().astype("<i8")
+        groups = price_stats.summarize_groups(selected["category"], cents, percentiles)
+        return {
+            "all": price_stats.summarize_cents(cents, percentiles),
+            "categories": {
+                self._categories[code]: stats for code, stats in groups.items() if code in self._categories
+            },
+        }
+
+    def search(self, sort="id", after=None, limit=None, **filters):
+        """Returns filtered Products in the same order and pages as Product.search
+        :param sort: one of the model SORT_FIELDS, prefixed with "-" for descending
+        :param after: the (sort value, id) of the last Product of the previous page
+        :param limit: the most Products to return
+        """
+        descending = sort.startswith("-")
+        field = sort.lstrip("-")
+
+        def position(product):
+            if field == "id":
+                return (product["id"],)
+            if field == "price":
+                # compared as the database does, a float 19.99 is below Decimal("19.99")
+                return (price_stats.to_decimal(product["price"]), product["id"])
+            return (product[field] if product[field] is not None else "", product["id"])
+
+        products = sorted(self.filter(**filters), key=position, reverse=descending)
+        if after is not None:
+            after = tuple(after[-len(position(products[0])):]) if products else ()
+            if field == "price" and after:
+                after = (price_stats.to_decimal(after[0]), after[1])
+            if descending:
+                products = [product for product in products if position(product) < after]
+            else:
+                products = [product for product in products if position(product) > after]
+        return products[:limit] if limit is not None else products
+
+
+class SnapshotStore:  # pylint: disable=too-few-public-methods
+    """Holds the current snapshot and swaps in a new one when the file changes"""
+
+    def __init__(self, path: str, refresh_seconds: float = 5.0):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stat_key(self):
+        """Returns the identity of the file currently at the path"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def current(self):
+        """Returns the latest snapshot, or None if there is no usable file"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.refresh_seconds:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None or now - self._checked_at >= self.refresh_seconds:
+                self._checked_at = now
+                key = self._stat_key()
+                if key is None:
+                    self._snapshot = None
+                elif self._snapshot is None or self._snapshot.key != key:
+                    self._load()
+        return self._snapshot
+
+    def _load(self):
+        """Maps the snapshot file, keeping the old one if the new one is bad"""
+        try:
+            self._snapshot = CatalogSnapshot(self.path)
+            logger.info("Loaded catalog snapshot of %d products", len(self._snapshot))
+        except (OSError, SnapshotError) as error:
+            logger.error("Unable to load catalog snapshot: %s", error)
+
+
+_store = None  # pylint: disable=invalid-name
+
+
+def current(app):
+    """Returns the current snapshot if one is configured and loadable"""
+    global _store  # pylint: disable=global-statement, invalid-name
+    path = app.config.get("CATALOG_SNAPSHOT_PATH")
+    if not path:
+        return None
+    if _store is None or _store.path != path:
+        _store = SnapshotStore(path, app.config["CATALOG_SNAPSHOT_REFRESH"])
+    return _store.current()
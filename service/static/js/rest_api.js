@@ -194,82 +194,168 @@ $(function () {
     });
 
     // ****************************************
-    // Search for a Product
+    // Search for Products
     // ****************************************
 
-    $("#search-btn").click(function () {
-
+    // Results are fetched a page at a time as the table is scrolled, and
+    // only the rows in view are in the DOM, so any catalog size stays fast
+    const PAGE_SIZE = 50;       // products fetched per request
+    const ROW_HEIGHT = 37;      // pixels, every result row has this height
+    const OVERSCAN = 10;        // rows drawn above and below the visible ones
+    const DEBOUNCE_MS = 300;    // quiet time after a filter change before searching
+
+    let search = {
+        rows: [],       // products fetched so far
+        next: null,     // URL of the next page, null once all are fetched
+        request: null,  // the request in flight
+        active: false,  // filter changes refresh the results after a search
+    };
+    let debounce_timer = null;
+    let render_pending = false;
+
+    // Returns the query string of the filters in the form
+    function search_query() {
+        let params = {"limit": PAGE_SIZE};
         let name = $("#product_name").val();
         let category = $("#product_category").val();
         let available = $("#product_available").val();
-
-        let queryString = ""
-
         if (name) {
-            queryString += 'name=' + name
+            params.name = name;
         }
         if (category) {
-            if (queryString.length > 0) {
-                queryString += '&category=' + category
-            } else {
-                queryString += 'category=' + category
-            }
+            params.category = category;
         }
         if (available) {
-            if (queryString.length > 0) {
-                queryString += '&available=' + available
-            } else {
-                queryString += 'available=' + available
+            params.available = available;
+        }
+        return $.param(params);
+    }
+
+    // Returns the path of the rel="next" Link of a response, or null
+    function next_link(xhr) {
+        let link = xhr.getResponseHeader("Link");
+        let match = link && link.match(/<([^>]+)>;\s*rel="next"/);
+        if (!match) {
+            return null;
+        }
+        let url = new URL(match[1], window.location.href);
+        return url.pathname + url.search;
+    }
+
+    // Escapes a value for use as HTML text
+    function escape_html(value) {
+        return $("<div>").text(String(value)).html();
+    }
+
+    // Draws the rows in view, with spacers standing in for the others
+    function render_rows() {
+        render_pending = false;
+        let viewport = $("#search_results");
+        let first = Math.max(0, Math.floor(viewport.scrollTop() / ROW_HEIGHT) - OVERSCAN);
+        first -= first % 2;  // keeps the stripes in place
+        let last = Math.min(
+            search.rows.length,
+            first + Math.ceil(viewport.innerHeight() / ROW_HEIGHT) + 2 * OVERSCAN
+        );
+        let body = `<tr style="height: ${first * ROW_HEIGHT}px"></tr>`;
+        for (let i = first; i < last; i++) {
+            let product = search.rows[i];
+            body += `<tr id="row_${i}">`;
+            for (let value of [product.id, product.name, product.price, product.available,
+                               product.category, product.description, product.image_url]) {
+                body += `<td>${escape_html(value)}</td>`;
             }
+            body += '</tr>';
         }
+        body += `<tr style="height: ${(search.rows.length - last) * ROW_HEIGHT}px"></tr>`;
+        $("#search_results tbody").html(body);
+    }
 
-        $("#flash_message").empty();
+    // Fetches the next page when the end of the results is near
+    function fetch_if_needed() {
+        let viewport = $("#search_results")[0];
+        let remaining = viewport.scrollHeight - viewport.scrollTop - viewport.clientHeight;
+        if (remaining < 5 * ROW_HEIGHT) {
+            fetch_page();
+        }
+    }
 
+    // Fetches the next page of the current search, if there is one
+    function fetch_page(on_done) {
+        if (search.request || !search.next) {
+            return;
+        }
         let ajax = $.ajax({
             type: "GET",
-            url: `/products?${queryString}`,
+            url: search.next,
             contentType: "application/json",
             data: ''
-        })
+        });
+        search.request = ajax;
 
-        ajax.done(function(res){
-            //alert(res.toSource())
-            $("#search_results").empty();
-            let table = '<table class="table table-striped" cellpadding="10">'
-            table += '<thead><tr>'
-
-            table += '<th class="col-md-1">ID</th>'
-            table += '<th class="col-md-2">Name</th>'
-            table += '<th class="col-md-2">Price</th>'
-            table += '<th class="col-md-1">Available</th>'
-            table += '<th class="col-md-2">Category</th>'
-            table += '<th class="col-md-2">Description</th>'
-            table += '<th class="col-md-2">image_url</th>' 
-
-            table += '</tr></thead><tbody>'
-            let firstProduct = "";
-            for(let i = 0; i < res.length; i++) {
-                let product = res[i];
-                table +=  `<tr id="row_${i}"><td>${product.id}</td><td>${product.name}</td><td>${product.price}</td><td>${product.available}</td><td>${product.category}</td><td>${product.description}</td><td>${product.image_url}</td></tr>`;
-                if (i == 0) {
-                    firstProduct = product;
-                }
+        ajax.done(function(res, text_status, xhr){
+            if (search.request !== ajax) {
+                return;  // a newer search replaced this one
+            }
+            search.request = null;
+            search.rows = search.rows.concat(res);
+            search.next = next_link(xhr);
+            render_rows();
+            if (on_done) {
+                on_done(res);
             }
-            table += '</tbody></table>';
-            $("#search_results").append(table);
+            fetch_if_needed();  // until the results fill the table
+        });
 
-            // copy the first result to the form
-            if (firstProduct != "") {
-                update_form_data(firstProduct)
+        ajax.fail(function(res, text_status){
+            if (search.request !== ajax || text_status == "abort") {
+                return;
             }
+            search.request = null;
+            flash_message(res.responseJSON ? res.responseJSON.message : "Server error!");
+        });
+    }
 
+    // Starts a new search, cancelling the one in flight
+    function start_search(copy_first) {
+        clearTimeout(debounce_timer);
+        let previous = search.request;
+        search = {rows: [], next: `/products?${search_query()}`, request: null, active: true};
+        if (previous) {
+            previous.abort();
+        }
+        $("#flash_message").empty();
+        $("#search_results").scrollTop(0);
+
+        fetch_page(function(res){
+            // copy the first result to the form
+            if (copy_first && res.length > 0) {
+                update_form_data(res[0])
+            }
             flash_message("Success")
         });
+    }
 
-        ajax.fail(function(res){
-            flash_message(res.responseJSON.message)
-        });
+    $("#search-btn").click(function () {
+        start_search(true);
+    });
 
+    $("#product_name, #product_category, #product_available").on("input change", function () {
+        if (!search.active) {
+            return;
+        }
+        clearTimeout(debounce_timer);
+        debounce_timer = setTimeout(function () {
+            start_search(false);
+        }, DEBOUNCE_MS);
+    });
+
+    $("#search_results").on("scroll", function () {
+        if (!render_pending) {
+            render_pending = true;
+            window.requestAnimationFrame(render_rows);
+        }
+        fetch_if_needed();
     });
 
 
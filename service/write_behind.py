@@ -0,0 +1,283 @@
+"""
+Write-Behind Updates
+
+Coalesces bursts of updates to the same Products, such as the inventory
+feed sends. A PUT or PATCH /products/<id>, or PUT
+/products/<id>/change_availability, with a ``Prefer: respond-async``
+header is validated and answered with 202 Accepted and the Product as it
+will be stored, but only recorded in a buffer of the worker. Later updates
+of a Product replace its pending values, and a background thread writes
+all pending Products in one transaction once the oldest update has waited
+WRITE_BEHIND_SECONDS or WRITE_BEHIND_MAX_PENDING Products are pending. The
+ORM flush hooks then move the facets and log one change per Product.
+
+Pending updates are written when the worker exits, and those of a Product
+before any request without the header writes or deletes it. A worker that
+is killed loses at most WRITE_BEHIND_SECONDS of them. Clients only read
+their own writes within one worker process: reading a Product by id in the
+worker that buffered its update shows the pending values, while other
+workers and listings show them once written. The buffer is off while
+WRITE_BEHIND_SECONDS is 0.
+
+If a batch can't be written because of its data rather than the database,
+its Products are written one by one. An update that keeps failing is
+dropped after MAX_ATTEMPTS writes, or at once when a direct write of its
+Product replaces it.
+
+A change_availability is stored as the opposite of the availability the
+worker sees, so toggles of one Product in different workers can collapse
+into one: the last write wins. Clients that need a definite availability
+PATCH it instead.
+"""
+import atexit
+import logging
+import threading
+import time
+from flask import current_app, request
+from sqlalchemy.exc import InterfaceError, OperationalError, SQLAlchemyError
+from service.models import db, Category, Product
+
+logger = logging.getLogger("flask.app")
+
+PREFERENCE = "respond-async"
+MAX_ATTEMPTS = 3  # failed writes of a pending update before it is dropped
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)  # the database failed, not the data
+
+_buffer = None  # pylint: disable=invalid-name
+_buffer_lock = threading.Lock()
+
+
+class WriteBehindBuffer:  # pylint: disable=too-many-instance-attributes
+    """Pending Product updates of one worker and the thread that writes them"""
+
+    def __init__(self, app, delay: float, max_pending: int):
+        self.app = app
+        self.delay = delay
+        self.max_pending = max_pending
+        self._pending = {}  # product id -> column values
+        self._failures = {}  # product id -> failed writes of its pending values
+        self._oldest = None  # when the oldest pending update arrived
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # keeps writes of a Product in order
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, product_id: int, values: dict):
+        """Records new values of a Product, replacing pending ones"""
+        self.update(product_id, lambda pending: values)
+
+    def update(self, product_id: int, change) -> dict:
+        """Records new values of a Product computed from its pending ones
+
+        change is called with a copy of the pending values while the buffer
+        is locked, so that updates computed at the same time can't both
+        start from the same values.
+        :return: the new values
+        """
+        with self._lock:
+            pending = self._pending.setdefault(product_id, {})
+            values = change(dict(pending))
+            pending.update(values)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+        return values
+
+    def pending(self, product_id: int) -> dict:
+        """Returns the values of a Product that are not written yet"""
+        with self._lock:
+            return dict(self._pending.get(product_id, {}))
+
+    def flush(self, product_id=None) -> int:
+        """Writes the pending values of one Product, or of all of them
+
+        Runs in the current application context and its session. The values
+        of one Product are flushed before it is written directly, so they
+        are dropped if they can't be written.
+        :return: the number of Products written
+        :raises SQLAlchemyError: if the database is unavailable, everything is kept
+        """
+        with self._flush_lock:
+            with self._lock:
+                if product_id is None:
+                    batch, self._pending, self._oldest = self._pending, {}, None
+                elif product_id in self._pending:
+                    batch = {product_id: self._pending.pop(product_id)}
+                else:
+                    batch = {}
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except TRANSIENT_ERRORS:
+                db.session.rollback()
+                self._requeue(batch)
+                raise
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                logger.warning("Unable to write %d product updates together: %s", len(batch), error)
+                return self._write_each(batch, MAX_ATTEMPTS if product_id is None else 1)
+            for written in batch:
+                self._failures.pop(written, None)
+        return len(batch)
+
+    def _write_each(self, batch: dict, max_attempts: int) -> int:
+        """Writes Products one at a time, so that a bad one can't hold up the others
+
+        :return: the number of Products written
+        """
+        written = 0
+        items = list(batch.items())
+        for index, (product_id, values) in enumerate(items):
+            try:
+                self._write({product_id: values})
+            except TRANSIENT_ERRORS:
+                db.session.rollback()
+                self._requeue(dict(items[index:]))
+                raise
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                self._failed(product_id, values, error, max_attempts)
+            else:
+                self._failures.pop(product_id, None)
+                written += 1
+        return written
+
+    def _failed(self, product_id: int, values: dict, error: Exception, max_attempts: int):
+        """Keeps the values of a Product that failed to be written, up to max_attempts times"""
+        failures = self._failures.pop(product_id, 0) + 1
+        if failures >= max_attempts:
+            logger.error(
+                "Dropping the pending update of product %s after %d failed writes: %s",
+                product_id,
+                failures,
+                error,
+            )
+            return
+        logger.warning("Unable to write the pending update of product %s, retrying: %s", product_id, error)
+        self._failures[product_id] = failures
+        self._requeue({product_id: values})
+
+    @staticmethod
+    def _write(batch: dict):
+        """Applies the pending values of Products in one transaction"""
+        logger.info("Writing %d coalesced product updates", len(batch))
+        products = {
+            product.id: product
+            for product in Product.query.filter(Product.id.in_(list(batch))).all()
+        }
+        for product_id, values in batch.items():
+            product = products.get(product_id)
+            if product is None:
+                logger.warning("Dropping pending update of missing product %s", product_id)
+                continue
+            for column, value in values.items():
+                setattr(product, column, value)
+        db.session.commit()
+
+    def _requeue(self, batch: dict):
+        """Puts back the values of a failed write under any newer ones"""
+        with self._lock:
+            for product_id, values in batch.items():
+                self._pending[product_id] = {**values, **self._pending.get(product_id, {})}
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _due(self) -> float:
+        """Returns the seconds until the next flush, 0 if one is due now"""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                return 0.0
+            if self._oldest is None:
+                return self.delay
+            return max(0.0, self._oldest + self.delay - time.monotonic())
+
+    def _run(self):
+        """Writes the pending updates whenever they are due"""
+        while not self._stopped:
+            wait = self._due()
+            if wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except SQLAlchemyError as error:
+                    logger.error("Unable to write product updates, retrying: %s", error)
+                    self._wake.wait(self.delay)
+                finally:
+                    db.session.remove()
+
+    def stop(self):
+        """Stops the thread and writes whatever is still pending"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        with self.app.app_context():
+            try:
+                self.flush()
+            except SQLAlchemyError as error:
+                logger.error("Lost %d pending product updates: %s", len(self), error)
+            finally:
+                db.session.remove()
+
+
+def get_buffer(app):
+    """Returns the buffer of this worker, or None if write-behind is off"""
+    global _buffer  # pylint: disable=global-statement, invalid-name
+    delay = app.config.get("WRITE_BEHIND_SECONDS", 0)
+    if delay <= 0:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = WriteBehindBuffer(app, delay, app.config["WRITE_BEHIND_MAX_PENDING"])
+            atexit.register(_buffer.stop)
+    return _buffer
+
+
+def requested():
+    """Returns the buffer if the request prefers write-behind and it is on"""
+    preferences = {
+        preference.split(";")[0].strip().lower()
+        for preference in request.headers.get("Prefer", "").split(",")
+    }
+    if PREFERENCE not in preferences:
+        return None
+    return get_buffer(current_app._get_current_object())  # pylint: disable=protected-access
+
+
+def flush(product_id: int):
+    """Writes the pending values of a Product before it is written directly"""
+    if _buffer is not None:
+        _buffer.flush(product_id)
+
+
+def stop():
+    """Writes everything pending as the worker exits"""
+    global _buffer  # pylint: disable=global-statement, invalid-name
+    with _buffer_lock:
+        if _buffer is not None:
+            _buffer.stop()
+            _buffer = None
+
+
+def with_pending(product_id: int, data: dict) -> dict:
+    """Returns serialized Product data with its pending values in this worker"""
+    if _buffer is None:
+        return data
+    values = _buffer.pending(product_id)
+    if "price" in values:
+        values["price"] = float(values["price"])
+    if isinstance(values.get("category"), Category):
+        values["category"] = values["category"].name
+    return {**data, **values}
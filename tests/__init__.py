@@ -0,0 +1,17 @@
+"""
+Tests for the Product service
+
+Each test process works in a database of its own, see tests/database.py.
+TEST_DATABASE_URI keeps the database given to the first process so that
+the processes it starts isolate themselves from it too.
+
+The list response cache is off unless a test turns it on, because the
+rolled back tests of a process can repeat the same change log seq.
+"""
+import os
+from tests.database import DEFAULT_URI, isolate_worker
+
+os.environ["DATABASE_URI"] = isolate_worker(
+    os.environ.setdefault("TEST_DATABASE_URI", os.getenv("DATABASE_URI", DEFAULT_URI))
+)
+os.environ.setdefault("LIST_CACHE_BYTES", "0")
@@ -2,17 +2,34 @@
 CLI Command Extensions for Flask
 """
 import os
+import json
+import shutil
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
-from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service import app
+from service.models import db, ArchivedProduct, ChangeOperation, Product, ProductChange, ProductFacet
+from service.common.cli_commands import (
+    changes_prune,
+    db_create,
+    db_init,
+    db_upgrade,
+    facets_rebuild,
+    products_archive,
+    products_export,
+    products_import,
+    products_seed,
+    PRODUCT_COLUMNS,
+)
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
 
 
 class TestFlaskCLI(TestCase):
     """Test Flask CLI Commands"""
 
     def setUp(self):
-        self.runner = CliRunner()
+        self.runner = app.test_cli_runner()
 
     @patch('service.common.cli_commands.db')
     def test_db_create(self, db_mock):
@@ -21,3 +38,182 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch('service.common.cli_commands.db')
+    def test_db_init(self, db_mock):
+        """It should create missing tables without dropping any"""
+        result = self.runner.invoke(db_init)
+        self.assertEqual(result.exit_code, 0)
+        db_mock.create_all.assert_called_once()
+        db_mock.drop_all.assert_not_called()
+
+
+class TestProductsImportExport(DatabaseTestCase):
+    """Test the products-export and products-import commands"""
+
+    def setUp(self):
+        super().setUp()
+        self.runner = app.test_cli_runner()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def _roundtrip(self, filename, *import_args):
+        """Exports 5 products, empties the table and imports them back"""
+        for _ in range(5):
+            ProductFactory(id=None).create()
+        expected = sorted((p.name, p.price, p.category) for p in Product.all())
+        path = os.path.join(self.tmpdir, filename)
+
+        result = self.runner.invoke(products_export, [path, "--chunk-size", "2"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Exported 5 products", result.output)
+
+        db.session.query(Product).delete()
+        db.session.commit()
+        result = self.runner.invoke(products_import, [path, "--chunk-size", "2", *import_args])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 5 products", result.output)
+        self.assertEqual(ProductFacet.counts()["total"], 5)
+        last_change = ProductChange.since(ProductChange.last_seq() - 1, 1)[0]
+        self.assertEqual(last_change.operation, ChangeOperation.RESYNC)
+        actual = sorted((p.name, p.price, p.category) for p in Product.all())
+        self.assertEqual(actual, expected)
+        return path
+
+    def test_csv_roundtrip(self):
+        """It should export and import Products as CSV"""
+        path = self._roundtrip("products.csv")
+        with open(path, encoding="utf-8") as file:
+            self.assertEqual(file.readline().strip(), ",".join(PRODUCT_COLUMNS))
+
+    def test_ndjson_roundtrip_keep_ids(self):
+        """It should export and import Products as NDJSON keeping their ids"""
+        path = self._roundtrip("products.ndjson", "--keep-ids")
+        with open(path, encoding="utf-8") as file:
+            ids = [json.loads(line)["id"] for line in file]
+        self.assertEqual(sorted(ids), sorted(p.id for p in Product.all()))
+
+    def test_import_skips_bad_rows(self):
+        """It should skip rows that fail validation"""
+        path = os.path.join(self.tmpdir, "products.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("name,description,price,available,image_url,category\n")
+            file.write("Ball,,9.99,true,,TOYS\n")
+            file.write("Bat,,19.99,maybe,,SPORTS\n")
+        result = self.runner.invoke(products_import, [path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 1 products from", result.output)
+        self.assertIn("skipped 1", result.output)
+        self.assertEqual(len(Product.all()), 1)
+
+    def test_import_bad_ids(self):
+        """It should skip rows without an id when keeping ids"""
+        path = os.path.join(self.tmpdir, "products.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("name,description,price,available,image_url,category\n")
+            file.write("Ball,,9.99,true,,TOYS\n")
+        result = self.runner.invoke(products_import, [path, "--keep-ids"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("skipped 1", result.output)
+
+    def test_import_unparseable_file(self):
+        """It should fail on a file that is not NDJSON"""
+        path = os.path.join(self.tmpdir, "products.ndjson")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("{not json\n")
+        result = self.runner.invoke(products_import, [path])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("Unable to parse", result.output)
+
+    def test_unknown_extension(self):
+        """It should require --format when the extension is unknown"""
+        path = os.path.join(self.tmpdir, "products.txt")
+        result = self.runner.invoke(products_export, [path])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("use --format", result.output)
+        result = self.runner.invoke(products_export, [path, "--format", "ndjson"])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+    def test_db_upgrade(self):
+        """It should only convert a floating point price column"""
+        result = self.runner.invoke(db_upgrade)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("already stored as decimals", result.output)
+        with patch("service.common.cli_commands.db.inspect") as inspect_mock:
+            inspect_mock.return_value.get_columns.return_value = [{"name": "price", "type": db.Float()}]
+            result = self.runner.invoke(db_upgrade)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertNotIn("already stored as decimals", result.output)
+        with patch("service.common.cli_commands.db.inspect") as inspect_mock:
+            inspect_mock.return_value.get_columns.return_value = [
+                {"name": "name", "nullable": True}, {"name": "price", "type": db.Numeric(12, 2)}
+            ]
+            result = self.runner.invoke(db_upgrade)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Named 0 rows of product without a name", result.output)
+
+    def test_products_seed(self):
+        """It should add the same synthetic Products for the same seed"""
+        result = self.runner.invoke(products_seed, ["--count", "25", "--seed", "7", "--chunk-size", "10"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Seeded 25 products", result.output)
+        first = [p.serialize() for p in Product.all()]
+        self.assertEqual(ProductFacet.counts()["total"], 25)
+        indexes = db.inspect(db.session.connection()).get_indexes(Product.__tablename__)
+        self.assertEqual(len(indexes), len(Product.__table__.indexes))
+
+        db.session.query(Product).delete()
+        db.session.commit()
+        result = self.runner.invoke(products_seed, ["--count", "25", "--seed", "7", "--chunk-size", "10", "--keep-indexes"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        second = [p.serialize() for p in Product.all()]
+        self.assertEqual([{**p, "id": 0} for p in first], [{**p, "id": 0} for p in second])
+        self.assertTrue(all(str(p["price"]).endswith(".99") for p in second))
+
+        result = self.runner.invoke(products_seed, ["--count", "-1"])
+        self.assertNotEqual(result.exit_code, 0)
+
+    def test_facets_rebuild(self):
+        """It should recount the facets"""
+        for _ in range(3):
+            ProductFactory(id=None).create()
+        db.session.query(ProductFacet).delete()
+        db.session.commit()
+        result = self.runner.invoke(facets_rebuild)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(ProductFacet.counts()["total"], 3)
+
+    def test_changes_prune(self):
+        """It should prune old changes"""
+        ProductFactory(id=None).create()
+        result = self.runner.invoke(changes_prune, ["--days", "1"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Deleted 0 changes", result.output)
+
+    def test_products_archive(self):
+        """It should archive unavailable Products and still export them"""
+        for available in (True, False, False, False):
+            ProductFactory(id=None, available=available).create()
+        result = self.runner.invoke(products_archive, ["--days", "1"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Archived 0 products", result.output)
+
+        seq = ProductChange.last_seq()
+        result = self.runner.invoke(products_archive, ["--days", "0", "--chunk-size", "2"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Archived 3 products", result.output)
+        self.assertEqual(len(Product.all()), 1)
+        self.assertEqual(ProductChange.since(seq, 10)[-1].operation, ChangeOperation.RESYNC)
+        self.assertEqual(db.session.query(ArchivedProduct).count(), 3)
+        self.assertEqual(ProductFacet.counts()["total"], 1)
+
+        path = os.path.join(self.tmpdir, "products.ndjson")
+        result = self.runner.invoke(products_export, [path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Exported 4 products", result.output)
+
+        result = self.runner.invoke(products_archive, ["--days", "-1"])
+        self.assertNotEqual(result.exit_code, 0)
@@ -0,0 +1,159 @@
+"""
+Test cases for background Import Jobs
+
+"""
+import json
+from unittest.mock import MagicMock, patch
+import msgpack
+from service import app, import_jobs
+from service.models import db, ImportJob, ImportStatus, Product
+from service.import_jobs import parse_rows, run_import
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+CSV_HEADER = "name,description,price,available,image_url,category\n"
+
+
+######################################################################
+#  I M P O R T   J O B   T E S T   C A S E S
+######################################################################
+class TestImportJobs(DatabaseTestCase):
+    """Test Cases for Import Jobs"""
+
+    def setUp(self):
+        """This runs before each test"""
+        super().setUp()
+        app.config["IMPORT_CHUNK_SIZE"] = 2
+
+    def _run(self, fmt, payload):
+        """Creates a job and runs it in this thread"""
+        job = ImportJob(format=fmt)
+        job.create()
+        run_import(app, job.id, payload)
+        db.session.expire_all()
+        return ImportJob.find(job.id)
+
+    ######################################################################
+    #  T E S T   C A S E S
+    ######################################################################
+
+    def test_parse_json(self):
+        """It should parse a JSON array payload"""
+        rows = [ProductFactory().to_dict() for _ in range(3)]
+        self.assertEqual(parse_rows(json.dumps(rows).encode(), "json"), rows)
+
+    def test_parse_json_not_array(self):
+        """It should reject a JSON payload that is not an array"""
+        self.assertRaises(ValueError, parse_rows, b'{"name": "x"}', "json")
+
+    def test_parse_msgpack(self):
+        """It should parse a MessagePack array payload"""
+        rows = [ProductFactory().serialize() for _ in range(3)]
+        self.assertEqual(parse_rows(msgpack.packb(rows), "msgpack"), rows)
+        self.assertRaises(ValueError, parse_rows, msgpack.packb({"name": "x"}), "msgpack")
+        self.assertRaises(ValueError, parse_rows, b"\xc1", "msgpack")
+
+    def test_parse_ndjson(self):
+        """It should parse a NDJSON payload skipping blank lines"""
+        rows = [ProductFactory().to_dict() for _ in range(3)]
+        payload = "\n".join(json.dumps(row) for row in rows) + "\n\n"
+        self.assertEqual(parse_rows(payload.encode(), "ndjson"), rows)
+
+    def test_parse_csv(self):
+        """It should parse a CSV payload into typed rows"""
+        payload = CSV_HEADER + "Ball,,9.99,TRUE,,TOYS\n"
+        rows = parse_rows(payload.encode(), "csv")
+        self.assertEqual(
+            rows,
+            [
+                {
+                    "name": "Ball",
+                    "description": None,
+                    "price": 9.99,
+                    "available": True,
+                    "image_url": None,
+                    "category": "TOYS",
+                }
+            ],
+        )
+
+    def test_parse_unknown_format(self):
+        """It should reject an unknown format"""
+        self.assertRaises(ValueError, parse_rows, b"", "xml")
+
+    def test_run_import(self):
+        """It should import every row in chunks and record progress"""
+        rows = [ProductFactory().to_dict() for _ in range(5)]
+        job = self._run("json", json.dumps(rows).encode())
+        self.assertEqual(job.status, ImportStatus.COMPLETED)
+        self.assertEqual(job.total_rows, 5)
+        self.assertEqual(job.processed_rows, 5)
+        self.assertEqual(job.created_rows, 5)
+        self.assertEqual(job.failed_rows, 0)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(len(Product.all()), 5)
+
+    def test_run_import_row_errors(self):
+        """It should skip bad rows and report them by index"""
+        payload = (
+            CSV_HEADER
+            + "Ball,,9.99,true,,TOYS\n"
+            + "Bat,,19.99,true,,sports\n"
+            + "Kite,,4.50,maybe,,TOYS\n"
+            + "Soap,,1.25,false,,PERSONAL_CARE\n"
+        )
+        job = self._run("csv", payload.encode())
+        self.assertEqual(job.status, ImportStatus.COMPLETED)
+        self.assertEqual(job.created_rows, 2)
+        self.assertEqual(job.failed_rows, 2)
+        self.assertEqual([error["row"] for error in job.errors], [1, 2])
+        self.assertEqual(len(Product.all()), 2)
+
+    def test_run_import_bad_payload(self):
+        """It should fail a job whose payload can't be parsed"""
+        job = self._run("json", b"[not json")
+        self.assertEqual(job.status, ImportStatus.FAILED)
+        self.assertIn("Unable to parse payload", job.message)
+        self.assertEqual(len(Product.all()), 0)
+
+    @patch("service.import_jobs.parse_rows", side_effect=KeyError("name"))
+    def test_run_import_unexpected_error(self, _parse_mock):
+        """It should fail a job on any error instead of leaving it RUNNING"""
+        job = self._run("json", b"[]")
+        self.assertEqual(job.status, ImportStatus.FAILED)
+        self.assertIn("KeyError", job.message)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_run_import_stopping(self):
+        """It should fail the jobs a stopping worker has not started"""
+        import_jobs._stopping.set()  # pylint: disable=protected-access
+        try:
+            job = self._run("json", json.dumps([ProductFactory().to_dict()]).encode())
+        finally:
+            import_jobs._stopping.clear()  # pylint: disable=protected-access
+        self.assertEqual(job.status, ImportStatus.FAILED)
+        self.assertIn("exited", job.message)
+        self.assertEqual(len(Product.all()), 0)
+
+    def test_stop(self):
+        """It should wait for the pool and leave a new one for the next job"""
+        executor = MagicMock()
+        with patch.object(import_jobs, "_executor", executor):
+            import_jobs.stop()
+            self.assertIsNone(import_jobs._executor)  # pylint: disable=protected-access
+        executor.shutdown.assert_called_once_with(wait=True)
+        self.assertFalse(import_jobs._stopping.is_set())  # pylint: disable=protected-access
+
+    def test_run_import_missing_job(self):
+        """It should ignore a job that no longer exists"""
+        run_import(app, 0, b"[]")
+        self.assertEqual(len(Product.all()), 0)
+
+    def test_serialize_import_job(self):
+        """It should serialize an Import Job with its throughput"""
+        job = self._run("ndjson", json.dumps(ProductFactory().to_dict()).encode())
+        data = job.serialize()
+        self.assertEqual(data["status"], "COMPLETED")
+        self.assertEqual(data["format"], "ndjson")
+        self.assertIn("rows_per_second", data)
+        self.assertEqual(str(job), f"<ImportJob ndjson id=[{job.id}] COMPLETED>")
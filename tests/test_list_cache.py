@@ -0,0 +1,111 @@
+"""
+Test cases for the List Response Cache
+
+"""
+import base64
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from service import app, list_cache
+from service.common import status
+from service.models import Product
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+BASE_URL = "/products"
+
+
+######################################################################
+#  L I S T   C A C H E   T E S T   C A S E S
+######################################################################
+class TestListCache(TestCase):
+    """Test Cases for the ListCache"""
+
+    def test_generation(self):
+        """It should only return entries of the same generation"""
+        cache = list_cache.ListCache(1000, 60)
+        cache.put("key", 1, b"[]", "next")
+        self.assertEqual(cache.get("key", 1), (b"[]", "next"))
+        self.assertIsNone(cache.get("key", 2))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_max_age(self):
+        """It should expire old entries"""
+        cache = list_cache.ListCache(1000, 60)
+        with patch("service.list_cache.time.monotonic", return_value=100.0):
+            cache.put("key", 1, b"[]")
+        with patch("service.list_cache.time.monotonic", return_value=159.0):
+            self.assertEqual(cache.get("key", 1), (b"[]", None))
+        with patch("service.list_cache.time.monotonic", return_value=160.0):
+            self.assertIsNone(cache.get("key", 1))
+
+    def test_max_bytes(self):
+        """It should drop the least recently used entries to stay in its size"""
+        cache = list_cache.ListCache(800, 60)
+        cache.put("big", 1, b"x" * 101)
+        self.assertEqual(len(cache), 0)
+        for key in ("a", "b", "c", "d", "e", "f", "g", "h"):
+            cache.put(key, 1, b"x" * 100)
+        cache.get("a", 1)
+        cache.put("a", 1, b"x" * 100)
+        cache.put("i", 1, b"x" * 100)
+        self.assertEqual(cache.size, 800)
+        self.assertIsNone(cache.get("b", 1))
+        self.assertIsNotNone(cache.get("a", 1))
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+
+class TestListCacheRoutes(DatabaseTestCase):
+    """Test Cases for cached GET /products responses"""
+
+    def setUp(self):
+        """Turns the cache on"""
+        super().setUp()
+        app.config["LIST_CACHE_BYTES"] = 1024 * 1024
+        list_cache.current(app).clear()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Turns the cache off"""
+        app.config["LIST_CACHE_BYTES"] = 0
+        super().tearDown()
+
+    def test_cached_list(self):
+        """It should serve a repeated listing from the cache until a write"""
+        for _ in range(3):
+            ProductFactory(id=None, available=True).create()
+        with patch.object(Product, "search", wraps=Product.search) as search:
+            first = self.client.get(BASE_URL, query_string="available=true&limit=2&sort=price")
+            second = self.client.get(BASE_URL, query_string="sort=price&limit=2&available=True")
+            self.assertEqual(search.call_count, 1)
+            self.assertEqual(second.status_code, status.HTTP_200_OK)
+            self.assertEqual(second.data, first.data)
+            self.assertEqual(second.content_type, "application/json")
+            self.assertIn("sort=price", second.headers["Link"])
+            self.assertIn("available=True", second.headers["Link"])
+
+            ProductFactory(id=None, available=True, price=0).create()
+            third = self.client.get(BASE_URL, query_string="available=true&limit=2&sort=price")
+            self.assertEqual(search.call_count, 2)
+            self.assertEqual(third.get_json()[0]["price"], 0)
+
+    def test_crafted_cursor(self):
+        """It should refuse a cursor that can't be a cache key and share one entry per position"""
+        ProductFactory(id=None).create()
+
+        def cursor(position):
+            return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+        for sort in ("name", "price"):
+            response = self.client.get(BASE_URL, query_string={"sort": sort, "cursor": cursor([{"a": 1}, 2])})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.get(BASE_URL, query_string={"sort": sort, "cursor": cursor([1, [2]])})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(list_cache.current(app)), 0)
+        # the id sort ignores the value, so these are all the same position
+        for value in ({"a": 1}, [1], "x", None):
+            response = self.client.get(BASE_URL, query_string={"cursor": cursor([value, 0])})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(list_cache.current(app)), 1)
@@ -0,0 +1,130 @@
+"""
+Test cases for the Log Handlers
+
+"""
+import json
+import logging
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from service.common import log_handlers
+from service.common.log_handlers import JsonFormatter
+
+
+class ListHandler(logging.Handler):
+    """Collects the formatted records it is given"""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+######################################################################
+#  L O G   H A N D L E R   T E S T   C A S E S
+######################################################################
+class TestLogHandlers(unittest.TestCase):
+    """Test Cases for structured request logging"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.handler = ListHandler()
+        self.gunicorn_logger = logging.getLogger("test.gunicorn")
+        self.gunicorn_logger.handlers = [self.handler]
+        self.gunicorn_logger.setLevel(logging.INFO)
+        self.app = Flask("test_log_handlers")
+        self.app.config["LOG_SAMPLE_RATES"] = {"sampled": 0.0}
+
+        @self.app.route("/hello")
+        def hello():
+            self.app.logger.info("Saying hello", extra={"count": 2})
+            return "hello"
+
+        @self.app.route("/sampled")
+        def sampled():
+            self.app.logger.info("Routine detail")
+            self.app.logger.warning("Something odd")
+            return "sampled"
+
+        self.module_loggers = {
+            name: (logger.handlers, logger.level, logger.propagate)
+            for name, logger in ((name, logging.getLogger(name)) for name in log_handlers.MODULE_LOGGERS)
+        }
+        log_handlers.init_logging(self.app, "test.gunicorn")
+
+    def tearDown(self):
+        """This runs after each test"""
+        log_handlers.stop_listener()
+        for name, (handlers, level, propagate) in self.module_loggers.items():
+            logger = logging.getLogger(name)
+            logger.handlers = handlers
+            logger.setLevel(level)
+            logger.propagate = propagate
+
+    def _records(self) -> list:
+        """Flushes the queue and returns the logged records as dictionaries"""
+        log_handlers.stop_listener()
+        return [json.loads(line) for line in self.handler.lines]
+
+    def test_json_format(self):
+        """It should format records as JSON with their extra fields"""
+        record = logging.makeLogRecord(
+            {"name": "service", "levelno": logging.INFO, "levelname": "INFO", "msg": "Found %d", "args": (3,)}
+        )
+        record.count = 3
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "Found 3")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["count"], 3)
+
+    def test_request_logging(self):
+        """It should tag records with the request and end with a summary line"""
+        response = self.app.test_client().get("/hello", headers={"X-Request-ID": "abc123"})
+        self.assertEqual(response.headers["X-Request-ID"], "abc123")
+        records = self._records()
+        hello = next(record for record in records if record["message"] == "Saying hello")
+        self.assertEqual(hello["request_id"], "abc123")
+        self.assertEqual(hello["path"], "/hello")
+        self.assertEqual(hello["count"], 2)
+        summary = records[-1]
+        self.assertEqual(summary["message"], "GET /hello 200")
+        self.assertEqual(summary["status"], 200)
+        self.assertIn("duration_ms", summary)
+
+    def test_request_id_generated(self):
+        """It should make up a request id when the client sends none"""
+        response = self.app.test_client().get("/hello")
+        self.assertEqual(len(response.headers["X-Request-ID"]), 32)
+
+    def test_sampling(self):
+        """It should drop the info records of unsampled requests but keep warnings"""
+        self.app.test_client().get("/sampled")
+        messages = [record["message"] for record in self._records()]
+        self.assertIn("Something odd", messages)
+        self.assertNotIn("Routine detail", messages)
+        self.assertNotIn("GET /sampled 200", messages)
+
+    def test_module_loggers(self):
+        """It should send the module loggers through the same queue"""
+        logging.getLogger("flask.app").info("From a module")
+        self.assertIn("From a module", [record["message"] for record in self._records()])
+
+    def test_exceptions(self):
+        """It should keep the traceback of logged exceptions"""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.app.logger.exception("It failed")
+        record = self._records()[-1]
+        self.assertIn("ValueError: boom", record["exception"])
+
+    def test_text_format(self):
+        """It should fall back to plain text lines"""
+        self.app.config["LOG_FORMAT"] = "text"
+        with patch.object(self.app, "before_request"), patch.object(self.app, "after_request"):
+            log_handlers.init_logging(self.app, "test.gunicorn")
+        self.app.logger.info("Plain")
+        log_handlers.stop_listener()
+        self.assertTrue(self.handler.lines[-1].endswith("[INFO] [test_log_handlers] Plain"))
@@ -0,0 +1,96 @@
+"""
+Test cases for MessagePack content negotiation
+
+"""
+import json
+import msgpack
+from service import app, list_cache
+from service.common import media, status
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+BASE_URL = "/products"
+MSGPACK_HEADERS = {"Accept": media.MSGPACK}
+
+
+######################################################################
+#  M E D I A   T Y P E   T E S T   C A S E S
+######################################################################
+class TestMediaTypes(DatabaseTestCase):
+    """Test Cases for JSON and MessagePack requests and responses"""
+
+    def setUp(self):
+        """This runs before each test"""
+        super().setUp()
+        self.client = app.test_client()
+
+    def _post(self, url, data, content_type=media.MSGPACK):
+        """Posts MessagePack and asks for MessagePack back"""
+        return self.client.post(
+            url, data=msgpack.packb(data), content_type=content_type, headers=MSGPACK_HEADERS
+        )
+
+    def test_create_and_read(self):
+        """It should create, update and read a Product as MessagePack"""
+        product = ProductFactory().serialize()
+        response = self._post(BASE_URL, product)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.mimetype, media.MSGPACK)
+        self.assertIn("Accept", response.vary)
+        created = msgpack.unpackb(response.data)
+        self.assertEqual(created["name"], product["name"])
+
+        url = f"{BASE_URL}/{created['id']}"
+        response = self.client.put(
+            url,
+            data=msgpack.packb({**product, "name": "Renamed"}),
+            content_type="application/x-msgpack",
+            headers=MSGPACK_HEADERS,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(msgpack.unpackb(response.data)["name"], "Renamed")
+
+        response = self.client.get(url, headers=MSGPACK_HEADERS)
+        self.assertEqual(msgpack.unpackb(response.data), {**created, "name": "Renamed"})
+        response = self.client.get(url, headers={"Accept": "text/html"})
+        self.assertEqual(response.mimetype, media.JSON)
+        self.assertEqual(response.get_json()["name"], "Renamed")
+
+    def test_list_and_collect(self):
+        """It should create and list many Products as MessagePack"""
+        products = [ProductFactory().serialize() for _ in range(3)]
+        response = self._post(f"{BASE_URL}/collect", products)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(msgpack.unpackb(response.data)), 3)
+
+        app.config["LIST_CACHE_BYTES"] = 1024 * 1024
+        list_cache.current(app).clear()
+        try:
+            json_list = self.client.get(BASE_URL).get_json()
+            response = self.client.get(BASE_URL, headers=MSGPACK_HEADERS)
+        finally:
+            app.config["LIST_CACHE_BYTES"] = 0
+        self.assertEqual(response.mimetype, media.MSGPACK)
+        self.assertEqual(msgpack.unpackb(response.data), json_list)
+
+        response = self.client.get(f"{BASE_URL}/facets", headers=MSGPACK_HEADERS)
+        self.assertEqual(msgpack.unpackb(response.data)["total"], 3)
+
+    def test_content_type_parameters(self):
+        """It should accept a JSON body with a charset"""
+        response = self.client.post(
+            BASE_URL,
+            data=json.dumps(ProductFactory().serialize()),
+            content_type="application/json; charset=utf-8",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.mimetype, media.JSON)
+
+    def test_bad_msgpack(self):
+        """It should reject a body that isn't MessagePack"""
+        response = self.client.post(BASE_URL, data=b"\xc1", content_type=media.MSGPACK)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("MessagePack", response.get_json()["message"])
+        response = self.client.post(BASE_URL, data="x", content_type="text/plain")
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertIn(media.MSGPACK, response.get_json()["message"])
@@ -0,0 +1,77 @@
+"""
+Test cases for the Sampling Profiler
+
+"""
+import sys
+import threading
+import unittest
+from service import profiler
+from service.profiler import ProfilerBusy, Sampler
+
+
+def spin(stop):
+    """Keeps a thread busy until it is told to stop"""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+######################################################################
+#  P R O F I L E R   T E S T   C A S E S
+######################################################################
+class TestProfiler(unittest.TestCase):
+    """Test Cases for the Sampler"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=spin, args=(self.stop,), name="spinner")
+        self.thread.start()
+
+    def tearDown(self):
+        """This runs after each test"""
+        self.stop.set()
+        self.thread.join()
+
+    def test_sample(self):
+        """It should record the stacks of the other threads but not its own"""
+        sampler = Sampler()
+        sampler.sample()
+        self.assertEqual(sampler.samples, 1)
+        stacks = list(sampler.stacks)
+        spinner = [stack for stack in stacks if stack.startswith("spinner;")]
+        self.assertEqual(len(spinner), 1)
+        self.assertIn("spin (tests/test_profiler.py:", spinner[0])
+        self.assertFalse(any("test_sample" in stack for stack in stacks))
+
+    def test_idle_threads(self):
+        """It should leave out threads that are only waiting unless asked"""
+        waiter = threading.Thread(target=self.stop.wait, name="waiter")
+        waiter.start()
+        self.assertFalse(any(stack.startswith("waiter;") for stack in Sampler().run(0.05).stacks))
+        stacks = Sampler(include_idle=True).run(0.05).stacks
+        self.assertTrue(any(stack.startswith("waiter;") for stack in stacks))
+        self.stop.set()
+        waiter.join()
+
+    def test_run(self):
+        """It should sample for the given time and keep the overhead bounded"""
+        sampler = Sampler(interval=0.001, max_overhead=0.05).run(0.3)
+        self.assertGreater(sampler.samples, 1)
+        self.assertGreaterEqual(sampler.elapsed, 0.3)
+        self.assertLessEqual(sampler.overhead, 0.06)
+
+    def test_collapsed(self):
+        """It should write one line per stack, most frequent first"""
+        sampler = Sampler()
+        sampler.stacks.update({"main;a;b": 3, "main;a": 5})
+        self.assertEqual(sampler.collapsed(), "main;a 5\nmain;a;b 3\n")
+
+    def test_one_profile_at_a_time(self):
+        """It should not run two profiles in the same process"""
+        with Sampler._lock:  # pylint: disable=protected-access
+            self.assertRaises(ProfilerBusy, Sampler().run, 0.01)
+
+    def test_frame_label(self):
+        """It should name frames by function, file and first line"""
+        label = profiler.frame_label(sys._getframe())  # pylint: disable=protected-access
+        self.assertTrue(label.startswith("test_frame_label (tests/test_profiler.py:"))
@@ -0,0 +1,113 @@
+"""
+Test cases for routing reads to Read Replicas
+
+"""
+import os
+import shutil
+import tempfile
+from sqlalchemy import create_engine
+from service import app
+from service.models import db, Category, Product
+from service.common import read_replicas
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+
+######################################################################
+#  R E A D   R E P L I C A   T E S T   C A S E S
+######################################################################
+class TestReadReplicas(DatabaseTestCase):
+    """Test Cases for Read Replica routing"""
+
+    def setUp(self):
+        """This runs before each test"""
+        super().setUp()
+        self.client = app.test_client()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """This runs after each test"""
+        super().tearDown()
+        app.config["DATABASE_REPLICA_URIS"] = []
+        read_replicas.init_replicas(app)
+        shutil.rmtree(self.tmpdir)
+
+    def _make_replica(self, name, product_name):
+        """Creates a SQLite replica holding a single Product"""
+        uri = f"sqlite:///{os.path.join(self.tmpdir, name)}"
+        engine = create_engine(uri)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(
+                Product.__table__.insert().values(
+                    name=product_name, price=1.0, available=True, category=Category.TOYS
+                )
+            )
+        engine.dispose()
+        return uri
+
+    def _use_replicas(self, *uris):
+        """Points the replica pool at the given databases"""
+        app.config["DATABASE_REPLICA_URIS"] = list(uris)
+        read_replicas.init_replicas(app)
+
+    ######################################################################
+    #  T E S T   C A S E S
+    ######################################################################
+
+    def test_no_replicas(self):
+        """It should read from the primary when no replicas are configured"""
+        self.assertIsNone(read_replicas.get_pool())
+        ProductFactory(name="Primary").create()
+        db.session.remove()
+        self.assertEqual([p.name for p in Product.all()], ["Primary"])
+
+    def test_reads_use_replica(self):
+        """It should answer the read-only finders from a replica"""
+        self._use_replicas(self._make_replica("a.db", "Replica"))
+        self.assertEqual([p.name for p in Product.all()], ["Replica"])
+        self.assertEqual(len(Product.find_by_name("Replica")), 1)
+        self.assertEqual(Product.search(category="TOYS").count(), 1)
+
+    def test_read_your_writes(self):
+        """It should read from the primary once the session has written"""
+        self._use_replicas(self._make_replica("a.db", "Replica"))
+        product = ProductFactory(name="Primary")
+        product.create()
+        self.assertEqual([p.name for p in Product.all()], ["Primary"])
+        self.assertEqual(Product.find(product.id).name, "Primary")
+
+    def test_write_requests_use_primary(self):
+        """It should read from the primary while handling a write request"""
+        ProductFactory(name="Primary").create()
+        db.session.remove()
+        self._use_replicas(self._make_replica("a.db", "Replica"))
+        with app.test_request_context("/products", method="GET"):
+            self.assertEqual([p.name for p in Product.all()], ["Replica"])
+        db.session.remove()
+        with app.test_request_context("/products/1", method="PUT"):
+            self.assertEqual([p.name for p in Product.all()], ["Primary"])
+
+    def test_round_robin(self):
+        """It should spread reads across every replica"""
+        self._use_replicas(
+            self._make_replica("a.db", "Replica A"), self._make_replica("b.db", "Replica B")
+        )
+        names = set()
+        for _ in range(4):
+            names.update(p.name for p in Product.all())
+            db.session.remove()
+        self.assertEqual(names, {"Replica A", "Replica B"})
+
+    def test_eject_failed_replica(self):
+        """It should eject a broken replica and fall back to the primary"""
+        ProductFactory(name="Primary").create()
+        db.session.remove()
+        broken = f"sqlite:///{os.path.join(self.tmpdir, 'missing', 'x.db')}"
+        self._use_replicas(broken)
+        self.assertEqual([p.name for p in Product.all()], ["Primary"])
+        self.assertIsNone(read_replicas.get_pool().choose())
+        pool = read_replicas.get_pool()
+        pool.eject_seconds = 0
+        pool.eject(pool.engines[0])
+        self.assertIs(pool.choose(), pool.engines[0])
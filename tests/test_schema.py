@@ -0,0 +1,131 @@
+"""
+Test cases for the compiled Product schema
+
+"""
+from decimal import Decimal
+from unittest import TestCase
+from service.common.schema import Field, Schema, SchemaError
+from service.models import Category, DataValidationError, PRODUCT_SCHEMA
+from tests.factories import ProductFactory
+
+
+######################################################################
+#  S C H E M A   T E S T   C A S E S
+######################################################################
+class TestSchema(TestCase):
+    """Test Cases for Schema and Field"""
+
+    def setUp(self):
+        """Declares a small schema"""
+        self.schema = Schema(
+            "Thing",
+            Field("name", str, max_length=5),
+            Field("note", str, required=False, nullable=True),
+            Field("count", convert=int),
+        )
+
+    def test_valid(self):
+        """It should convert the values of the known keys and ignore the others"""
+        values = self.schema.validate({"name": "a", "count": "3", "id": 7})
+        self.assertEqual(values, {"name": "a", "note": None, "count": 3})
+
+    def test_every_error(self):
+        """It should report every bad field at once"""
+        with self.assertRaises(SchemaError) as context:
+            self.schema.validate({"name": "too long", "note": 1})
+        self.assertEqual(
+            context.exception.errors,
+            [
+                {"field": "name", "error": "must be at most 5 characters"},
+                {"field": "note", "error": "must be a string"},
+                {"field": "count", "error": "is required"},
+            ],
+        )
+        self.assertIn("name: must be at most 5 characters; note: must be a string", str(context.exception))
+
+    def test_not_an_object(self):
+        """It should refuse a body that isn't an object"""
+        with self.assertRaises(SchemaError) as context:
+            self.schema.validate(["name"])
+        self.assertEqual(str(context.exception), "Invalid Thing: must be an object, not list")
+
+    def test_partial(self):
+        """It should only check the keys that are present"""
+        self.assertEqual(self.schema.validate({"count": 2}, partial=True), {"count": 2})
+        self.assertRaises(SchemaError, self.schema.validate, {"name": None}, partial=True)
+
+    def test_validate_many(self):
+        """It should keep the valid rows and report the errors of the others by row"""
+        valid, errors = self.schema.validate_many([{"name": "a", "count": 1}, {"count": "x"}, "x"], start=10)
+        self.assertEqual(valid, [(10, {"name": "a", "note": None, "count": 1})])
+        self.assertEqual([(error["row"], error["field"]) for error in errors], [(11, "name"), (11, "count"), (12, None)])
+        self.assertIn("row 11 name: is required", self.schema.message(errors))
+        self.assertRaises(SchemaError, self.schema.validate_many, {"name": "a"})
+
+    def test_generated_matches_fields(self):
+        """It should accept and convert exactly what the checks of the fields do"""
+        schema = Schema(
+            "Thing",
+            Field("name", str, max_length=5),
+            Field("size", int, required=False),
+            Field("category", choices=Category, required=False, nullable=True),
+            Field("count", convert=int),
+        )
+        bodies = [
+            {"name": "a", "count": "3"},
+            {"name": "abcdef", "count": 1},
+            {"name": "a", "count": "x"},
+            {"name": "a", "count": 1, "size": None},
+            {"name": "a", "count": 1, "size": True},
+            {"name": "a", "count": 1, "size": 2, "category": "TOYS"},
+            {"name": "a", "count": 1, "category": ["TOYS"]},
+            {"name": "a", "count": 1, "category": None},
+            {"count": 1},
+            ["name"],
+        ]
+        for body in bodies:
+            values, errors = schema.check(body)
+            generated = schema._values(None, body)  # pylint: disable=protected-access
+            self.assertEqual(generated, None if errors else values, body)
+
+    def test_apply(self):
+        """It should set the values of a valid body and leave the target alone otherwise"""
+        thing = type("Thing", (), {})()
+        self.assertIs(self.schema.apply(thing, {"name": "a", "count": "3"}), thing)
+        self.assertEqual(vars(thing), {"name": "a", "note": None, "count": 3})
+        self.assertRaises(SchemaError, self.schema.apply, thing, {"name": "b", "count": "x"})
+        self.assertEqual(thing.name, "a")
+        self.schema.apply(thing, {"note": "new"}, partial=True)
+        self.assertEqual(vars(thing), {"name": "a", "note": "new", "count": 3})
+
+    def test_message_limit(self):
+        """It should spell out the first errors and count the rest"""
+        errors = [{"row": row, "field": "name", "error": "is required"} for row in range(8)]
+        self.assertTrue(self.schema.message(errors).endswith("row 4 name: is required; 3 more"))
+
+
+class TestProductSchema(TestCase):
+    """Test Cases for PRODUCT_SCHEMA"""
+
+    def test_product(self):
+        """It should convert a serialized Product to column values"""
+        data = ProductFactory().serialize()
+        values = PRODUCT_SCHEMA.validate(data)
+        self.assertEqual(values["category"].name, data["category"])
+        self.assertIsInstance(values["price"], Decimal)
+        self.assertNotIn("id", values)
+
+    def test_bad_product(self):
+        """It should list every bad field of a Product"""
+        data = {"name": 1, "price": "cheap", "available": "true", "category": "toys"}
+        with self.assertRaises(DataValidationError) as context:
+            PRODUCT_SCHEMA.validate(data)
+        self.assertEqual(
+            [error["field"] for error in context.exception.errors], ["name", "price", "available", "category"]
+        )
+
+    def test_optional_fields(self):
+        """It should leave out description and image_url as None but require the rest"""
+        values = PRODUCT_SCHEMA.validate({"name": "Ball", "price": 1, "available": True, "category": "TOYS"})
+        self.assertEqual((values["description"], values["image_url"], values["category"]), (None, None, Category.TOYS))
+        self.assertRaises(DataValidationError, PRODUCT_SCHEMA.validate, {"name": "x" * 64})
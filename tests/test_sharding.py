@@ -0,0 +1,169 @@
+"""
+Test cases for the product table sharded over several databases
+
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from sqlalchemy import create_engine
+from service import app
+from service.common import sharding, status
+from service.models import db, Product, ProductChange, ProductFacet, ProductId
+from service.snapshot import CatalogSnapshot, build_snapshot
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+BASE_URL = "/products"
+
+
+######################################################################
+#  S H A R D   S E T   T E S T   C A S E S
+######################################################################
+class TestShardSet(TestCase):
+    """Test Cases for picking the shard of an id"""
+
+    def test_index_for(self):
+        """It should spread consecutive ids evenly and always pick the same shard"""
+        shards = sharding.ShardSet([create_engine("sqlite://") for _ in range(3)], threads=1)
+        counts = [0, 0, 0]
+        for product_id in range(1, 3001):
+            counts[shards.index_for(product_id)] += 1
+        self.assertTrue(all(900 < count < 1100 for count in counts), counts)
+        self.assertEqual(shards.index_for(42), shards.index_for("42"))
+        groups = shards.partition([{"id": 1}, {"id": 2}, {"id": 1}], "id")
+        self.assertEqual(groups[shards.index_for(1)][-1], {"id": 1})
+        shards.dispose()
+
+    def test_restart(self):
+        """It should replace the threads of the shards, as after a fork"""
+        shards = sharding.ShardSet([create_engine("sqlite://")], threads=2)
+        executor = shards.executor
+        shards.restart()
+        self.assertIsNot(shards.executor, executor)
+        self.assertEqual(list(shards.executor.map(abs, [-1, -2])), [1, 2])
+        executor.shutdown()
+        shards.dispose()
+
+
+######################################################################
+#  S H A R D E D   P R O D U C T   T E S T   C A S E S
+######################################################################
+class TestShardedProducts(DatabaseTestCase):
+    """Test Cases for Products stored on three SQLite shards"""
+
+    transactional = False  # the shards commit on connections of their own
+
+    def setUp(self):
+        """Creates the shards"""
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        app.config["DATABASE_SHARD_URIS"] = [
+            f"sqlite:///{os.path.join(self.tmpdir, f'shard{index}.db')}" for index in range(3)
+        ]
+        sharding.init_shards(app)
+        sharding.create_all(db.metadata)
+        ProductId._free = iter(())  # pylint: disable=protected-access  # the table was emptied
+        self.shards = sharding.get_shards()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Removes the shards"""
+        super().tearDown()
+        app.config["DATABASE_SHARD_URIS"] = []
+        sharding.init_shards(app)
+        shutil.rmtree(self.tmpdir)
+
+    def _shard_ids(self, index: int) -> list:
+        """Returns the ids of the Products stored on a shard"""
+        with self.shards.engines[index].connect() as connection:
+            return sorted(connection.execute(db.select(Product.id)).scalars())
+
+    def _create(self, count: int, **kwargs) -> list:
+        """Creates Products through the API and returns them"""
+        products = []
+        for _ in range(count):
+            data = ProductFactory(**kwargs).serialize()
+            response = self.client.post(BASE_URL, json=data)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            products.append(response.get_json())
+        return products
+
+    ######################################################################
+    #  T E S T   C A S E S
+    ######################################################################
+
+    def test_rows_live_on_their_shard(self):
+        """It should store each Product on the shard of its id and the rest on the primary"""
+        products = self._create(12)
+        ids = [product["id"] for product in products]
+        self.assertEqual(len(set(ids)), 12)
+        for index in range(3):
+            expected = sorted(i for i in ids if self.shards.index_for(i) == index)
+            self.assertEqual(self._shard_ids(index), expected)
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute(db.select(Product.id)).all(), [])
+        self.assertEqual(ProductFacet.counts()["total"], 12)
+        self.assertEqual(len(ProductChange.since(0, 100)), 12)
+
+    def test_read_update_delete(self):
+        """It should read, change and delete a Product on its shard"""
+        product = self._create(1, name="Sharded")[0]
+        url = f"{BASE_URL}/{product['id']}"
+        response = self.client.get(url)
+        self.assertEqual(response.get_json()["name"], "Sharded")
+
+        response = self.client.put(url, json={**product, "name": "Renamed"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).get_json()["name"], "Renamed")
+        response = self.client.put(f"{url}/change_availability")
+        self.assertEqual(response.get_json()["available"], not product["available"])
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(sum(len(self._shard_ids(index)) for index in range(3)), 0)
+
+    def test_list_merges_shards(self):
+        """It should page through every shard in sort order"""
+        products = self._create(15) + self._create(3, price=10.5)  # ties are ordered by id
+        expected = sorted(products, key=lambda product: (product["price"], product["id"]), reverse=True)
+        listed = []
+        url = f"{BASE_URL}?sort=-price&limit=4"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            page = response.get_json()
+            self.assertLessEqual(len(page), 4)
+            listed += page
+            link = response.headers.get("Link")
+            url = link[1:link.index(">")] if link else None
+        self.assertEqual([p["id"] for p in listed], [p["id"] for p in expected])
+
+    def test_stats_and_facets(self):
+        """It should summarize and count the Products of every shard"""
+        self._create(5, available=True)
+        self._create(4, available=False)
+        response = self.client.get(f"{BASE_URL}/stats")
+        self.assertEqual(response.get_json()["all"]["count"], 9)
+        before = ProductFacet.counts()
+        ProductFacet.rebuild()
+        self.assertEqual(ProductFacet.counts(), before)
+        self.assertEqual(before["available"], {"true": 5, "false": 4})
+
+    def test_snapshot(self):
+        """It should write the Products of every shard to the snapshot in id order"""
+        ids = [product["id"] for product in self._create(7)]
+        path = os.path.join(self.tmpdir, "catalog.snapshot")
+        self.assertEqual(build_snapshot(path, chunk_size=2), 7)
+        catalog = CatalogSnapshot(path)
+        self.assertEqual([catalog.get(product_id)["id"] for product_id in ids], ids)
+
+    def test_bulk_delete_refused(self):
+        """It should refuse bulk ORM deletes it can't route and answer 501"""
+        with self.assertRaises(sharding.ShardingError) as refused:
+            db.session.query(Product).delete()
+        db.session.rollback()
+        with app.test_request_context():
+            response = app.make_response(app.handle_user_exception(refused.exception))
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertEqual(response.get_json()["error"], "Not Implemented")
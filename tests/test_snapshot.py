@@ -0,0 +1,194 @@
+"""
+Test cases for the memory-mapped Catalog Snapshot
+
+"""
+import os
+import shutil
+import tempfile
+from service import app
+from service.models import Category, Product
+from service.common import status
+from service.common.cli_commands import snapshot_build
+from service.snapshot import (
+    build_snapshot,
+    CatalogSnapshot,
+    SnapshotError,
+    SnapshotStore,
+)
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+
+######################################################################
+#  S N A P S H O T   T E S T   C A S E S
+######################################################################
+class TestCatalogSnapshot(DatabaseTestCase):
+    """Test Cases for the Catalog Snapshot"""
+
+    def setUp(self):
+        """This runs before each test"""
+        super().setUp()
+        self.client = app.test_client()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "catalog.snap")
+
+    def tearDown(self):
+        """This runs after each test"""
+        super().tearDown()
+        app.config["CATALOG_SNAPSHOT_PATH"] = None
+        shutil.rmtree(self.tmpdir)
+
+    def _create_products(self, count):
+        """Creates products in the database"""
+        products = []
+        for _ in range(count):
+            product = ProductFactory()
+            product.create()
+            products.append(product)
+        return products
+
+    ######################################################################
+    #  T E S T   C A S E S
+    ######################################################################
+
+    def test_build_and_get(self):
+        """It should find every Product in a snapshot by id"""
+        products = self._create_products(5)
+        products[0].description = None
+        products[0].name = "Café ☕"
+        products[0].update()
+        self.assertEqual(build_snapshot(self.path, chunk_size=2), 5)
+        catalog = CatalogSnapshot(self.path)
+        self.assertEqual(len(catalog), 5)
+        for product in products:
+            self.assertEqual(catalog.get(product.id), product.serialize())
+        self.assertIsNone(catalog.get(0))
+        self.assertIsNone(catalog.get(max(p.id for p in products) + 1))
+
+    def test_empty_snapshot(self):
+        """It should build and read an empty snapshot"""
+        self.assertEqual(build_snapshot(self.path), 0)
+        catalog = CatalogSnapshot(self.path)
+        self.assertEqual(len(catalog), 0)
+        self.assertIsNone(catalog.get(1))
+        self.assertEqual(list(catalog.filter()), [])
+
+    def test_filter(self):
+        """It should filter a snapshot by category, name and availability"""
+        products = self._create_products(10)
+        build_snapshot(self.path)
+        catalog = CatalogSnapshot(self.path)
+        category = products[0].category
+        expected = [p.id for p in products if p.category == category and p.available]
+        found = [p["id"] for p in catalog.filter(category=category.name, available=True)]
+        self.assertEqual(found, expected)
+        found = [p["id"] for p in catalog.filter(name=products[1].name)]
+        self.assertEqual(found, [p.id for p in products if p.name == products[1].name])
+        self.assertEqual(list(catalog.filter(category="toys")), [])
+
+    def test_search(self):
+        """It should sort and page a snapshot like the database"""
+        products = self._create_products(8)
+        build_snapshot(self.path)
+        catalog = CatalogSnapshot(self.path)
+        expected = [p.serialize() for p in Product.search(sort="-price", max_price=500)]
+        self.assertEqual(catalog.search(sort="-price", max_price=500), expected)
+        first = catalog.search(sort="name", limit=3)
+        self.assertEqual(first, [p.serialize() for p in Product.search(sort="name", limit=3)])
+        after = (first[-1]["name"], first[-1]["id"])
+        rest = catalog.search(sort="name", after=after)
+        self.assertEqual([p["id"] for p in first + rest], [p.id for p in Product.search(sort="name")])
+        self.assertEqual(catalog.search(after=(products[-1].id, products[-1].id)), [])
+
+    def test_page_tied_prices(self):
+        """It should page through tied prices from the snapshot like the database"""
+        for _ in range(6):
+            ProductFactory(price=19.99).create()
+        build_snapshot(self.path)
+        app.config["CATALOG_SNAPSHOT_PATH"] = self.path
+        for sort in ("price", "-price"):
+            expected = [p.id for p in Product.search(sort=sort)]
+            listed = []
+            url = f"/products?sort={sort}&limit=2"
+            while url and len(listed) <= len(expected):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                listed += [p["id"] for p in response.get_json()]
+                link = response.headers.get("Link")
+                url = link[1:link.index(">")] if link else None
+            self.assertEqual(listed, expected, sort)
+
+    def test_price_summary(self):
+        """It should compute the same price statistics as the database"""
+        products = self._create_products(12)
+        build_snapshot(self.path)
+        catalog = CatalogSnapshot(self.path)
+        self.assertEqual(catalog.price_summary(), Product.price_summary())
+        category = products[0].category.name
+        self.assertEqual(
+            catalog.price_summary((25, 75), category=category, available=True, max_price=800),
+            Product.price_summary((25, 75), category=category, available=True, max_price=800),
+        )
+        self.assertEqual(
+            catalog.price_summary(name=products[1].name), Product.price_summary(name=products[1].name)
+        )
+        self.assertEqual(catalog.price_summary(category="toys")["all"]["count"], 0)
+
+    def test_corrupt_snapshot(self):
+        """It should reject files that are not snapshots"""
+        with open(self.path, "wb") as file:
+            file.write(b"PC")
+        self.assertRaises(SnapshotError, CatalogSnapshot, self.path)
+        with open(self.path, "wb") as file:
+            file.write(b"X" * 64)
+        self.assertRaises(SnapshotError, CatalogSnapshot, self.path)
+
+    def test_store_swaps_snapshot(self):
+        """It should swap in a rebuilt snapshot and keep the old one if the new one is bad"""
+        store = SnapshotStore(self.path, refresh_seconds=0)
+        self.assertIsNone(store.current())
+        self._create_products(2)
+        build_snapshot(self.path)
+        first = store.current()
+        self.assertEqual(len(first), 2)
+        self.assertIs(store.current(), first)
+        self._create_products(1)
+        build_snapshot(self.path)
+        second = store.current()
+        self.assertEqual(len(second), 3)
+        self.assertEqual(len(first), 2)  # readers of the old snapshot are unaffected
+        with open(self.path, "wb") as file:
+            file.write(b"garbage")
+        self.assertIs(store.current(), second)
+
+    def test_routes_use_snapshot(self):
+        """It should serve reads from the snapshot when one is configured"""
+        products = self._create_products(4)
+        build_snapshot(self.path)
+        Product.find(products[0].id).delete()  # only the snapshot still has it
+        app.config["CATALOG_SNAPSHOT_PATH"] = self.path
+
+        response = self.client.get(f"/products/{products[0].id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), products[0].serialize())
+        response = self.client.get("/products/0")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get("/products")
+        self.assertEqual(len(response.get_json()), 4)
+        available = products[1].available
+        response = self.client.get("/products", query_string=f"available={available}")
+        expected = [p for p in products if p.available == available]
+        self.assertEqual(len(response.get_json()), len(expected))
+
+    def test_snapshot_build_command(self):
+        """It should build a snapshot from the CLI"""
+        self._create_products(3)
+        runner = app.test_cli_runner()
+        result = runner.invoke(snapshot_build, [])
+        self.assertNotEqual(result.exit_code, 0)
+        app.config["CATALOG_SNAPSHOT_PATH"] = self.path
+        result = runner.invoke(snapshot_build, [])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(CatalogSnapshot(self.path)), 3)
+        self.assertEqual(Category.TOYS.value, 2)
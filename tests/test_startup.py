@@ -0,0 +1,68 @@
+"""
+Test cases for application startup
+
+"""
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+# The database lives in a directory that doesn't exist, so any attempt to
+# connect while starting up would fail
+UNREACHABLE_DATABASE_URI = "sqlite:////nonexistent-directory/products.db"
+
+PROBE = """
+from service import app
+response = app.test_client().get("/health")
+print(response.status_code)
+"""
+
+SECOND_APP_PROBE = """
+from service import app, create_app
+second = create_app()
+client = second.test_client()
+print(client.get("/health").status_code, client.get("/nowhere").get_json()["error"], "db-init" in second.cli.commands)
+"""
+
+
+PROXY_PROBE = """
+from service import app
+print(type(app.wsgi_app).__name__, app.wsgi_app.x_for)
+"""
+
+
+class TestStartup(TestCase):
+    """Application factory tests"""
+
+    def _start(self, probe=PROBE, **env):
+        """Imports the service in a fresh interpreter"""
+        return subprocess.run(
+            [sys.executable, "-c", probe],
+            capture_output=True,
+            text=True,
+            check=False,
+            env={**os.environ, "DATABASE_URI": UNREACHABLE_DATABASE_URI, **env},
+        )
+
+    def test_startup_does_not_connect(self):
+        """It should start and serve /health without touching the database"""
+        result = self._start()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "200")
+
+    def test_auto_create_needs_database(self):
+        """It should exit with code 4 when asked to create tables it can't reach"""
+        result = self._start(DATABASE_AUTO_CREATE="true")
+        self.assertEqual(result.returncode, 4)
+
+    def test_second_app(self):
+        """It should give every application it creates the routes, error handlers and commands"""
+        result = self._start(SECOND_APP_PROBE)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "200 Not Found True")
+
+    def test_proxy_fix(self):
+        """It should trust the forwarded headers of PROXY_FIX_HOPS proxies"""
+        result = self._start(PROXY_PROBE, PROXY_FIX_HOPS="1")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "ProxyFix 1")
@@ -0,0 +1,79 @@
+"""
+Test cases for Static Asset caching
+
+"""
+import json
+import logging
+import re
+import unittest
+from service import app
+from service.common import static_assets, status
+from service.models import Category
+
+
+######################################################################
+#  S T A T I C   A S S E T S   T E S T   C A S E S
+######################################################################
+class TestStaticAssets(unittest.TestCase):
+    """Test Cases for versioned static assets and cached responses"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """This runs before each test"""
+        self.client = app.test_client()
+        self.manifest = static_assets.get_manifest()
+
+    def test_manifest(self):
+        """It should hash every file in the static folder"""
+        with open(f"{app.static_folder}/js/rest_api.js", "rb") as file:
+            expected = static_assets.content_hash(file.read())
+        self.assertEqual(self.manifest["js/rest_api.js"], expected)
+        self.assertIn("css/cerulean_bootstrap.min.css", self.manifest)
+
+    def test_versioned_html(self):
+        """It should add hashes to known assets and leave the rest alone"""
+        html = '<script src="static/a.js"></script><link href="static/b.css"><img src="other.png">'
+        self.assertEqual(
+            static_assets.versioned_html(html, {"a.js": "1234"}),
+            '<script src="static/a.js?v=1234"></script><link href="static/b.css"><img src="other.png">',
+        )
+
+    def test_index(self):
+        """It should serve index.html with versioned asset URLs and an ETag"""
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        html = response.get_data(as_text=True)
+        self.assertIn(f'src="static/js/rest_api.js?v={self.manifest["js/rest_api.js"]}"', html)
+        self.assertIsNone(re.search(r'(src|href)\s*=\s*"static/[^"?]+"', html))
+        response = self.client.get("/", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_immutable_assets(self):
+        """It should let browsers keep assets requested by their current hash"""
+        version = self.manifest["js/rest_api.js"]
+        response = self.client.get(f"/static/js/rest_api.js?v={version}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Cache-Control"], static_assets.IMMUTABLE)
+        response.close()
+        for url in ("/static/js/rest_api.js", "/static/js/rest_api.js?v=stale"):
+            response = self.client.get(url)
+            self.assertEqual(response.headers["Cache-Control"], "no-cache")
+            response.close()
+
+    def test_categories(self):
+        """It should serve the categories with an ETag and a long max-age"""
+        response = self.client.get("/categories")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.data), [category.name for category in Category])
+        self.assertEqual(
+            response.headers["Cache-Control"], f"public, max-age={app.config['CATEGORIES_MAX_AGE']}"
+        )
+        response = self.client.get("/categories", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
@@ -0,0 +1,129 @@
+"""
+Test cases for rate limiting and load shedding
+
+"""
+import unittest
+from unittest.mock import patch
+from service import app
+from service.models import db, Product
+from service.common import status, throttling
+from service.common.throttling import LoadShedder, RateLimiter, TokenBucket
+from tests.database import DatabaseTestCase
+
+
+######################################################################
+#  T H R O T T L I N G   T E S T   C A S E S
+######################################################################
+class TestThrottling(unittest.TestCase):
+    """Test Cases for the token buckets and the load shedder"""
+
+    def test_token_bucket(self):
+        """It should spend tokens and refill them over time"""
+        bucket = TokenBucket(rate=2.0, capacity=4.0, now=0.0)
+        self.assertEqual(bucket.take(3, now=0.0), 0)
+        self.assertEqual(bucket.take(2, now=0.0), 0.5)  # 1 token left, 1 missing at 2/s
+        self.assertEqual(bucket.take(2, now=0.5), 0)
+        bucket.take(0, now=100.0)
+        self.assertEqual(bucket.tokens, 4.0)  # never more than the capacity
+
+    def test_rate_limiter_per_client(self):
+        """It should keep a separate bucket for each client"""
+        limiter = RateLimiter(rate=1.0, burst=2.0, costs={"list_products": 2.0})
+        self.assertEqual(limiter.cost("list_products"), 2.0)
+        self.assertEqual(limiter.cost("read_products"), 1.0)
+        self.assertEqual(limiter.check("a", 2.0), 0)
+        self.assertGreater(limiter.check("a", 1.0), 0)
+        self.assertEqual(limiter.check("b", 1.0), 0)
+
+    def test_rate_limiter_forgets_old_clients(self):
+        """It should only remember the most recent clients"""
+        limiter = RateLimiter(rate=1.0, burst=1.0, costs={}, max_clients=2)
+        for client in ("a", "b", "c"):
+            limiter.check(client, 1.0)
+        self.assertEqual(limiter.check("a", 1.0), 0)  # a was forgotten, so it has a full bucket
+        self.assertGreater(limiter.check("c", 1.0), 0)
+
+    def test_rate_limiter_caps_cost(self):
+        """It should let a request through that costs more than the burst"""
+        limiter = RateLimiter(rate=1.0, burst=2.0, costs={})
+        self.assertEqual(limiter.check("a", 10.0), 0)
+
+    def test_load_shedder_in_flight(self):
+        """It should be overloaded with too many requests in flight"""
+        shedder = LoadShedder(max_in_flight=2, max_pool_wait=0)
+        shedder.enter()
+        self.assertFalse(shedder.overloaded())
+        shedder.enter()
+        self.assertTrue(shedder.overloaded())
+        shedder.leave()
+        self.assertFalse(shedder.overloaded())
+
+    def test_load_shedder_pool_wait(self):
+        """It should be overloaded while connections are slow and recover later"""
+        shedder = LoadShedder(max_in_flight=0, max_pool_wait=0.1, half_life=0.01)
+        for _ in range(10):
+            shedder.record_pool_wait(1.0)
+        self.assertTrue(shedder.overloaded())
+        later = shedder._measured_at + 1  # pylint: disable=protected-access
+        with patch("service.common.throttling.time.monotonic", return_value=later):
+            self.assertFalse(shedder.overloaded())
+
+    def test_measures_connection_wait(self):
+        """It should record how long a session waited for its connection"""
+        shedder = LoadShedder(max_in_flight=0, max_pool_wait=10)
+        with app.app_context(), patch.object(throttling, "_shedder", shedder):
+            db.create_all()
+            with patch.object(shedder, "record_pool_wait") as record:
+                db.session.commit()
+                Product.all()
+                Product.all()
+                db.session.commit()
+            record.assert_called_once()
+
+
+######################################################################
+#  T H R O T T L E D   R O U T E   T E S T   C A S E S
+######################################################################
+class TestThrottledRoutes(DatabaseTestCase):
+    """Test Cases for throttled requests"""
+
+    def setUp(self):
+        """This runs before each test"""
+        super().setUp()
+        self.client = app.test_client()
+
+    def test_rate_limited(self):
+        """It should answer 429 with Retry-After once a client runs out of tokens"""
+        limiter = RateLimiter(rate=0.5, burst=5.0, costs={"api.list_products": 5.0})
+        api_keys = frozenset([throttling._digest("other")])  # pylint: disable=protected-access
+        with patch.object(throttling, "_limiter", limiter), patch.object(throttling, "_api_keys", api_keys):
+            response = self.client.get("/products")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get("/products")
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response.headers["Retry-After"], "10")
+            self.assertEqual(response.get_json()["error"], "Too Many Requests")
+            # a made up key doesn't get a new bucket
+            response = self.client.get("/products", headers={"X-Api-Key": "made-up"})
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            # other clients and the health check are not affected
+            response = self.client.get("/products", headers={"X-Api-Key": "other"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get("/products", environ_overrides={"REMOTE_ADDR": "10.0.0.2"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get("/health").status_code, status.HTTP_200_OK)
+
+    def test_load_shed(self):
+        """It should answer 503 with Retry-After while overloaded"""
+        shedder = LoadShedder(max_in_flight=1, max_pool_wait=0, retry_after=3)
+        with patch.object(throttling, "_shedder", shedder):
+            response = self.client.get("/products")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(shedder.in_flight, 0)
+            shedder.enter()  # another request is still running
+            response = self.client.get("/products")
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response.headers["Retry-After"], "3")
+            self.assertEqual(self.client.get("/health").status_code, status.HTTP_200_OK)
+            shedder.leave()
+            self.assertEqual(shedder.in_flight, 0)
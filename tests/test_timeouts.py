@@ -0,0 +1,89 @@
+"""
+Test cases for request Deadlines
+
+"""
+import time
+from unittest.mock import MagicMock, patch
+from flask import g
+from service import app
+from service.models import Product
+from service.common import deadlines, status
+from service.common.deadlines import DeadlineExceeded
+from tests.database import DatabaseTestCase
+
+
+######################################################################
+#  D E A D L I N E   T E S T   C A S E S
+######################################################################
+class TestDeadlines(DatabaseTestCase):
+    """Test Cases for request deadlines"""
+
+    def setUp(self):
+        """This runs before each test"""
+        super().setUp()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """This runs after each test"""
+        g.pop("deadline", None)  # g outlives the requests while the app context is pushed
+        super().tearDown()
+
+    def test_no_deadline_outside_requests(self):
+        """It should not limit queries made outside of a request"""
+        self.assertIsNone(deadlines.remaining())
+        Product.all()
+
+    def test_route_deadline(self):
+        """It should start each request with the deadline of its route"""
+        with app.test_request_context("/products"):
+            app.preprocess_request()
+            self.assertAlmostEqual(deadlines.remaining(), app.config["ROUTE_TIMEOUTS"]["api.list_products"], 0)
+        with app.test_request_context("/products/changes/stream"):
+            app.preprocess_request()
+            self.assertIsNone(deadlines.remaining())  # streams are not limited
+
+    def test_late_query_refused(self):
+        """It should not start a query once the deadline has passed"""
+        with app.test_request_context("/products"):
+            g.deadline = time.monotonic() - 1
+            self.assertRaises(DeadlineExceeded, Product.all)
+
+    def test_expired_request_returns_504(self):
+        """It should answer 504 when a request runs out of time"""
+        with patch.dict(app.config["ROUTE_TIMEOUTS"], {"api.list_products": 1e-9}):
+            response = self.client.get("/products")
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertEqual(response.get_json()["error"], "Gateway Timeout")
+
+    def test_statement_timeout(self):
+        """It should set statement_timeout on PostgreSQL to the time left"""
+        connection = MagicMock()
+        connection.dialect.name = "postgresql"
+        with app.test_request_context("/products"):
+            g.deadline = time.monotonic() + 2
+            deadlines._limit_transaction(None, None, connection)  # pylint: disable=protected-access
+        sql = connection.exec_driver_sql.call_args[0][0]
+        self.assertTrue(sql.startswith("SET LOCAL statement_timeout = "))
+        self.assertTrue(1900 <= int(sql.rsplit(" ", 1)[1]) <= 2000)
+
+    def test_no_statement_timeout_elsewhere(self):
+        """It should only set statement_timeout on PostgreSQL"""
+        connection = MagicMock()
+        connection.dialect.name = "sqlite"
+        with app.test_request_context("/products"):
+            g.deadline = time.monotonic() + 2
+            deadlines._limit_transaction(None, None, connection)  # pylint: disable=protected-access
+        connection.exec_driver_sql.assert_not_called()
+
+    def test_cancelled_query(self):
+        """It should report a query cancelled by statement_timeout as DeadlineExceeded"""
+        context = MagicMock()
+        context.original_exception.pgcode = deadlines.QUERY_CANCELED
+        context.sqlalchemy_exception = Exception("canceling statement due to statement timeout")
+        with app.test_request_context("/products"):
+            g.deadline = time.monotonic() + 1
+            self.assertRaises(
+                DeadlineExceeded, deadlines._translate_cancel, context  # pylint: disable=protected-access
+            )
+            context.original_exception.pgcode = "40001"
+            self.assertIsNone(deadlines._translate_cancel(context))  # pylint: disable=protected-access
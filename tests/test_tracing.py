@@ -0,0 +1,122 @@
+"""
+Test cases for request Tracing
+
+"""
+import json
+import logging
+import os
+import tempfile
+from types import SimpleNamespace
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from service import app
+from service.models import db, Product
+from service.common import status, tracing
+from service.common.log_handlers import RequestFilter
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+exporter = InMemorySpanExporter()
+
+
+######################################################################
+#  T R A C I N G   T E S T   C A S E S
+######################################################################
+class TestTracing(DatabaseTestCase):
+    """Test Cases for the spans of requests, models and SQL"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Installs a tracer provider that keeps the spans in memory"""
+        super().setUpClass()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+
+    def setUp(self):
+        """This runs before each test"""
+        super().setUp()
+        self.client = app.test_client()
+        exporter.clear()
+
+    def _spans(self) -> dict:
+        """Returns the finished spans by name"""
+        spans = {}
+        for span in exporter.get_finished_spans():
+            spans.setdefault(span.name, []).append(span)
+        return spans
+
+    def test_request_spans(self):
+        """It should trace a request with its model, SQL and JSON spans"""
+        ProductFactory().create()
+        exporter.clear()
+        response = self.client.get(
+            "/products", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        spans = self._spans()
+        request_span = spans["GET /products"][0]
+        self.assertEqual(trace.format_trace_id(request_span.context.trace_id), TRACE_ID)
+        self.assertEqual(trace.format_span_id(request_span.parent.span_id), PARENT_ID)
+        self.assertEqual(request_span.kind, trace.SpanKind.SERVER)
+        self.assertEqual(request_span.attributes["http.response.status_code"], 200)
+        search = spans["Product.search"][0]
+        self.assertEqual(search.parent.span_id, request_span.context.span_id)
+        select = spans["SELECT"][0]  # the query runs when the route reads it
+        self.assertEqual(select.parent.span_id, request_span.context.span_id)
+        self.assertIn("FROM product", select.attributes["db.statement"])
+        self.assertEqual(spans["jsonify"][0].parent.span_id, request_span.context.span_id)
+
+    def test_new_trace(self):
+        """It should start a new trace for a request without a traceparent"""
+        self.client.get("/products/0")
+        request_span = self._spans()["GET /products/<int:product_id>"][0]
+        self.assertIsNone(request_span.parent)
+        self.assertEqual(request_span.attributes["http.response.status_code"], 404)
+
+    def test_model_spans(self):
+        """It should trace the Product model methods and their statements"""
+        with tracing.tracer.start_as_current_span("test"):
+            product = ProductFactory()
+            product.create()
+            product.delete()
+        spans = self._spans()
+        self.assertIn("Product.create", spans)
+        self.assertIn("Product.delete", spans)
+        self.assertIn("INSERT", spans)
+
+    def test_untraced_statements(self):
+        """It should not trace statements outside of a trace"""
+        db.session.execute(db.select(Product)).all()
+        self.assertEqual(self._spans(), {})
+
+    def test_log_ids(self):
+        """It should put the trace and span ids on log records"""
+        record = logging.makeLogRecord({"msg": "hello"})
+        with tracing.tracer.start_as_current_span("test") as span:
+            RequestFilter().filter(record)
+        self.assertEqual(record.trace_id, trace.format_trace_id(span.get_span_context().trace_id))
+        self.assertEqual(record.span_id, trace.format_span_id(span.get_span_context().span_id))
+
+    def test_file_exporter(self):
+        """It should write spans to a file as JSON lines"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            file_exporter = tracing._exporter(  # pylint: disable=protected-access
+                SimpleNamespace(config={"TRACING_EXPORTER": "file", "TRACING_FILE": path})
+            )
+            with tracing.tracer.start_as_current_span("exported"):
+                pass
+            file_exporter.export(exporter.get_finished_spans())
+            file_exporter.shutdown()
+            with open(path, encoding="utf-8") as file:
+                span = json.loads(file.readline())
+            self.assertEqual(span["name"], "exported")
+        self.assertIsNone(
+            tracing._exporter(SimpleNamespace(config={})),  # pylint: disable=protected-access
+        )
@@ -0,0 +1,79 @@
+"""
+Test cases for the gunicorn Worker Hooks
+
+"""
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+from service import app
+from service.models import db
+from service.common import worker_hooks
+
+
+######################################################################
+#  W O R K E R   H O O K S   T E S T   C A S E S
+######################################################################
+class TestWorkerHooks(unittest.TestCase):
+    """Test Cases for the fork hooks"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """This runs before each test"""
+        self.engine = MagicMock()
+        self.replica = MagicMock()
+        self.pool = MagicMock(engines=[self.replica])
+        self.shard = MagicMock()
+        self.shards = MagicMock(engines=[self.shard])
+
+    def _patch_engines(self):
+        """Replaces the primary, replica and shard engines with mocks"""
+        engines = patch.object(type(db), "engines", new={None: self.engine})
+        pool = patch.object(worker_hooks.read_replicas, "get_pool", return_value=self.pool)
+        shards = patch.object(worker_hooks.sharding, "get_shards", return_value=self.shards)
+        return engines, pool, shards
+
+    @patch("service.common.worker_hooks.gc")
+    def test_before_fork(self, gc_mock):
+        """It should close every pool and freeze the heap before forking"""
+        engines, pool, shards = self._patch_engines()
+        with engines, pool, shards:
+            worker_hooks.before_fork()
+        self.engine.dispose.assert_called_once_with()
+        self.replica.dispose.assert_called_once_with()
+        self.shard.dispose.assert_called_once_with()
+        gc_mock.freeze.assert_called_once()
+
+    def test_after_fork(self):
+        """It should give the worker new pools and shard threads without closing inherited connections"""
+        engines, pool, shards = self._patch_engines()
+        with engines, pool, shards:
+            worker_hooks.after_fork()
+        self.engine.dispose.assert_called_once_with(close=False)
+        self.replica.dispose.assert_called_once_with(close=False)
+        self.shard.dispose.assert_called_once_with(close=False)
+        self.shards.restart.assert_called_once_with()
+
+    @patch("service.common.worker_hooks._preloaded_app", return_value=None)
+    @patch("service.common.worker_hooks.gc")
+    def test_hooks_without_preload(self, gc_mock, _app_mock):
+        """It should do nothing when the app was not imported before the fork"""
+        worker_hooks.before_fork()
+        worker_hooks.after_fork()
+        gc_mock.freeze.assert_not_called()
+
+    def test_preloaded_app(self):
+        """It should find the application imported in this process"""
+        self.assertIs(worker_hooks._preloaded_app(), app)  # pylint: disable=protected-access
+
+    @patch("service.import_jobs.stop")
+    @patch("service.write_behind.stop")
+    def test_before_exit(self, stop_mock, import_stop_mock):
+        """It should write the buffered updates and stop the imports before the worker exits"""
+        worker_hooks.before_exit()
+        stop_mock.assert_called_once_with()
+        import_stop_mock.assert_called_once_with()
@@ -0,0 +1,198 @@
+"""
+Test cases for Write-Behind Updates
+
+"""
+import threading
+import time
+from unittest.mock import patch
+from sqlalchemy.exc import OperationalError
+from service import app, write_behind
+from service.common import status
+from service.models import db, ChangeOperation, Product, ProductChange
+from tests.database import DatabaseTestCase
+from tests.factories import ProductFactory
+
+BASE_URL = "/products"
+ASYNC = {"Prefer": "respond-async"}
+
+
+class WriteBehindTestCase(DatabaseTestCase):
+    """Turns write-behind on for each test"""
+
+    delay = 3600.0
+    max_pending = 1000
+
+    def setUp(self):
+        """Starts a fresh buffer"""
+        super().setUp()
+        app.config["WRITE_BEHIND_SECONDS"] = self.delay
+        app.config["WRITE_BEHIND_MAX_PENDING"] = self.max_pending
+        self.client = app.test_client()
+        self.product = ProductFactory(id=None, available=True, price=10)
+        self.product.create()
+        self.url = f"{BASE_URL}/{self.product.id}"
+
+    def tearDown(self):
+        """Stops the buffer"""
+        write_behind.stop()
+        app.config["WRITE_BEHIND_SECONDS"] = 0
+        super().tearDown()
+
+    def _stored(self):
+        """Returns the Product as it is in the database"""
+        db.session.expire_all()
+        return db.session.get(Product, self.product.id)
+
+
+######################################################################
+#  W R I T E   B E H I N D   T E S T   C A S E S
+######################################################################
+class TestWriteBehind(WriteBehindTestCase):
+    """Test Cases for buffered and coalesced updates"""
+
+    def test_coalesce(self):
+        """It should buffer updates of a Product and write them as one change"""
+        seq = ProductChange.last_seq()
+        response = self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.headers["Preference-Applied"], "respond-async")
+        self.assertFalse(response.get_json()["available"])
+        response = self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        self.assertTrue(response.get_json()["available"])
+        response = self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        self.assertFalse(response.get_json()["available"])
+
+        data = {**self.product.serialize(), "price": 12.5}
+        response = self.client.put(self.url, json=data, headers=ASYNC)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.get_json()["price"], 12.5)
+        self.assertTrue(response.get_json()["available"])  # the PUT sets it too
+        self.assertEqual(self.client.get(self.url).get_json()["price"], 12.5)
+        self.assertTrue(self._stored().available)
+        self.assertEqual(ProductChange.last_seq(), seq)
+
+        self.assertEqual(write_behind.get_buffer(app).flush(), 1)
+        stored = self._stored()
+        self.assertEqual((stored.available, float(stored.price)), (True, 12.5))
+        changes = ProductChange.since(seq, 10)
+        self.assertEqual([change.operation for change in changes], [ChangeOperation.UPDATE])
+
+    def test_direct_write_goes_after_pending(self):
+        """It should write pending updates before a direct write of the Product"""
+        self.client.put(self.url, json={**self.product.serialize(), "price": 20}, headers=ASYNC)
+        response = self.client.put(f"{self.url}/change_availability")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stored = self._stored()
+        self.assertEqual((stored.available, float(stored.price)), (False, 20.0))
+        self.assertEqual(len(write_behind.get_buffer(app)), 0)
+
+    def test_concurrent_toggles(self):
+        """It should toggle from the values left by the toggle before"""
+        buffer = write_behind.get_buffer(app)
+
+        def toggle(pending):
+            available = pending.get("available", True)
+            time.sleep(0.001)  # lets the other threads try to read the same values
+            return {"available": not available}
+
+        threads = [threading.Thread(target=buffer.update, args=(self.product.id, toggle)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(buffer.pending(self.product.id), {"available": False})
+
+    def test_patch(self):
+        """It should buffer the fields of a PATCH on top of earlier updates"""
+        self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        response = self.client.patch(self.url, json={"price": 15}, headers=ASYNC)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.get_json()["price"], response.get_json()["available"]), (15.0, False))
+        self.assertEqual(write_behind.get_buffer(app).flush(), 1)
+        stored = self._stored()
+        self.assertEqual((stored.available, float(stored.price), stored.name), (False, 15.0, self.product.name))
+
+    def test_poison_update(self):
+        """It should write the good Products of a failed batch and drop a bad one after MAX_ATTEMPTS"""
+        other = ProductFactory(id=None, available=True)
+        other.create()
+        buffer = write_behind.get_buffer(app)
+        buffer.put(self.product.id, {"name": None})  # breaks NOT NULL
+        buffer.put(other.id, {"available": False})
+        self.assertEqual(buffer.flush(), 1)
+        self.assertFalse(db.session.get(Product, other.id).available)
+        for _ in range(write_behind.MAX_ATTEMPTS - 1):
+            self.assertEqual(len(buffer), 1)
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(self._stored().name, self.product.name)
+
+    def test_poison_update_replaced(self):
+        """It should drop a pending update that fails before a direct write"""
+        write_behind.get_buffer(app).put(self.product.id, {"name": None})
+        response = self.client.put(f"{self.url}/change_availability")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(self._stored().available)
+        self.assertEqual(len(write_behind.get_buffer(app)), 0)
+
+    def test_database_down(self):
+        """It should keep every pending update while the database is unavailable"""
+        buffer = write_behind.get_buffer(app)
+        buffer.put(self.product.id, {"available": False})
+        error = OperationalError("SELECT", {}, Exception("connection refused"))
+        for _ in range(write_behind.MAX_ATTEMPTS + 1):
+            with patch.object(buffer, "_write", side_effect=error):
+                self.assertRaises(OperationalError, buffer.flush)
+        self.assertEqual(buffer.pending(self.product.id), {"available": False})
+        self.assertEqual(buffer.flush(), 1)
+
+    def test_invalid_and_missing(self):
+        """It should validate buffered updates right away"""
+        response = self.client.put(self.url, json={"name": "x"}, headers=ASYNC)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(f"{BASE_URL}/0/change_availability", headers=ASYNC)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(len(write_behind.get_buffer(app)), 0)
+
+    def test_off(self):
+        """It should write directly when write-behind is off"""
+        app.config["WRITE_BEHIND_SECONDS"] = 0
+        response = self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(self._stored().available)
+
+
+class TestWriteBehindThread(WriteBehindTestCase):
+    """Test Cases for the thread that writes the buffer"""
+
+    transactional = False  # the thread commits on its own connection
+    delay = 0.05
+    max_pending = 2
+
+    def _wait_for(self, condition):
+        """Waits up to 5 seconds for the buffer to be written"""
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_flush_when_due(self):
+        """It should write the buffer once the oldest update is due"""
+        self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        self._wait_for(lambda: not self._stored().available)
+
+    def test_flush_when_full(self):
+        """It should write the buffer once max_pending Products are pending"""
+        app.config["WRITE_BEHIND_SECONDS"] = 3600
+        self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        write_behind.get_buffer(app).put(0, {"available": False})  # deleted meanwhile, dropped
+        self._wait_for(lambda: not self._stored().available)
+
+    def test_flush_on_stop(self):
+        """It should write what is pending when stopped"""
+        app.config["WRITE_BEHIND_SECONDS"] = 3600
+        self.client.put(f"{self.url}/change_availability", headers=ASYNC)
+        buffer = write_behind.get_buffer(app)
+        write_behind.stop()
+        self.assertFalse(self._stored().available)
+        self.assertEqual(len(buffer), 0)